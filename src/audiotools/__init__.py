@@ -771,6 +771,113 @@ def threaded_transfer_framelist_data(pcmreader, to_function,
         to_function(s)
         s = data_queue.get()
 
+#takes a PCMReader, a list of stage callables and a sink callable
+#runs pcmreader and each stage in its own thread,
+#connected by queues holding no more than "queue_depth" FrameLists
+#so that each may read ahead of the ones after it,
+#but never by more than queue_depth FrameLists
+#
+#each stage takes a FrameList and returns a FrameList
+#of the same format
+#the sink takes a PCMReader-compatible object, which returns
+#the output of the final stage, and its result is returned by pipeline()
+#
+#an exception raised by pcmreader or a stage is re-raised
+#by the sink's reader, and all threads are finished on return
+#pcmreader is not closed
+def pipeline(pcmreader, stages, sink, queue_depth=10):
+    import threading,Queue
+
+    stopped = threading.Event()
+    errors = []
+
+    #waits on a full queue only as long as the pipeline is running
+    def put(queue, item):
+        while (not stopped.is_set()):
+            try:
+                queue.put(item,True,0.1)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def read_data(output):
+        try:
+            s = pcmreader.read(BUFFER_SIZE)
+            while (len(s) > 0):
+                if (not put(output,s)):
+                    return
+                s = pcmreader.read(BUFFER_SIZE)
+        except:
+            errors.append(sys.exc_info())
+        put(output,None)
+
+    def run_stage(stage, input, output):
+        s = input.get()
+        while (s is not None):
+            try:
+                s = stage(s)
+            except:
+                errors.append(sys.exc_info())
+                break
+            if (not put(output,s)):
+                return
+            s = input.get()
+        put(output,None)
+
+    queues = [Queue.Queue(queue_depth) for i in xrange(len(stages) + 1)]
+    threads = [threading.Thread(target=read_data,args=(queues[0],))]
+    for (i,stage) in enumerate(stages):
+        threads.append(threading.Thread(target=run_stage,
+                                        args=(stage,queues[i],queues[i + 1])))
+
+    for thread in threads:
+        thread.setDaemon(True)
+        thread.start()
+    try:
+        return sink(__pipeline_reader__(pcmreader,queues[-1],errors))
+    finally:
+        stopped.set()
+        #unblock any stage still waiting on its input
+        for queue in queues:
+            try:
+                queue.put_nowait(None)
+            except Queue.Full:
+                pass
+        for thread in threads:
+            thread.join()
+
+#the PCMReader-compatible end of a pipeline()
+#which returns FrameLists as they come off "queue"
+class __pipeline_reader__:
+    def __init__(self, pcmreader, queue, errors):
+        self.sample_rate = pcmreader.sample_rate
+        self.channels = pcmreader.channels
+        self.channel_mask = pcmreader.channel_mask
+        self.bits_per_sample = pcmreader.bits_per_sample
+        self.queue = queue
+        self.errors = errors
+        self.finished = False
+
+    def read(self, bytes):
+        if (not self.finished):
+            s = self.queue.get()
+            if (s is not None):
+                return s
+            self.finished = True
+
+        if (len(self.errors) > 0):
+            (exc_type,exc_value,exc_traceback) = self.errors[0]
+            raise exc_type,exc_value,exc_traceback
+        return pcm.FrameList("",
+                             self.channels,
+                             self.bits_per_sample,
+                             False,
+                             True)
+
+    def close(self):
+        pass
+
 #takes a wave-compatible object with a readframes() method
 #maps it to something PCMReader compatible
 class FrameReader(PCMReader):
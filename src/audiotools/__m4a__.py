@@ -146,6 +146,24 @@ def __parse_qt_atoms__(stream, qt_class=__Qt_Atom__, base_offset=0):
 
         h = stream.read(8)
 
+#takes a seekable stream object
+#iterates over its top-level atoms without reading their contents
+#and yields a series of (type,offset,size) tuples
+#where offset and size include the 8 byte atom header
+def __parse_qt_atom_headers__(stream):
+    stream.seek(0,2)
+    stream_size = stream.tell()
+    offset = 0
+    while (offset + 8 <= stream_size):
+        stream.seek(offset,0)
+        (header_type,header_size) = __Qt_Atom__.parse(stream.read(8))
+        if (header_size == 0):
+            header_size = stream_size - offset
+        elif (header_size < 8):
+            break
+        yield (header_type,offset,header_size)
+        offset += header_size
+
 def __build_qt_atom__(atom_type, atom_data):
     con = construct.Container()
     con.type = atom_type
@@ -339,7 +357,10 @@ class M4AAudio_faac(AudioFile):
         #first, attempt to replace the meta atom by resizing free
 
         #check to ensure our file is laid out correctly for that purpose
-        if (self.qt_stream.keys() == ['ftyp','moov','free','mdat']):
+        #(without reading mdat into memory)
+        if ([header[0] for header in
+             __parse_qt_atom_headers__(self.qt_stream.stream)] ==
+            ['ftyp','moov','free','mdat']):
             old_pre_mdat_size = sum([len(self.qt_stream[atom].data) + 8
                                      for atom in 'ftyp','moov','free'])
 
@@ -374,35 +395,92 @@ class M4AAudio_faac(AudioFile):
     #this updates our old 'meta' atom with a new 'meta' atom
     #where meta_atom is a __Qt_Atom__ object
     def __set_meta_atom__(self, meta_atom):
-        #this is a two-pass operation
-        #first we replace the contents of the moov->udta->meta atom
-        #with our new 'meta' atom
-        #this may move the 'mdat' atom, so we must go back
-        #and update the contents of
-        #moov->trak->mdia->minf->stbl->stco
-        #with new offset information
-
-        stco = ATOM_STCO.parse(
-           self.qt_stream['moov']['trak']['mdia']['minf']['stbl']['stco'].data)
-
-        mdat_offset = stco.offset[0] - self.qt_stream['mdat'].offset
-
-        new_file = __Qt_Atom_Stream__(cStringIO.StringIO(
-                __replace_qt_atom__(self.qt_stream,meta_atom)))
+        #the file is rewritten one top-level atom at a time
+        #to a temporary file alongside the original
+        #which is then moved over it
+        #
+        #all atoms but 'mdat' are small enough to be rebuilt in memory
+        #with our new 'meta' atom in place of the old one
+        #while 'mdat' is copied across in fixed-size blocks
+        #since it may be as large as the whole file
+        #
+        #the new file keeps the original's permission bits,
+        #but since it is a different file, it won't keep
+        #the original's owner, ACLs or any other hard links to it
+        import tempfile
+        import shutil
 
-        mdat_offset = new_file['mdat'].offset + mdat_offset
+        f = self.qt_stream.stream
 
-        stco.offset = [x - stco.offset[0] + mdat_offset
-                       for x in stco.offset]
+        atoms = []
+        mdat_offsets = []
+        new_offset = 0
+        for (atom_type,offset,size) in __parse_qt_atom_headers__(f):
+            if (atom_type == 'mdat'):
+                atoms.append((offset,size))
+                mdat_offsets.append((offset,new_offset))
+            else:
+                f.seek(offset + 8,0)
+                atom = __replace_qt_atom__(
+                    __Qt_Atom__(atom_type,f.read(size - 8),offset),
+                    meta_atom)
+                atoms.append(atom)
+                size = len(atom)
+            new_offset += size
+
+        #replacing the 'meta' atom may move the 'mdat' atom,
+        #so we must update the contents of
+        #moov->trak->mdia->minf->stbl->stco
+        #with new offset information
+        if (len(mdat_offsets) > 0):
+            (old_mdat_offset,new_mdat_offset) = mdat_offsets[0]
+            for (i,atom) in enumerate(atoms):
+                if ((not isinstance(atom,str)) or (atom[4:8] != 'moov')):
+                    continue
+                moov = __Qt_Atom__('moov',atom[8:],0)
+                stco = ATOM_STCO.parse(
+                    moov['trak']['mdia']['minf']['stbl']['stco'].data)
+                stco.offset = [x - old_mdat_offset + new_mdat_offset
+                               for x in stco.offset]
+                atoms[i] = __replace_qt_atom__(moov,
+                                               __Qt_Atom__(
+                        'stco',
+                        ATOM_STCO.build(stco),
+                        0))
+
+        (fd,temp_filename) = tempfile.mkstemp(
+            suffix=".tmp",
+            prefix=".",
+            dir=os.path.dirname(os.path.abspath(self.filename)))
+        new_file = os.fdopen(fd,"wb")
+        try:
+            for atom in atoms:
+                if (isinstance(atom,str)):
+                    new_file.write(atom)
+                else:
+                    (offset,size) = atom
+                    f.seek(offset,0)
+                    while (size > 0):
+                        block = f.read(min(size,0x100000))
+                        if (len(block) == 0):
+                            break
+                        new_file.write(block)
+                        size -= len(block)
+            new_file.close()
+            f.close()
 
-        new_file = __replace_qt_atom__(new_file,
-                                       __Qt_Atom__('stco',
-                                                   ATOM_STCO.build(stco),
-                                                   0))
+            #mkstemp() creates files only their owner can read
+            shutil.copymode(self.filename,temp_filename)
 
-        f = file(self.filename,"wb")
-        f.write(new_file)
-        f.close()
+            #os.rename() won't replace an existing file on Windows
+            if (os.name == 'nt'):
+                os.unlink(self.filename)
+            os.rename(temp_filename,self.filename)
+        except:
+            new_file.close()
+            if (os.path.exists(temp_filename)):
+                os.unlink(temp_filename)
+            raise
 
         f = file(self.filename,"rb")
         self.qt_stream = __Qt_Atom_Stream__(f)
@@ -989,6 +1067,58 @@ class __counter__:
     def __int__(self):
         return self.val
 
+#the process's umask can only be read by setting a new one,
+#so it's read once at import rather than being briefly changed
+#while encoding threads may be creating files
+__UMASK__ = os.umask(0)
+os.umask(__UMASK__)
+
+#encodes chunks of PCM data for ALACAudio.from_pcm() in its own process
+#
+#each chunk's raw PCM bytes are received on connection
+#and its encoded frames are sent back as a
+#(frame_sample_sizes,frame_byte_sizes,frame_data) tuple,
+#or None if encoding fails, until an empty chunk is received
+def __encode_alac_chunks__(connection, sample_rate, channels, channel_mask,
+                           bits_per_sample, block_size, initial_history,
+                           history_multiplier, maximum_k):
+    from . import encoders
+    import tempfile
+
+    mdat_file = tempfile.TemporaryFile()
+    try:
+        while (True):
+            data = connection.recv_bytes()
+            if (len(data) == 0):
+                break
+            try:
+                mdat_file.seek(0,0)
+                mdat_file.truncate()
+                (sample_sizes,
+                 byte_sizes,
+                 file_offsets,
+                 mdat_size) = encoders.encode_alac(
+                    file=mdat_file,
+                    pcmreader=BufferedPCMReader(
+                        PCMReader(cStringIO.StringIO(data),
+                                  sample_rate,
+                                  channels,
+                                  channel_mask,
+                                  bits_per_sample)),
+                    block_size=block_size,
+                    initial_history=initial_history,
+                    history_multiplier=history_multiplier,
+                    maximum_k=maximum_k)
+                mdat_file.seek(file_offsets[0],0)
+                frame_data = mdat_file.read(sum(byte_sizes))
+            except:
+                connection.send(None)
+                break
+            connection.send((sample_sizes,byte_sizes,frame_data))
+    finally:
+        mdat_file.close()
+        connection.close()
+
 class ALACAudio(M4AAudio):
     SUFFIX = "m4a"
     NAME = "alac"
@@ -1061,6 +1191,10 @@ class ALACAudio(M4AAudio):
     HISTORY_MULTIPLIER = 40
     MAXIMUM_K = 14
 
+    #the number of blocks handed to each process at a time
+    #when encoding with more than one process
+    CHUNK_BLOCKS = 64
+
     def __init__(self, filename):
         self.filename = filename
         self.qt_stream = __Qt_Atom_Stream__(file(self.filename,"rb"))
@@ -1130,9 +1264,26 @@ class ALACAudio(M4AAudio):
             initial_history=alac.initial_history,
             maximum_k=alac.maximum_k)
 
+    #if total_pcm_frames is given, the size of the ftyp, moov and free atoms
+    #can be worked out in advance, so the mdat atom is encoded directly
+    #into its final position in the output file
+    #otherwise, mdat is encoded to a private temporary file
+    #and copied into place afterward
+    #
+    #if metadata is given, it is written into the moov atom
+    #as the file is built, rather than by a later set_metadata() call
+    #
+    #if processes is greater than 1, the PCM stream is split into
+    #block-aligned chunks which are encoded by that many processes at once
+    #
+    #the file is built under a temporary name in the same directory
+    #and only renamed to filename once it is complete,
+    #so an encode which is killed part way never leaves
+    #a truncated file behind at filename
     @classmethod
     def from_pcm(cls, filename, pcmreader, compression=None,
-                 block_size=4096):
+                 block_size=4096, total_pcm_frames=None, metadata=None,
+                 processes=1):
         if (pcmreader.bits_per_sample not in (16,24)):
             raise UnsupportedBitsPerSample()
         if (pcmreader.channels > 2):
@@ -1142,67 +1293,165 @@ class ALACAudio(M4AAudio):
         import time
         import tempfile
 
-        mdat_file = file(tempfile.gettempdir() + os.sep + 'temp', 'w+b')
+        create_date = long(time.time()) + 2082844800
+        ftyp = cls.__build_ftyp_atom__()
+        metadata = M4AMetaData.converted(metadata)
+
+        try:
+            (fd,temp_filename) = tempfile.mkstemp(
+                suffix=".tmp",
+                prefix=".",
+                dir=os.path.dirname(os.path.abspath(filename)))
+        except (IOError,OSError):
+            raise EncodingError(None)
+        f = os.fdopen(fd,'w+b')
+
+        try:
+            #mkstemp() creates files only their owner can read,
+            #so give ours the mode any newly created file would get
+            os.chmod(temp_filename,0666 & ~__UMASK__)
+
+            if (total_pcm_frames):
+                reserved_size = cls.__estimate_pre_mdat_size__(
+                    pcmreader,
+                    create_date,
+                    total_pcm_frames,
+                    block_size,
+                    metadata)
+                f.seek(reserved_size,0)
+                mdat_file = f
+            else:
+                f.close()
+                reserved_size = 0
+                mdat_file = tempfile.TemporaryFile()
+        except:
+            f.close()
+            os.unlink(temp_filename)
+            raise
 
         #perform encode_alac() on pcmreader to our output file
         #which returns a tuple of output values:
         #(framelist, - a list of (frame_samples,frame_size,frame_offset) tuples
         # various fields for the "alac" atom)
-        (frame_sample_sizes,
-         frame_byte_sizes,
-         frame_file_offsets,
-         mdat_size) = encoders.encode_alac(
-            file=mdat_file,
-            pcmreader=BufferedPCMReader(pcmreader),
-            block_size=block_size,
-            initial_history=cls.INITIAL_HISTORY,
-            history_multiplier=cls.HISTORY_MULTIPLIER,
-            maximum_k=cls.MAXIMUM_K)
+        try:
+            if ((processes > 1) and hasattr(os,'fork')):
+                (frame_sample_sizes,
+                 frame_byte_sizes,
+                 frame_file_offsets,
+                 mdat_size) = cls.__encode_mdat_chunks__(
+                    mdat_file,
+                    pcmreader,
+                    block_size,
+                    processes)
+            else:
+                (frame_sample_sizes,
+                 frame_byte_sizes,
+                 frame_file_offsets,
+                 mdat_size) = encoders.encode_alac(
+                    file=mdat_file,
+                    pcmreader=BufferedPCMReader(pcmreader),
+                    block_size=block_size,
+                    initial_history=cls.INITIAL_HISTORY,
+                    history_multiplier=cls.HISTORY_MULTIPLIER,
+                    maximum_k=cls.MAXIMUM_K)
+        except:
+            mdat_file.close()
+            os.unlink(temp_filename)
+            raise
 
-        #use the fields from encode_alac() to populate our ALAC atoms
-        create_date = long(time.time()) + 2082844800
-        total_pcm_frames = sum(frame_sample_sizes)
+        try:
+            cls.__build_file__(temp_filename, mdat_file, pcmreader,
+                               create_date, ftyp, metadata, reserved_size,
+                               frame_sample_sizes, frame_byte_sizes,
+                               frame_file_offsets, mdat_size)
+
+            #os.rename() won't replace an existing file on Windows
+            if ((os.name == 'nt') and os.path.exists(filename)):
+                os.unlink(filename)
+            os.rename(temp_filename,filename)
+        except:
+            if (os.path.exists(temp_filename)):
+                os.unlink(temp_filename)
+            raise
 
-        stts_frame_counts = {}
-        for sample_size in frame_sample_sizes:
-            stts_frame_counts.setdefault(sample_size,__counter__()).incr()
+        return cls(filename)
 
-        offsets = frame_file_offsets[:]
-        chunks = []
-        for frames in at_a_time(len(frame_file_offsets),5):
-            if (frames > 0):
-                chunks.append(offsets[0:frames])
-                offsets = offsets[frames:]
-        del(offsets)
+    #writes the ftyp, moov and free atoms in front of the mdat atom
+    #which from_pcm() has encoded to mdat_file,
+    #in place if reserved_size left enough room for them,
+    #otherwise by rebuilding filename from scratch
+    @classmethod
+    def __build_file__(cls, filename, mdat_file, pcmreader, create_date,
+                       ftyp, metadata, reserved_size, frame_sample_sizes,
+                       frame_byte_sizes, frame_file_offsets, mdat_size):
+        import tempfile
+
+        f = mdat_file
+
+        #offsets may be reported relative to the start of the file
+        #rather than to where encoding began,
+        #so rebase them on the first frame,
+        #which immediately follows the 8 byte mdat header
+        if (len(frame_file_offsets) > 0):
+            frame_file_offsets = [offset - frame_file_offsets[0] + 8
+                                  for offset in frame_file_offsets]
+
+        #use the fields from encode_alac() to populate our ALAC atoms
+        moov_size = len(cls.__build_frames_moov_atom__(pcmreader,
+                                                       create_date,
+                                                       mdat_size,
+                                                       frame_sample_sizes,
+                                                       frame_byte_sizes,
+                                                       frame_file_offsets,
+                                                       metadata))
 
         #add the size of ftyp + moov + free to our absolute file offsets
-        pre_mdat_size = (len(cls.__build_ftyp_atom__()) +
-                         len(cls.__build_moov_atom__(pcmreader,
-                                                     create_date,
-                                                     mdat_size,
-                                                     total_pcm_frames,
-                                                     frame_sample_sizes,
-                                                     stts_frame_counts,
-                                                     chunks,
-                                                     frame_byte_sizes)) +
-                         len(cls.__build_free_atom__(0x1000)))
-        chunks = [[chunk + pre_mdat_size for chunk in chunk_list]
-                  for chunk_list in chunks]
-
-        #then regenerate our live ftyp, moov and free atoms
-        #with actual data
-        ftyp = cls.__build_ftyp_atom__()
+        #using whatever room was reserved in front of mdat for free
+        #if it turned out to be large enough
+        if ((reserved_size > 0) and
+            (len(ftyp) + moov_size + 8 <= reserved_size)):
+            free_size = reserved_size - len(ftyp) - moov_size - 8
+        else:
+            free_size = 0x1000
+        pre_mdat_size = len(ftyp) + moov_size + 8 + free_size
 
-        moov = cls.__build_moov_atom__(pcmreader,
-                                       create_date,
-                                       mdat_size,
-                                       total_pcm_frames,
-                                       frame_sample_sizes,
-                                       stts_frame_counts,
-                                       chunks,
-                                       frame_byte_sizes)
+        #then regenerate our live moov and free atoms
+        #with actual data
+        moov = cls.__build_frames_moov_atom__(pcmreader,
+                                              create_date,
+                                              mdat_size,
+                                              frame_sample_sizes,
+                                              frame_byte_sizes,
+                                              [offset + pre_mdat_size
+                                               for offset in
+                                               frame_file_offsets],
+                                              metadata)
+
+        free = cls.__build_free_atom__(free_size)
+
+        if (pre_mdat_size == reserved_size):
+            #mdat is already in place, so make sure its header
+            #covers everything written behind the reserved space
+            #and fill in the space in front of it
+            f.seek(0,2)
+            mdat_atom_size = f.tell() - reserved_size
+            f.seek(reserved_size,0)
+            f.write(__Qt_Atom__.STRUCT.build(
+                    construct.Container(size=mdat_atom_size,type='mdat')))
+            f.seek(0,0)
+            f.write(ftyp)
+            f.write(moov)
+            f.write(free)
+            f.close()
+            return
 
-        free = cls.__build_free_atom__(0x1000)
+        if (reserved_size > 0):
+            #the estimate was too small, so move mdat out of the way
+            #and build the file the long way
+            mdat_file = tempfile.TemporaryFile()
+            f.seek(reserved_size,0)
+            transfer_data(f.read,mdat_file.write)
+            f.close()
 
         #build our complete output file
         try:
@@ -1218,7 +1467,165 @@ class ALACAudio(M4AAudio):
         f.close()
         mdat_file.close()
 
-        return cls(filename)
+    #ALAC frames are encoded independently of one another,
+    #so a stream split on block_size boundaries can be encoded
+    #a chunk at a time across several processes and the results
+    #joined back together into the same frames
+    #a single encode_alac() call would produce
+    #
+    #chunks are handed out to the processes in turn as they are read
+    #and their frames are written out in order as they come back,
+    #so no more than one chunk per process is held at once
+    #
+    #writes an mdat atom to mdat_file at its current position
+    #and returns the same tuple as encode_alac()
+    @classmethod
+    def __encode_mdat_chunks__(cls, mdat_file, pcmreader, block_size,
+                               processes):
+        from multiprocessing import Process,Pipe
+
+        chunk_size = (block_size * cls.CHUNK_BLOCKS *
+                      pcmreader.channels * pcmreader.bits_per_sample / 8)
+
+        frame_sample_sizes = []
+        frame_byte_sizes = []
+        frame_file_offsets = []
+
+        def write_chunk(connection):
+            try:
+                result = connection.recv()
+            except EOFError:
+                #an encoder which was killed will never report back
+                raise EncodingError(None)
+            if (result is None):
+                raise EncodingError(None)
+            (sample_sizes,byte_sizes,frame_data) = result
+            offset = mdat_file.tell()
+            for byte_size in byte_sizes:
+                frame_file_offsets.append(offset)
+                offset += byte_size
+            frame_sample_sizes.extend(sample_sizes)
+            frame_byte_sizes.extend(byte_sizes)
+            mdat_file.write(frame_data)
+
+        workers = []
+        try:
+            for i in xrange(processes):
+                (connection,child_connection) = Pipe()
+                process = Process(target=__encode_alac_chunks__,
+                                  args=(child_connection,
+                                        pcmreader.sample_rate,
+                                        pcmreader.channels,
+                                        pcmreader.channel_mask,
+                                        pcmreader.bits_per_sample,
+                                        block_size,
+                                        cls.INITIAL_HISTORY,
+                                        cls.HISTORY_MULTIPLIER,
+                                        cls.MAXIMUM_K))
+                process.daemon = True
+                process.start()
+                child_connection.close()
+                workers.append((process,connection))
+
+            mdat_start = mdat_file.tell()
+            mdat_file.write(chr(0) * 8)
+
+            #each encoder has at most one chunk outstanding,
+            #which is collected just before it is sent the next one
+            reader = BufferedPCMReader(pcmreader)
+            outstanding = []
+            chunk_index = 0
+            while (True):
+                framelist = reader.read(chunk_size)
+                if (framelist.frames == 0):
+                    break
+                (process,connection) = workers[chunk_index % processes]
+                if (len(outstanding) == processes):
+                    write_chunk(outstanding.pop(0))
+                connection.send_bytes(framelist.to_bytes(False,True))
+                outstanding.append(connection)
+                chunk_index += 1
+            while (len(outstanding) > 0):
+                write_chunk(outstanding.pop(0))
+
+            mdat_end = mdat_file.tell()
+            mdat_file.seek(mdat_start,0)
+            mdat_file.write(__Qt_Atom__.STRUCT.build(
+                    construct.Container(size=mdat_end - mdat_start,
+                                        type='mdat')))
+            mdat_file.seek(mdat_end,0)
+        finally:
+            for (process,connection) in workers:
+                try:
+                    connection.send_bytes('')
+                except IOError:
+                    pass
+                connection.close()
+                process.join(1)
+                if (process.is_alive()):
+                    process.terminate()
+                    process.join()
+
+        return (frame_sample_sizes,
+                frame_byte_sizes,
+                frame_file_offsets,
+                mdat_end - mdat_start)
+
+    #returns the size of the ftyp, moov and free atoms
+    #for a stream of "total_pcm_frames" PCM frames
+    #encoded in "block_size" frame blocks
+    @classmethod
+    def __estimate_pre_mdat_size__(cls, pcmreader, create_date,
+                                   total_pcm_frames, block_size,
+                                   metadata=None):
+        frame_sample_sizes = [block_size] * (total_pcm_frames / block_size)
+        if (total_pcm_frames % block_size):
+            frame_sample_sizes.append(total_pcm_frames % block_size)
+
+        return (len(cls.__build_ftyp_atom__()) +
+                len(cls.__build_frames_moov_atom__(
+                    pcmreader,
+                    create_date,
+                    0,
+                    frame_sample_sizes,
+                    [0] * len(frame_sample_sizes),
+                    [0] * len(frame_sample_sizes),
+                    metadata)) +
+                len(cls.__build_free_atom__(0x1000)))
+
+    #builds a moov atom from the per-frame values returned by encode_alac()
+    #where frame_file_offsets are absolute offsets in the output file
+    @classmethod
+    def __build_frames_moov_atom__(cls, pcmreader,
+                                   create_date,
+                                   mdat_size,
+                                   frame_sample_sizes,
+                                   frame_byte_sizes,
+                                   frame_file_offsets,
+                                   metadata=None):
+        total_pcm_frames = sum(frame_sample_sizes)
+
+        stts_frame_counts = {}
+        for sample_size in frame_sample_sizes:
+            stts_frame_counts.setdefault(sample_size,__counter__()).incr()
+
+        offsets = frame_file_offsets[:]
+        chunks = []
+        for frames in at_a_time(len(frame_file_offsets),5):
+            if (frames > 0):
+                chunks.append(offsets[0:frames])
+                offsets = offsets[frames:]
+        del(offsets)
+
+        return cls.__build_moov_atom__(pcmreader,
+                                       create_date,
+                                       mdat_size,
+                                       total_pcm_frames,
+                                       frame_sample_sizes,
+                                       stts_frame_counts,
+                                       chunks,
+                                       frame_byte_sizes,
+                                       metadata)
 
     def to_wave(self, wave_filename):
         WaveAudio.from_pcm(wave_filename,self.to_pcm())
@@ -1255,11 +1662,26 @@ class ALACAudio(M4AAudio):
                             frame_sample_sizes,
                             stts_frame_counts,
                             chunks,
-                            frame_byte_sizes):
+                            frame_byte_sizes,
+                            metadata=None):
         version = (chr(0) * 3) + chr(1) + (chr(0) * 4) + ("Python Audio Tools %s" % (VERSION))
 
         tool = construct.Struct('tool',construct.UBInt32('size'),construct.String('type',4),construct.Struct('data',construct.UBInt32('size'),construct.String('type',4),construct.String('data',lambda ctx: ctx["size"] - 8))).build(construct.Container(size=len(version) + 16,type=chr(0xa9) + 'too',data=construct.Container(size=len(version) + 8,type='data',data=version)))
 
+        #any metadata goes in the ilst atom alongside our tool atom,
+        #which takes precedence over one in the metadata itself
+        ilst = tool
+        if (metadata is not None):
+            ilst += ATOM_ILST.build(
+                [construct.Container(type=ilst_atom.type,
+                                     data=[construct.Container(
+                                type=sub_atom.type,
+                                data=sub_atom.data)
+                                           for sub_atom in ilst_atom.data])
+                 for values in metadata.values()
+                 for ilst_atom in values
+                 if (ilst_atom.type != chr(0xa9) + 'too')])
+
         return cls.ALAC_MOOV.build(
             construct.Container(
                 mvhd=construct.Container(version=0,
@@ -1420,7 +1842,7 @@ class ALACAudio(M4AAudio):
                                         component_name=""))),
                                construct.Container(
                                 type='ilst',
-                                data=tool),
+                                data=ilst),
                                construct.Container(
                                 type='free',
                                 data=chr(0) * 1024)]))))
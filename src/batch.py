@@ -0,0 +1,351 @@
+"""
+Import recordings without the GUI, using the same loading and converting
+code as the queue dialog.
+
+    python batch.py [options] DIR [DIR ...]
+
+Each DIR may be a recording, or a folder of recordings nested at any
+depth.  Recordings are converted to Apple Lossless and placed in the
+output folder, and a JSON report of every recording found and the time
+spent in each stage is written to standard output.  Progress messages
+are written to standard error.
+
+Copyright (C) 2010 Zachary Chavez
+BootTunes is licensed under the GPLv2.
+http://www.gnu.org/licenses/gpl-2.0.html
+"""
+import sys
+import os
+import time
+import json
+import optparse
+import audiotools
+from PyQt4.QtCore import *
+from dialogs.exceptions import QueueDialogError
+from dialogs.threads.queuedialog import LoadShowsThread, ConvertFilesThread
+from settings import getSettings, SettingsError
+from shows import getAlbumTitle, DirSnapshot
+import parsetxt
+
+class BatchImporter(QObject):
+    """
+    Stands in for QueueDialog as the parent of LoadShowsThread and
+    ConvertFilesThread, whose run() methods are called directly rather
+    than started as threads.
+
+    """
+    def __init__(self, verbose=True):
+        super(BatchImporter, self).__init__()
+        self.verbose = verbose
+        self.lock = QReadWriteLock()
+        self.validRecordings = []
+        self.failedTracks = []
+        self.antiCrashBin = []
+        self.report = []
+        self.timings = {}
+        self.tempDirNames = []
+
+    def addTimings(self, timings):
+        """
+        Add the seconds spent in each stage to the totals in self.timings.
+
+        @type timings: dict
+
+        """
+        for stage, seconds in timings.iteritems():
+            self.timings[stage] = self.timings.get(stage, 0) + seconds
+
+    def log(self, text):
+        """
+        @type text: unicode
+
+        """
+        if self.verbose:
+            sys.stderr.write(unicode(text).encode('utf-8') + '\n')
+
+    def logProgress(self, value, text):
+        """
+        Slot for the progress signals of the threads.
+
+        @type value: int
+
+        @type text: QString
+
+        """
+        self.log(unicode(text).replace('\n\n', ' - '))
+
+    recordingFilters = ['*.txt', '*.flac', '*.shn', '*.m4a']
+    """Files which only a recording's folder has"""
+
+    def loadDirs(self, dirs, force=False):
+        """
+        Load every recording found in dirs, searching the subfolders of
+        any folder which is not itself a recording.  A folder with a txt or
+        audio files of its own is taken to be a recording, and its error is
+        reported rather than its subfolders searched.  The temp directories
+        created for recordings which load are added to tempDirNames.
+
+        @type dirs: list
+        @param dirs: A list of unicode paths
+
+        @type force: bool
+        @param force: If True, recordings which have already been converted
+        will be converted again
+
+        """
+        # The GUI may be using temp directories which already exist
+        existingTempDirs = set(os.listdir(getSettings().settingsDir))
+        loader = LoadShowsThread(self.lock, self, dirs)
+        self.connect(
+            loader,
+            SIGNAL("progress(int, QString)"),
+            self.logProgress
+        )
+        pendingDirs = list(dirs)
+        while pendingDirs:
+            dir = os.path.abspath(pendingDirs.pop(0))
+            entry = {'dir': dir}
+            loader.basename = os.path.basename(dir.rstrip(os.sep))
+            loader.timings = {}
+            self.log('Loading %s' % loader.basename)
+            started = time.time()
+            try:
+                metadata = loader.getMetadataFromDir(dir)
+            except QueueDialogError as e:
+                subDirs = []
+                snapshot = DirSnapshot(dir)
+                if not snapshot.getFiles(self.recordingFilters):
+                    subDirs = [
+                        os.path.join(dir, subDir)
+                        for subDir in snapshot.getSubDirs()
+                    ]
+                if subDirs:
+                    pendingDirs[0:0] = subDirs
+                    continue
+                entry['status'] = 'error'
+                entry['message'] = unicode(e)
+                metadata = None
+            loader.timings['load'] = time.time() - started
+            entry['timings'] = loader.timings
+            self.addTimings(loader.timings)
+            self.report.append(entry)
+            if metadata is not None:
+                if metadata['hash'] not in existingTempDirs:
+                    self.tempDirNames.append(metadata['hash'])
+                self.addRecording(metadata, entry, force)
+
+    def addRecording(self, metadata, entry, force=False):
+        """
+        Check that a loaded recording is complete and readable, and if so
+        add it to validRecordings, as QueueDialog.addToQueue() and
+        QueueDialog.addToITunes() do.
+
+        @type metadata: dict
+
+        @type entry: dict
+        @param entry: The recording's entry in the report
+
+        @type force: bool
+
+        """
+        entry['tracks'] = len(metadata['tracklist'])
+        entry['md5Mismatches'] = [
+            unicode(filePath) for filePath in metadata['md5_mismatches']
+        ]
+
+        if getSettings().isCompleted(metadata['hash']):
+            if not force:
+                entry['status'] = 'skipped'
+                entry['message'] = 'Already converted'
+                return
+            getSettings().removeCompleted(metadata['hash'])
+
+        defaults = getSettings().getArtistDefaults(metadata['artist'])
+        if defaults:
+            metadata['defaults'] = defaults
+        artistName = metadata['defaults']['preferred_name'] \
+            if 'defaults' in metadata \
+            else metadata['artist']
+        albumTitle, isComplete = getAlbumTitle(metadata)
+        metadata['albumTitle'] = albumTitle
+        entry['artist'] = unicode(artistName or '')
+        entry['albumTitle'] = unicode(albumTitle)
+        if not artistName or not isComplete:
+            entry['status'] = 'invalid'
+            entry['message'] = 'Missing metadata'
+            return
+
+        pcmFrameCounts = []
+        for audioFile in metadata['audioFiles']:
+            try:
+                audiofileObj = audiotools.open(
+                    audioFile.encode(sys.getfilesystemencoding())
+                )
+            except (audiotools.UnsupportedFile, IOError,
+                    UnicodeDecodeError) as e:
+                entry['status'] = 'error'
+                entry['message'] = 'Could not open file %s: %s' % \
+                    (os.path.basename(audioFile), e)
+                return
+            if isinstance(audiofileObj, audiotools.ALACAudio):
+                pcmFrameCounts.append(None)
+            else:
+                pcmFrameCounts.append(audiofileObj.total_frames())
+
+        entry['status'] = 'pending'
+        self.validRecordings.append({
+            'metadata'      : metadata,
+            'pcmFrameCounts': pcmFrameCounts,
+            'entry'         : entry
+        })
+
+    def convert(self):
+        """
+        Convert every recording in validRecordings and record the results
+        in their report entries.
+
+        """
+        if not self.validRecordings:
+            return
+        converter = ConvertFilesThread(self.lock, self)
+        self.connect(
+            converter,
+            SIGNAL("progress(int, QString)"),
+            self.logProgress
+        )
+        started = time.time()
+        try:
+            converter.run()
+        except Exception as e:
+            for recording in self.validRecordings:
+                if recording['entry']['status'] == 'pending':
+                    recording['entry']['status'] = 'error'
+                    recording['entry']['message'] = unicode(e)
+        converter.timings['convert'] = time.time() - started
+        self.addTimings(converter.timings)
+
+        failedTracks = set(self.failedTracks)
+        for recording in self.validRecordings:
+            entry = recording['entry']
+            if entry['status'] != 'pending':
+                continue
+            entry['failedTracks'] = [
+                unicode(filePath)
+                for filePath in recording['metadata']['audioFiles']
+                if filePath in failedTracks
+            ]
+            if getSettings().isCompleted(recording['metadata']['hash']):
+                entry['status'] = 'failed' if entry['failedTracks'] \
+                    else 'converted'
+            else:
+                entry['status'] = 'error'
+
+def main(argv=None):
+    """
+    Run the batch importer.
+
+    @type argv: list
+    @param argv: The command line arguments, sys.argv by default
+
+    @rtype: int
+    @return: The exit status: 0 if every recording found was converted
+    or skipped, 1 otherwise, 2 for usage errors
+
+    """
+    if argv is None:
+        argv = sys.argv
+    parser = optparse.OptionParser(
+        usage='%prog [options] DIR [DIR ...]',
+        description='Convert the recordings in each DIR to Apple Lossless '
+            'and write a JSON report to standard output.'
+    )
+    parser.add_option(
+        '-j', '--jobs', type='int', dest='jobs',
+        help='number of tracks to convert at once (0 for one per CPU)'
+    )
+    parser.add_option(
+        '-o', '--out', dest='out',
+        help='folder to place converted recordings in '
+            '(the "Automatically Add to iTunes" folder by default)'
+    )
+    parser.add_option(
+        '-s', '--settings', dest='settings',
+        help='JSON file of settings to use in place of the saved ones'
+    )
+    parser.add_option(
+        '-f', '--force', action='store_true', dest='force', default=False,
+        help='convert recordings which have already been converted'
+    )
+    parser.add_option(
+        '-q', '--quiet', action='store_false', dest='verbose', default=True,
+        help='do not write progress messages to standard error'
+    )
+    options, dirs = parser.parse_args(argv[1:])
+    if not dirs:
+        parser.error('no directories given')
+
+    app = QCoreApplication(argv)
+    started = time.time()
+
+    # Overridden settings are only used for this run, and are put back
+    # before the settings are saved.
+    settings = getSettings()
+    savedSettings = dict(settings.settings)
+    overrides = {}
+    if options.settings:
+        try:
+            settingsFile = open(options.settings, 'r')
+            overrides.update(json.load(settingsFile))
+            settingsFile.close()
+        except (IOError, ValueError) as e:
+            parser.error('could not read settings file: %s' % e)
+    if options.jobs is not None:
+        overrides['conversionJobs'] = options.jobs
+    if options.out:
+        if not os.path.isdir(options.out):
+            parser.error('output folder does not exist: %s' % options.out)
+        overrides['addToITunesPath'] = os.path.abspath(options.out)
+    for key, value in overrides.iteritems():
+        settings[key] = value
+    try:
+        settings.initAddToITunesPath()
+    except SettingsError as e:
+        parser.error(str(e) + ', use --out')
+    # Use the cities list last downloaded by the GUI, without downloading
+    parsetxt.setCacheDir(settings.settingsDir)
+    parsetxt.setParseCacheDir(settings.parseCacheDir)
+
+    importer = BatchImporter(options.verbose)
+    try:
+        importer.loadDirs(
+            [dir.decode(sys.getfilesystemencoding()) for dir in dirs],
+            options.force
+        )
+        importer.convert()
+    finally:
+        for key in overrides:
+            if key in savedSettings:
+                settings[key] = savedSettings[key]
+            elif key in settings.settings:
+                del settings.settings[key]
+        settings.pickleAndStore()
+        # Leave the temp directories of any GUI session sharing the
+        # settings directory alone
+        settings.clearTempFiles(importer.tempDirNames)
+        parsetxt.pruneParseCache()
+
+    importer.timings['total'] = time.time() - started
+    json.dump(
+        {'recordings': importer.report, 'timings': importer.timings},
+        sys.stdout,
+        indent=2
+    )
+    sys.stdout.write('\n')
+
+    for entry in importer.report:
+        if entry['status'] not in ('converted', 'skipped'):
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -15,6 +15,7 @@ from dialogs.queuedialog import QueueDialog
 from dialogs.messagebox import MessageBox
 from dialogs.newversion import NewVersionDialog
 from settings import getSettings, SettingsError
+import parsetxt
 import data
 
 __version__ = "0.3.0"
@@ -179,6 +180,11 @@ app.setApplicationName('BootTunes')
 errorLogFilePath = getSettings().settingsDir + os.sep + 'errorlog.log'
 sys.stderr = open(errorLogFilePath, 'w')
 
+parsetxt.setCacheDir(getSettings().settingsDir)
+parsetxt.setParseCacheDir(getSettings().parseCacheDir)
+if getSettings()['updateCities']:
+    parsetxt.refreshCitiesInBackground()
+
 window = MainWindow()
 window.show()
 
@@ -211,4 +217,5 @@ if (getSettings()['sendErrorReports'] and os.path.getsize(errorLogFilePath)):
         pass
 
 getSettings().pickleAndStore()
-getSettings().clearTempFiles()
\ No newline at end of file
+getSettings().clearTempFiles()
+parsetxt.pruneParseCache()
\ No newline at end of file
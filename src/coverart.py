@@ -8,11 +8,12 @@ from visicon import Visicon
 from PyQt4.QtCore import *
 from PyQt4.QtGui import *
 from settings import getSettings
+from shows import DirSnapshot
 
 class CoverArtRetriever():
 
     @staticmethod
-    def getCoverImageChoices(metadata, no_pixmap=False):
+    def getCoverImageChoices(metadata, no_pixmap=False, snapshot=None):
         """
         Get the filenames of possible cover art found in the specified
         directory.  The default cover, as determined by settings, will appear
@@ -30,6 +31,9 @@ class CoverArtRetriever():
         @type no_pixmap: boolean
         @param no_pixmap: If True, will return a tuple of filenames only.
 
+        @type snapshot: shows.DirSnapshot
+        @param snapshot: A listing of the directory, to avoid listing it again
+
         @rtype:  tuple
         @return: A tuple
         """
@@ -37,15 +41,12 @@ class CoverArtRetriever():
         tempDir = metadata['tempDir']
         tempDirPath = tempDir.absolutePath()
 
-        dir.setFilter(QDir.Dirs | QDir.NoDotAndDotDot)
-        dir.setNameFilters(['*'])
-        subDirs = dir.entryList()
+        if snapshot is None:
+            snapshot = DirSnapshot(unicode(dir.absolutePath()))
 
         nameFilters = ['*.gif', '*.png', '*.jpg', '*.jpeg']
         tempDir.setNameFilters(nameFilters)
         tempDir.setFilter(QDir.Files)
-        dir.setNameFilters(nameFilters)
-        dir.setFilter(QDir.Files)
 
         # Create identicon and visicon
         hash = metadata['hash']
@@ -57,12 +58,10 @@ class CoverArtRetriever():
         visiconPath = unicode(tempDirPath + '/' + 'visicon.png')
         visiconImage.draw_image().save(visiconPath, 'PNG')
 
-        imageFiles = list(tempDir.entryList()) + list(dir.entryList())
-        for subDir in subDirs:
-            subDirQDir = QDir(dir.absolutePath() + '/' + subDir)
-            subDirQDir.setNameFilters(nameFilters)
-            subDirQDir.setFilter(QDir.Files)
-            for imageFile in list(subDirQDir.entryList()):
+        imageFiles = list(tempDir.entryList()) + \
+            snapshot.getFiles(nameFilters)
+        for subDir in snapshot.getSubDirs():
+            for imageFile in snapshot.getFiles(nameFilters, subDir):
                 imageFiles.append(subDir + '/' + imageFile)
 
         optionsList = [
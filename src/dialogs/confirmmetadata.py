@@ -181,15 +181,20 @@ class ConfirmMetadataDialog(QDialog, Ui_ConfirmMetadataDialog):
     def refreshTracks(self):
         """
         Reload the tracklist from the current contents of the "comments" field.
+        The parser is kept, so the tracklist is only found again if the
+        comments have changed since the last time.
 
         """
         import parsetxt
-        tracklist = parsetxt.TxtParser(
-            unicode(self.commentsTextEdit.toPlainText())
-        )._findTracklist()
+        comments = unicode(self.commentsTextEdit.toPlainText())
+        if hasattr(self, 'txtParser'):
+            self.txtParser.setField('txt', comments)
+        else:
+            self.txtParser = parsetxt.TxtParser(comments)
+        tracklist = self.txtParser._findTracklist()
 
-        if not tracklist:
-            tracklist = []
+        # Copied since blank tracks are added to it below
+        tracklist = list(tracklist) if tracklist else []
 
         for i in range(0, self.tracklistTableWidget.rowCount()):            
             if i < len(tracklist):
@@ -5,10 +5,7 @@ Copyright (C) 2010 Zachary Chavez
 BootTunes is licensed under the GPLv2.
 http://www.gnu.org/licenses/gpl-2.0.html
 """
-import re
 import os
-import codecs
-import chardet
 import platform
 import sys
 import audiotools
@@ -16,6 +13,7 @@ from PyQt4.QtCore import *
 from PyQt4.QtGui import *
 from ui.ui_queuedialog import Ui_QueueDialog
 from settings import getSettings
+from shows import getAlbumTitle
 from dialogs.settingsdialog import SettingsDialog
 from dialogs.confirmmetadata import ConfirmMetadataDialog
 from dialogs.messagebox import MessageBox
@@ -74,6 +72,21 @@ class QueueDialog(QDialog, Ui_QueueDialog):
         )
         setattr(self.queueListWidget.__class__, 'dropEvent', dropEvent)
 
+        self.autoConvertPaths = []
+        """Paths of recordings found by WatchFoldersThread which are
+           waiting to be converted"""
+        self.autoConverting = False
+        """True while converting recordings found by WatchFoldersThread,
+           which the user didn't ask for, so errors aren't shown in message
+           boxes"""
+        self.watchFoldersThread = None
+        self.connect(
+            QCoreApplication.instance(),
+            SIGNAL("aboutToQuit()"),
+            self.stopWatching
+        )
+        self.startWatching()
+
     def convertAgainPrompt(self, name):
         """
         Display a message saying that the recording has already been
@@ -124,7 +137,18 @@ class QueueDialog(QDialog, Ui_QueueDialog):
         and dropped
 
         """
-        self.progressDialog = progressDialog = QProgressDialog(
+        if hasattr(self, 'loadShowsThread') \
+                and self.loadShowsThread.isRunning():
+            MessageBox.information(
+                self,
+                'Loading',
+                'Please wait until the shows already being loaded are done.'
+            )
+            return
+
+        # Kept apart from self.progressDialog, since recordings can be
+        # converted while others are still loading.
+        self.loadingDialog = loadingDialog = QProgressDialog(
             "Loading",
             "Cancel",
             1,
@@ -132,25 +156,38 @@ class QueueDialog(QDialog, Ui_QueueDialog):
             self
         )
         self.connect(
-            self.progressDialog,
+            self.loadingDialog,
             SIGNAL("canceled()"),
             self.cancelLoading
         )
-        progressDialog.setWindowTitle('BootTunes')
-        progressDialog.setWindowFlags(Qt.Window | Qt.WindowCloseButtonHint)
-        progressDialog.setWindowModality(Qt.WindowModal)
-        progressDialog.setMinimumSize(QSize(300, 150))
-        self.progressBarLabel = progressBarLabel = QLabel()
-        progressBarLabel.setText('Loading Shows')
-        progressDialog.setLabel(progressBarLabel)
-        progressDialog.setValue(1)
-
-        self.lock = QReadWriteLock()
-        self.loadShowsThread = LoadShowsThread(self.lock, self, dirOrDirs)
+        loadingDialog.setWindowTitle('BootTunes')
+        loadingDialog.setWindowFlags(Qt.Window | Qt.WindowCloseButtonHint)
+        loadingDialog.setWindowModality(Qt.WindowModal)
+        loadingDialog.setMinimumSize(QSize(300, 150))
+        self.loadingLabel = loadingLabel = QLabel()
+        loadingLabel.setText('Loading Shows')
+        loadingDialog.setLabel(loadingLabel)
+        loadingDialog.setValue(1)
+
+        self.loadShowsThread = LoadShowsThread(
+            QReadWriteLock(),
+            self,
+            dirOrDirs
+        )
         self.connect(
             self.loadShowsThread,
             SIGNAL("progress(int, QString)"),
-            self.updateProgress
+            self.updateLoadingProgress
+        )
+        self.connect(
+            self.loadShowsThread,
+            SIGNAL("maximum(int)"),
+            self.setLoadingMaximum
+        )
+        self.connect(
+            self.loadShowsThread,
+            SIGNAL("loaded(PyQt_PyObject)"),
+            self.showLoaded
         )
         self.connect(
             self.loadShowsThread,
@@ -160,9 +197,9 @@ class QueueDialog(QDialog, Ui_QueueDialog):
         self.connect(
             self.loadShowsThread,
             SIGNAL("error(QString)"),
-            self.errorInThread
+            self.errorInLoading
         )
-        self.loadShowsThread.start()        
+        self.loadShowsThread.start()
 
     def openConfirmMetadata(self, item):
         """
@@ -189,7 +226,8 @@ class QueueDialog(QDialog, Ui_QueueDialog):
         """
         Called when the LoadShowsThread has completed.
         If a single show is loaded, will bring up the confirm metadata
-        dialog.  If multiple shows loaded, will add them to the queue.
+        dialog.  Multiple shows will already have been added to the queue
+        by showLoaded().
 
         """
         # Single show
@@ -204,101 +242,117 @@ class QueueDialog(QDialog, Ui_QueueDialog):
                 else:
                     return
             ConfirmMetadataDialog(self.metadata, self).exec_()
-        # Multiple shows
-        elif hasattr(self, 'metadataList') and self.metadataList:
-            for metadata in self.metadataList:                
-                isCompleted = getSettings().isCompleted(metadata['hash'])
-                if isCompleted:
-                    basename = os.path.basename(
-                        unicode(metadata['dir'].absolutePath())
-                    )
-                    if self.convertAgainPrompt(basename):
-                        getSettings().removeCompleted(metadata['hash'])
-                    else:
-                        continue
-                self.addToQueue(metadata)
 
-    def openFileOfUnknownEncoding(self, filePath):
+    def startWatching(self):
         """
-        Open a file whose encoding is unknown, assuming UTF-8 at first
-        and attempting to detect the encoding if that fails.  Return
-        the file handle.
+        Start watching the folders in the watchFolders setting for new
+        recordings, which are added to the queue as they arrive.
+
+        """
+        watchFolders = getSettings()['watchFolders']
+        if not watchFolders:
+            return
+        self.watchFoldersThread = WatchFoldersThread(
+            QReadWriteLock(),
+            self,
+            watchFolders
+        )
+        self.connect(
+            self.watchFoldersThread,
+            SIGNAL("loaded(PyQt_PyObject)"),
+            self.watchedShowLoaded
+        )
+        self.watchFoldersThread.start()
 
-        @type filePath: unicode
-        @param filePath: The path to the text file.
+    def stopWatching(self):
+        """
+        Stop WatchFoldersThread, if it is running, and wait for it to finish.
+        Called when the application quits.
 
-        @rtype: file
-        @return: The file handle.
+        """
+        if self.watchFoldersThread is None:
+            return
+        self.watchFoldersThread.stop()
+        self.watchFoldersThread.wait()
+        self.watchFoldersThread = None
 
+    def restartWatching(self):
         """
-        # Open file with open, detect the encoding, close it and open
-        # again with codec.open
-        fileHandle = open(filePath, 'r')
-        encoding = chardet.detect(fileHandle.read())['encoding']
-        fileHandle.close()
-        # Try UTF-8 first. If there's an error, try the chardet
-        # detected encoding. This seems to give the best results.
-        fileHandle = codecs.open(filePath, 'r', 'utf-8')
-        try:
-            fileHandle.read()
-            fileHandle.seek(0)
-        except UnicodeDecodeError:
-            fileHandle = codecs.open(filePath, 'r', encoding)
-        return fileHandle
+        Start watching again with the current settings.  Called by
+        SettingsDialog when the watch folders change.
 
-    def getFilePaths(self, qDir):
         """
-        Get a list of QStrings for every audio file in the specified folder.
-        If the audio files are split up between folders, e.g. CD1 and CD2,
-        get files from the subdirectories as well.
+        self.stopWatching()
+        self.startWatching()
 
-        @type qDir: QDir
+    def watchedShowLoaded(self, metadata):
+        """
+        Called by WatchFoldersThread for each new recording.  Adds it to the
+        queue unless it has already been converted, and if the
+        watchAutoConvert setting is on, converts it.  Only the new
+        recording is converted, not the rest of the queue.
 
-        """        
-        filePaths = []
-        for file in qDir.entryList():
-            filePaths.append(qDir.filePath(file))
-        
-        if len(filePaths) == 0:
-            validExtensions = qDir.nameFilters()
-            qDir.setNameFilters('*')
-            qDir.setFilter(QDir.Dirs | QDir.NoDotAndDotDot)
-            for subdirStr in qDir.entryList():
-                qSubdir = QDir(qDir.filePath(subdirStr))
-                qSubdir.setNameFilters(validExtensions)
-                for file in qSubdir.entryList():
-                    filePaths.append(
-                        qSubdir.filePath(file)
-                    )
-        return filePaths
+        @type metadata: dict
 
-    def getSortedFiles(self, filePaths):
         """
-        Sort files in the correct order.
+        if getSettings().isCompleted(metadata['hash']):
+            return
+        self.addToQueue(metadata)
+        path = metadata['dir'].absolutePath()
+        if not getSettings()['watchAutoConvert'] \
+                or not self.queueItemData[path]['valid']:
+            return
+        self.autoConvertPaths.append(path)
+        if not hasattr(self, 'processThread') \
+                or not self.processThread.isRunning():
+            self.convertWatchedShows()
 
-        If the single digits tracks are numbered like 1, 2, 3
-        instead of 01, 02, 03, make sure they are sorted correctly,
-        so that track 10 does not follow track 1, etc.
+    def convertWatchedShows(self):
+        """
+        Convert the recordings found by WatchFoldersThread which are waiting
+        to be, if they are still in the queue.
 
-        @type filesPaths: list
-        @param filesPaths: A list of QStrings
+        """
+        paths = [
+            path for path in self.autoConvertPaths
+            if path in self.queueItemData
+        ]
+        self.autoConvertPaths = []
+        if paths:
+            self.addToITunes(paths, True)
+
+    def showLoaded(self, metadata):
+        """
+        Called by LoadShowsThread for each show as it is loaded, when
+        loading multiple shows.  Adds the show to the queue.
 
-        @rtype:  list
-        @return: the sorted list
+        @type metadata: dict
 
         """
-        sortedFilePaths = []
-        sortDict = {} # Will be sorted by the keys
-        for index, file in enumerate(filePaths):
-            base = os.path.basename(unicode(file))
-            path = os.path.dirname(unicode(file))
-            if re.match('\d{1}\D', base):
-                sortDict[unicode(path + '/0' + base)] = file
+        isCompleted = getSettings().isCompleted(metadata['hash'])
+        if isCompleted:
+            basename = os.path.basename(
+                unicode(metadata['dir'].absolutePath())
+            )
+            if self.convertAgainPrompt(basename):
+                getSettings().removeCompleted(metadata['hash'])
             else:
-                sortDict[unicode(file)] = file        
-        for key in sorted(sortDict.iterkeys()):
-            sortedFilePaths.append(sortDict[key])
-        return sortedFilePaths
+                return
+        self.addToQueue(metadata)
+
+    def setLoadingMaximum(self, maximum):
+        """
+        Called by LoadShowsThread when it finds multiple shows to load.
+        The loading progress dialog stops being modal, so that the queue
+        can be used while the rest of the shows load.
+
+        @type maximum: int
+
+        """
+        self.loadingDialog.hide()
+        self.loadingDialog.setWindowModality(Qt.NonModal)
+        self.loadingDialog.setMaximum(maximum)
+        self.loadingDialog.show()
 
     def removeSelectedItem(self):
         """
@@ -365,39 +419,9 @@ class QueueDialog(QDialog, Ui_QueueDialog):
         }                
         listItem.setData(32, path)
         
-        # If title is set, use that, otherwise follow the albumTitleFormat
-        # in settings
-        if 'title' in metadata and metadata['title'] != '':
-            albumTitle = metadata['title']
-        else:
-            # If any parts of the title are blank, add a note and display
-            # the item in red
-            albumTitle = getSettings()['albumTitleFormat']
-            for placeHolder in ['artist', 'venue', 'location', 'date']:
-                match = re.search('\[' + placeHolder + '\]', albumTitle)
-                if not match:
-                    continue
-                if placeHolder == 'date' and metadata['date'] != None:
-                    replacement = metadata[placeHolder].strftime(
-                        getSettings()['dateFormat']
-                    )
-                else:
-                    placeHolder = "preferredArtist" \
-                        if placeHolder == 'artist' \
-                        else placeHolder
-                    replacement = metadata[placeHolder]
-
-                if replacement == '' or replacement == None:
-                    self.queueItemData[path]['valid'] = False
-                    albumTitle = albumTitle.replace(
-                        '[' + placeHolder + ']',
-                        '[missing ' + placeHolder + ']'
-                    )
-                else:
-                    albumTitle = albumTitle.replace(
-                        '[' + placeHolder + ']',
-                        replacement
-                    )
+        albumTitle, isComplete = getAlbumTitle(metadata)
+        if not isComplete:
+            self.queueItemData[path]['valid'] = False
 
         if not artistName:
             artistName = '[missing artist]'
@@ -423,19 +447,22 @@ class QueueDialog(QDialog, Ui_QueueDialog):
         listItem.setText(artistName + ' - ' + displayedTitle)        
         metadata['albumTitle'] = albumTitle
 
-    def addToITunes(self):
+    def addToITunes(self, paths=None, auto=False):
         """
         Begin the conversion process of all the valid items in the queue.
 
+        @type paths: list
+        @param paths: The paths of the items to convert, if not all of them
+
+        @type auto: bool
+        @param auto: True if the conversion wasn't asked for by the user,
+        in which case errors are written to the error log rather than shown
+
         """
+        self.autoConverting = auto
         self.validRecordings = []
         """A list containing the values from self.queueItemData, but only for
            recordings with all the required metadata"""
-        self.currentRecording = 0
-        """The index of self.validRecordings that is currently being converted
-           and copied to iTunes"""
-        self.currentTrack = 0
-        """The track from the current recording currently being processed"""
 
         if not hasattr(self, 'antiCrashBin'):
             self.antiCrashBin = []
@@ -454,6 +481,8 @@ class QueueDialog(QDialog, Ui_QueueDialog):
             for x in range(len(self.queueItemData))
         ]
         for dir, data in self.queueItemData.iteritems():
+            if paths is not None and dir not in paths:
+                continue
             if data['valid'] == True:
                 rowForItemInQueue = self.queueListWidget.row(data['item'])
                 self.validRecordings[rowForItemInQueue] = data.copy()
@@ -466,66 +495,48 @@ class QueueDialog(QDialog, Ui_QueueDialog):
         self.failedTracks = []
 
         if len(self.validRecordings) == 0:
-            MessageBox.warning(self, 'Notice', 'Nothing to add')
+            if not auto:
+                MessageBox.warning(self, 'Notice', 'Nothing to add')
             return
 
-        # Prepare a list of PcmReader objects
+        # Check that every file can be opened, reading only its header.
+        # The files are decoded by ConvertFilesThread as each track is
+        # converted.
         for validRecording in self.validRecordings:
-            validRecording['pcmReaders'] = []            
+            validRecording['pcmFrameCounts'] = []
             audioFiles = validRecording['metadata']['audioFiles']            
             for index, audioFile in enumerate(audioFiles):
                 try:
                     encoding = sys.getfilesystemencoding()
                     audiofileObj = audiotools.open(audioFile.encode(encoding))
                 except audiotools.UnsupportedFile:
-                    MessageBox.critical(
-                        self,
+                    self.showError(
                         'Error opening file',
                         '%s is an unsupported type' % \
                         os.path.basename(audioFile)
                     )
                     return
                 except IOError as e:
-                    MessageBox.critical(
-                        self,
+                    self.showError(
                         'Error opening file',
                         'Could not open file %s <br /><br /> %s ' % \
                         (os.path.basename(audioFile), e.args[1])
                     )
                     return
                 except UnicodeDecodeError as e:
-                    MessageBox.critical(
-                        self,
+                    self.showError(
                         'Error opening file',
                         'Unicode decode error <br /><br /> %s' % e.args[1]
                     )
                     return
 
-                # If ALAC already, set the reader to None.
+                # ALAC files are copied rather than decoded
                 if isinstance(audiofileObj, audiotools.ALACAudio):
-                    validRecording['pcmReaders'].append(None)
+                    validRecording['pcmFrameCounts'].append(None)
                 else:
-                    try:
-                        pcmReader = audiofileObj.to_pcm()
-                    except Exception as e:
-                        MessageBox.critical(
-                            self,
-                            'Error reading file',
-                            'Could not read file: %s <br /><br /> %s' % \
-                                (audioFile, str(e))
-                        )
-                        return
-                    
-                    if isinstance(pcmReader, audiotools.PCMReaderError):
-                        MessageBox.critical(
-                            self,
-                            'Error reading file',
-                            'Could not read file ' + os.path.basename(audioFile)
-                            + "<br /><br />" + pcmReader.error_message
-                        )
-                        return
-                    validRecording['pcmReaders'].append(pcmReader)
-                    self.antiCrashBin.append(pcmReader)
+                    validRecording['pcmFrameCounts'].append(
+                        audiofileObj.total_frames()
+                    )
 
         self.progressBarLabel = progressBarLabel = QLabel()
         self.progressDialog = progressDialog = QProgressDialog(
@@ -542,7 +553,11 @@ class QueueDialog(QDialog, Ui_QueueDialog):
         )
         progressDialog.setWindowTitle('BootTunes')
         progressDialog.setWindowFlags(Qt.Window | Qt.WindowCloseButtonHint)
-        progressDialog.setWindowModality(Qt.WindowModal)
+        # Don't take over the queue for a conversion the user didn't start
+        if auto:
+            progressDialog.setWindowModality(Qt.NonModal)
+        else:
+            progressDialog.setWindowModality(Qt.WindowModal)
         progressDialog.setLabel(progressBarLabel)
         progressBarLabel.setText(
             'Converting "%s"' % \
@@ -576,12 +591,52 @@ class QueueDialog(QDialog, Ui_QueueDialog):
         
         """
         self.progressDialog.cancel()        
+        self.showError('Error', 'Error encountered <br /><br />' + string)
+
+    def showError(self, title, text):
+        """
+        Show an error in a message box, or if the conversion was started
+        automatically, write it to the error log instead.
+
+        @type title: unicode
+
+        @type text: unicode
+
+        """
+        if self.autoConverting:
+            sys.stderr.write(
+                '%s: %s\n' % (
+                    title,
+                    unicode(text).replace('<br />', ' ').encode('utf-8')
+                )
+            )
+        else:
+            MessageBox.critical(self, title, text)
+
+    def errorInLoading(self, string):
+        """
+        Signaled if an exception is raised in LoadShowsThread.
+
+        """
+        self.loadingDialog.cancel()
         MessageBox.critical(
             self,
             'Error',
             'Error encountered <br /><br />' + string
         )
 
+    def updateLoadingProgress(self, value, text):
+        """
+        Updates the loading progress bar.  Slot for
+        LoadShowsThread.SIGNAL(progress(int, QString)).
+
+        """
+        if self.loadingDialog.wasCanceled():
+            return
+        if value <= self.loadingDialog.maximum():
+            self.loadingDialog.setValue(value)
+            self.loadingLabel.setText(text)
+
     def updateProgress(self, value, text):
         """
         Updates the progress bar.  Slot for
@@ -622,12 +677,17 @@ class QueueDialog(QDialog, Ui_QueueDialog):
                     '\n\nThe following tracks could not be converted:\n\n %s' %
                     '\n'.join(self.failedTracks)
                 )
-            MessageBox.information(
-                self,
-                'Complete',
-                message
-            )
+            # Tracks which failed are already in the error log
+            if not self.autoConverting:
+                MessageBox.information(
+                    self,
+                    'Complete',
+                    message
+                )
             self.removeCompletedRecordings()
+        # Recordings found by WatchFoldersThread during the conversion
+        if self.autoConvertPaths:
+            self.convertWatchedShows()
 
     def removeCompletedRecordings(self):
         """
@@ -661,8 +721,6 @@ class QueueDialog(QDialog, Ui_QueueDialog):
 
         """                
         self.loadShowsThread.stop()
-        if platform.system() != 'Darwin':
-            self.loadShowsThread.terminate()        
 
     def event(self, event):
         """
@@ -64,6 +64,14 @@ class SettingsDialog(QDialog, Ui_SettingsDialog):
 
         self.addToITunesPathTextEdit.setText(getSettings()['addToITunesPath'])
 
+        for watchFolder in getSettings()['watchFolders']:
+            self.watchFoldersListWidget.addItem(watchFolder)
+
+        self.watchQuietSecondsSpinBox.setValue(getSettings()['watchQuietSeconds'])
+
+        if getSettings()['watchAutoConvert']:
+            self.watchAutoConvertCheckBox.setChecked(True)
+
         # Set the ComboBox values
         for index, display in enumerate(self.dateOptionsDisplay):
             self.dateFormatComboBox.addItem(display, self.dateOptionsFormat[index])
@@ -89,7 +97,20 @@ class SettingsDialog(QDialog, Ui_SettingsDialog):
         
         getSettings()['addToITunesPath'] = unicode(self.addToITunesPathTextEdit.toPlainText())
 
+        watchSettings = [
+            getSettings()['watchFolders'],
+            getSettings()['watchQuietSeconds']
+        ]
+        getSettings()['watchFolders'] = [
+            unicode(self.watchFoldersListWidget.item(row).text())
+            for row in range(self.watchFoldersListWidget.count())
+        ]
+        getSettings()['watchQuietSeconds'] = self.watchQuietSecondsSpinBox.value()
+        getSettings()['watchAutoConvert'] = self.watchAutoConvertCheckBox.isChecked()
+
         self.parentWidget().refreshQueue()
+        if watchSettings != [getSettings()['watchFolders'], getSettings()['watchQuietSeconds']]:
+            self.parentWidget().restartWatching()
         self.close()
 
     def restoreDefaults(self):
@@ -108,6 +129,10 @@ class SettingsDialog(QDialog, Ui_SettingsDialog):
         self.sendErrorReportsCheckBox.setChecked(getSettings().defaults['sendErrorReports'])
         self.verifyMd5HashesCheckBox.setChecked(getSettings().defaults['verifyMd5Hashes'])
 
+        self.watchFoldersListWidget.clear()
+        self.watchQuietSecondsSpinBox.setValue(getSettings().defaults['watchQuietSeconds'])
+        self.watchAutoConvertCheckBox.setChecked(getSettings().defaults['watchAutoConvert'])
+
         defaultAddToITunesPath = getSettings().getDetectedAddToITunesPath()
         if defaultAddToITunesPath:
             self.addToITunesPathTextEdit.setText(defaultAddToITunesPath)
@@ -120,4 +145,13 @@ class SettingsDialog(QDialog, Ui_SettingsDialog):
     def changeAddToITunesPath(self):
         dirName = QFileDialog.getExistingDirectory(self, 'Locate Directory', getSettings()['addToITunesPath'])
         if dirName:            
-            self.addToITunesPathTextEdit.setText(dirName)
\ No newline at end of file
+            self.addToITunesPathTextEdit.setText(dirName)
+
+    def addWatchFolder(self):
+        dirName = QFileDialog.getExistingDirectory(self, 'Locate Directory', getSettings()['defaultFolder'])
+        if dirName and not self.watchFoldersListWidget.findItems(dirName, Qt.MatchExactly):
+            self.watchFoldersListWidget.addItem(dirName)
+
+    def removeWatchFolder(self):
+        for item in self.watchFoldersListWidget.selectedItems():
+            self.watchFoldersListWidget.takeItem(self.watchFoldersListWidget.row(item))
\ No newline at end of file
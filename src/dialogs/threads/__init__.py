@@ -5,6 +5,8 @@ Copyright (C) 2010 Zachary Chavez
 BootTunes is licensed under the GPLv2.
 http://www.gnu.org/licenses/gpl-2.0.html
 """
+import time
+import threading
 
 class ReadLocker:
     """
@@ -30,3 +32,20 @@ class WriteLocker:
     def __exit__(self, type, value, tb):
         self.lock.unlock()
 
+
+class StageTimer:
+    """
+    Context manager which adds the number of seconds spent in its block to
+    timings[stage].  The same timings may be shared between threads.
+
+    """
+    lock = threading.Lock()
+    def __init__(self, timings, stage):
+        self.timings = timings
+        self.stage = stage
+    def __enter__(self):
+        self.start = time.time()
+    def __exit__(self, type, value, tb):
+        with StageTimer.lock:
+            self.timings[self.stage] = self.timings.get(self.stage, 0) \
+                + time.time() - self.start
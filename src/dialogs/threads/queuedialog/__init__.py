@@ -6,4 +6,5 @@ http://www.gnu.org/licenses/gpl-2.0.html
 
 from dialogs.threads import ReadLocker, WriteLocker
 from convertfiles import *
-from loadshows import *
\ No newline at end of file
+from loadshows import *
+from watchfolders import *
\ No newline at end of file
@@ -10,12 +10,119 @@ from PyQt4.QtCore import *
 from PyQt4.QtGui import *
 import re
 import os
+import sys
+import time
 import audiotools
 import platform
 import shutil
-from multiprocessing import Process
+import hashlib
+import cPickle
+import multiprocessing
+import traceback
 from dialogs.threads import ReadLocker, WriteLocker
+from dialogs.threads.workers import WorkerPool, reportProgress
 from settings import getSettings
+from shows import getFileMd5
+
+def getProgressStage(pcmFrameCount):
+    """
+    @type pcmFrameCount: int
+    @param pcmFrameCount: The length of the track in PCM frames
+
+    @rtype: function
+    @return: An audiotools.pipeline() stage which passes FrameLists
+    through, calling reportProgress() each time another percent of the
+    track has gone by
+
+    """
+    counts = {'frames': 0, 'percent': 0}
+    def stage(frameList):
+        counts['frames'] += frameList.frames
+        percent = min(100, counts['frames'] * 100 / pcmFrameCount)
+        if percent > counts['percent']:
+            counts['percent'] = percent
+            reportProgress(percent / 100.0)
+        return frameList
+    return stage
+
+def encodeTrack(targetFile, sourceFile, pcmFrameCount, alacMetadata, genre,
+                imageData, encoderProcesses=1, antiCrashBin=None):
+    """
+    The actual m4a encoding process, run by ConvertFilesThread either in
+    a worker process or in the thread itself.  The source file is only
+    opened for decoding here, and is closed again once the track is done.
+    Errors are raised so that the track can be reported as failed.
+
+    @type targetFile: unicode
+    @type sourceFile: unicode
+    @type pcmFrameCount: int
+    @param pcmFrameCount: The length of sourceFile in PCM frames, if
+    known, so that the encoder can write straight into targetFile.
+    @type alacMetadata: audiotools.MetaData
+    @type genre: unicode
+    @type imageData: str
+    @type encoderProcesses: int
+
+    @type antiCrashBin: list
+    @param antiCrashBin: QueueDialog.antiCrashBin, when run in the thread
+
+    """
+    metadata = audiotools.M4AMetaData.converted(alacMetadata)
+    # Set the "part of a compilation" flag to false
+    metadata['cpil'] = metadata.binary_atom(
+        'cpil',
+        '\x00\x00\x00\x15\x00\x00\x00\x00\x00'
+    )
+    metadata['\xa9gen'] = metadata.text_atom('\xa9gen', genre)
+    if imageData is not None:
+        try:
+            metadata.add_image(
+                audiotools.Image.new(imageData, 'cover', 0)
+            )
+        except audiotools.InvalidImage:
+            pass
+
+    if re.search('\.m4a$', sourceFile, re.IGNORECASE):
+        shutil.copyfile(sourceFile, targetFile)
+        alacFile = audiotools.open(targetFile)
+        alacFile.set_metadata(metadata)
+    else:
+        sourcePcm = audiotools.open(
+            sourceFile.encode(sys.getfilesystemencoding())
+        ).to_pcm()
+        if isinstance(sourcePcm, audiotools.PCMReaderError):
+            raise audiotools.DecodingError()
+        try:
+            # Decode in a separate thread, which reads ahead of
+            # the encoder.
+            # Tags and cover art are written as the file is built,
+            # and progress is reported as the audio passes through.
+            if pcmFrameCount:
+                stages = [getProgressStage(pcmFrameCount)]
+            else:
+                stages = []
+            audiotools.pipeline(
+                sourcePcm,
+                stages,
+                lambda pcmReader: audiotools.ALACAudio.from_pcm(
+                    targetFile,
+                    pcmReader,
+                    total_pcm_frames=pcmFrameCount,
+                    metadata=metadata,
+                    processes=encoderProcesses
+                )
+            )
+        finally:
+            if antiCrashBin is not None \
+                    and platform.system() == 'Windows':
+                # Windows 7 crashes when PCMReader objects go out
+                # of scope, so keep it around.
+                antiCrashBin.append(sourcePcm)
+            else:
+                try:
+                    sourcePcm.close()
+                except audiotools.DecodingError:
+                    pass
 
 class ConvertFilesThread(QThread):
     """
@@ -23,6 +130,19 @@ class ConvertFilesThread(QThread):
     m4a files and place them in the "Automatically Add To iTunes"
     directory.
 
+    Tracks are converted by a pool of up to getJobCount() workers.  Tracks
+    from different recordings may be converted at the same time, but a
+    recording is only moved to the "Automatically Add To iTunes" directory
+    once every one of its tracks has been converted.
+
+    Each converted track is recorded in a journal in its recording's
+    tempDir once its file has been checked, so that if the conversion is
+    canceled or interrupted, tracks which were already converted are
+    skipped the next time.
+
+    The seconds spent converting each track are added up in
+    self.timings['encode'].
+
     """
     def __init__(self, lock, parent):
         super(ConvertFilesThread, self).__init__(parent)
@@ -30,117 +150,125 @@ class ConvertFilesThread(QThread):
         self.stopped = False
         self.mutex = QMutex()
         self.completed = False
+        self.pool = None
+        self.journals = {}
+        self.timings = {}
 
     def run(self):
         try:
             parent = self.parent()
-            progressCounter = 0
-            while progressCounter < parent.trackCount and not self.isStopped():
-                currentRecording = parent.validRecordings[parent.currentRecording]
-                metadata = currentRecording['metadata']
-
-                if 'imageData' not in currentRecording:
-                    if metadata['cover'] == 'No Cover Art':
-                        currentRecording['imageData'] = None
-                    else:
-                        imageFile = open(metadata['cover'], 'rb')
-                        currentRecording['imageData'] = imageFile.read()
-                        imageFile.close()
+            jobCount = self.getJobCount()
+            # Run encodes as separate processes on Mac, or whenever more
+            # than one track is converted at a time.  The same worker
+            # processes are reused for every track.
+            useProcesses = platform.system() == 'Darwin' or jobCount > 1
+            if useProcesses:
+                with QMutexLocker(self.mutex):
+                    if self.stopped:
+                        return
+                    self.pool = WorkerPool(jobCount)
 
-                tempDirPath = metadata['tempDir'].absolutePath()
+            pendingTracks = []
+            self.tracksRemaining = []
+            for recordingIndex, recording in enumerate(parent.validRecordings):
+                trackCount = len(recording['metadata']['tracklist'])
+                self.tracksRemaining.append(trackCount)
+                for trackIndex in range(trackCount):
+                    pendingTracks.append((recordingIndex, trackIndex))
 
-                filePath = metadata['audioFiles'][parent.currentTrack]
-                self.currentFile = filePath
-
-                extensionMatches = re.findall('\.([^.]+)$', filePath)
-                self.extension = extensionMatches[0] \
-                    if extensionMatches \
-                    else ''
-
-                if 'defaults' in metadata:
-                    artistName = metadata['defaults']['preferred_name'] \
-                        .decode('utf-8')
-                    genre = metadata['defaults']['genre']
-                else:
-                    artistName = metadata['artist']
-                    genre = ''
-
-                parent.currentTrackName = metadata['tracklist'][parent.currentTrack]
-
-                alacMetadata = audiotools.MetaData(
-                    # if track name is empty iTunes will use the filename,
-                    # which we don't want, so replace with a space
-                    track_name   = parent.currentTrackName \
-                        if parent.currentTrackName != '' \
-                        else ' ',
-                    track_number = parent.currentTrack + 1,
-                    track_total  = len(metadata['tracklist']),
-                    album_name   = metadata['albumTitle'],
-                    artist_name  = artistName,
-                    year         = unicode(metadata['date'].year),
-                    date         = unicode(metadata['date'].isoformat()),
-                    comment      = metadata['comments']
-                )
-                self.emit(
-                    SIGNAL("progress(int, QString)"),
-                    progressCounter + 1,
-                    'Converting "' + parent.currentTrackName + '"'
-                )
-
-                imageData = currentRecording['imageData']
-                sourcePcm = currentRecording['pcmReaders'][parent.currentTrack]
-                targetFile = tempDirPath + '/' \
-                    + unicode(parent.currentTrack) + u'.m4a'
-
-                args = [
-                    targetFile,
-                    sourcePcm,
-                    alacMetadata,
-                    genre,
-                    imageData,
-                ]
-                # If on Mac, run as a separate process
-                if platform.system() == 'Darwin':
-                    self.process = Process(
-                        target=self.encodeProcess,
-                        args=(args)
+            progressCounter = 0
+            progressText = None
+            runningJobs = []
+            while (pendingTracks or runningJobs) and not self.isStopped():
+                while pendingTracks and len(runningJobs) < jobCount:
+                    recordingIndex, trackIndex = pendingTracks.pop(0)
+                    # A track which is the only one left to convert while
+                    # nothing else is running is split across every slot.
+                    # A track can't be given more processes once started,
+                    # so otherwise each track gets one.
+                    if pendingTracks or runningJobs:
+                        encoderProcesses = 1
+                    else:
+                        encoderProcesses = jobCount
+                    job = self.prepareJob(
+                        recordingIndex,
+                        trackIndex,
+                        encoderProcesses
                     )
-                    self.process.start()
-                    while self.process.is_alive() and not self.isStopped():
-                        pass
+                    if self.isJournaled(job):
+                        job['journaled'] = True
+                        job['status'] = 'done'
+                        self.finishJob(job)
+                        progressCounter += 1
+                        continue
+                    job['started'] = time.time()
+                    runningJobs.append(job)
+                    self.emit(
+                        SIGNAL("progress(int, QString)"),
+                        progressCounter + 1,
+                        self.getProgressText(runningJobs)
+                    )
+                    if useProcesses:
+                        job['taskId'] = self.pool.submit(
+                            encodeTrack,
+                            job['args']
+                        )
+                    else:
+                        try:
+                            encodeTrack(
+                                *job['args'],
+                                antiCrashBin=parent.antiCrashBin
+                            )
+                        except Exception:
+                            job['status'] = 'failed'
+                            job['details'] = traceback.format_exc()
+                        else:
+                            job['status'] = 'done'
+
+                if useProcesses:
+                    # Block until a worker reports back, waking up now and
+                    # then to notice being canceled.
+                    finishedTasks = dict([
+                        (taskId, (status, details))
+                        for taskId, status, details in self.pool.wait(0.5)
+                    ])
+                    finishedJobs = []
+                    for job in runningJobs:
+                        if job['taskId'] in finishedTasks:
+                            job['status'], job['details'] = \
+                                finishedTasks[job['taskId']]
+                            finishedJobs.append(job)
                 else:
-                    self.encodeProcess(*args)
-                if not os.path.exists(targetFile):
-                    parent.failedTracks.append(self.currentFile)
+                    finishedJobs = list(runningJobs)
+                if not finishedJobs:
+                    # Show how far along the running tracks are
+                    if useProcesses and runningJobs:
+                        newProgressText = self.getProgressText(runningJobs)
+                        if newProgressText != progressText:
+                            progressText = newProgressText
+                            self.emit(
+                                SIGNAL("progress(int, QString)"),
+                                progressCounter + 1,
+                                progressText
+                            )
+                    continue
 
                 if self.isStopped():
                     return
 
-                progressCounter += 1
-
-                with ReadLocker(self.lock):
-                    currentTrack = parent.currentTrack
-                if (currentTrack + 1) > (len(metadata['tracklist']) - 1):
-                    with WriteLocker(self.lock):
-                        parent.currentTrack = 0
-                    # Move files to addToITunesPath
-                    metadata['tempDir'].setNameFilters(['*.m4a'])
-                    QDir(
-                        getSettings()['addToITunesPath']) \
-                        .mkdir(metadata['hash']
+                for job in finishedJobs:
+                    runningJobs.remove(job)
+                    self.finishJob(job)
+                    progressCounter += 1
+                if runningJobs:
+                    self.emit(
+                        SIGNAL("progress(int, QString)"),
+                        progressCounter + 1,
+                        self.getProgressText(runningJobs)
                     )
-                    for audioFile in metadata['tempDir'].entryList():
-                        metadata['tempDir'].rename(
-                            audioFile,
-                            getSettings()['addToITunesPath'] + '/' \
-                            + metadata['hash'] + '/' + audioFile
-                        )
-                    if not getSettings().isCompleted(metadata['hash']):
-                        getSettings().addCompleted(metadata['hash'])
-                    with WriteLocker(self.lock):
-                        parent.currentRecording += 1
-                else:
-                    parent.currentTrack += 1
+
+            if self.isStopped():
+                return
 
             self.emit(
                 SIGNAL("progress(int, QString)"),
@@ -158,55 +286,338 @@ class ConvertFilesThread(QThread):
             self.completed = True
             self.emit(SIGNAL("success()"))
             self.stop()
+            if self.pool is not None:
+                self.pool.close()
 
-    def encodeProcess(self, targetFile, sourcePcm,
-                      alacMetadata, genre, imageData):
+    def getJobCount(self):
         """
-        The actual m4a encoding process.
+        Return the number of tracks to convert at once, as determined by the
+        "conversionJobs" setting.  A value of 0 means one per CPU.  Parallel
+        conversion requires os.fork(), so this is always 1 on Windows.
 
-        @type targetFile: unicode
-        @type sourcePcm: audiotool.PCMReader
-        @type alacMetadata: audiotools.MetaData
-        @type genre: unicode
-        @type imageData: str
+        @rtype: int
 
         """
-        try:
-            if re.match('^m4a$', self.extension, re.IGNORECASE):
-                shutil.copyfile(self.currentFile, targetFile)
-                alacFile = audiotools.open(targetFile)
+        if not hasattr(os, 'fork'):
+            return 1
+        jobCount = getSettings()['conversionJobs']
+        if not jobCount:
+            try:
+                jobCount = multiprocessing.cpu_count()
+            except NotImplementedError:
+                jobCount = 1
+        return max(1, int(jobCount))
+
+    def prepareJob(self, recordingIndex, trackIndex, encoderProcesses=1):
+        """
+        Gather everything needed to convert a single track.
+
+        @type recordingIndex: int
+        @param recordingIndex: The index of the recording in
+        parent.validRecordings
+
+        @type trackIndex: int
+
+        @type encoderProcesses: int
+        @param encoderProcesses: The number of processes the track itself
+        may be split across while encoding
+
+        @rtype: dict
+
+        """
+        parent = self.parent()
+        recording = parent.validRecordings[recordingIndex]
+        metadata = recording['metadata']
+
+        if 'imageData' not in recording:
+            if metadata['cover'] == 'No Cover Art':
+                recording['imageData'] = None
             else:
-                alacFile = audiotools.ALACAudio.from_pcm(targetFile, sourcePcm)
-        except:
-            pass
+                imageFile = open(metadata['cover'], 'rb')
+                recording['imageData'] = imageFile.read()
+                imageFile.close()
+
+        tempDirPath = metadata['tempDir'].absolutePath()
+        filePath = metadata['audioFiles'][trackIndex]
+
+        if 'defaults' in metadata:
+            artistName = metadata['defaults']['preferred_name'] \
+                .decode('utf-8')
+            genre = metadata['defaults']['genre']
         else:
-            alacFile.set_metadata(alacMetadata)
-            metadata = alacFile.get_metadata()
-            # Set the "part of a compilation" flag to false
-            metadata['cpil'] = metadata.text_atom(
-                'data',
-                '\x00\x00\x00\x15\x00\x00\x00\x00\x00'
-            )
-            metadata['\xa9gen'] = metadata.text_atom('\xa9gen', genre)
-            alacFile.set_metadata(metadata)
-            # Separately attempt to set the cover art,
-            # since a MemoryError may occur in large files
-            try:
-                if imageData is not None:
-                    metadata.add_image(
-                        audiotools.Image.new(imageData, 'cover', 0)
+            artistName = metadata['artist']
+            genre = ''
+
+        trackName = metadata['tracklist'][trackIndex]
+
+        alacMetadata = audiotools.MetaData(
+            # if track name is empty iTunes will use the filename,
+            # which we don't want, so replace with a space
+            track_name   = trackName if trackName != '' else ' ',
+            track_number = trackIndex + 1,
+            track_total  = len(metadata['tracklist']),
+            album_name   = metadata['albumTitle'],
+            artist_name  = artistName,
+            year         = unicode(metadata['date'].year),
+            date         = unicode(metadata['date'].isoformat()),
+            comment      = metadata['comments']
+        )
+
+        # A unicode rather than a QString, so that it can be sent to a worker
+        targetFile = unicode(tempDirPath) + u'/' + unicode(trackIndex) + u'.m4a'
+
+        # Identifies everything that goes into the converted file other
+        # than the source audio, so that a journaled file is converted
+        # again if its metadata has been changed since.
+        tagsHash = hashlib.md5(repr((
+            [
+                getattr(alacMetadata, field)
+                for field in audiotools.MetaData.__FIELDS__
+            ],
+            genre,
+            hashlib.md5(recording['imageData'] or '').hexdigest()
+        ))).hexdigest()
+
+        return {
+            'recordingIndex': recordingIndex,
+            'trackIndex'    : trackIndex,
+            'trackName'     : trackName,
+            'filePath'      : filePath,
+            'targetFile'    : targetFile,
+            'pcmFrameCount' : recording['pcmFrameCounts'][trackIndex],
+            'tagsHash'      : tagsHash,
+            'args'          : [
+                targetFile,
+                filePath,
+                recording['pcmFrameCounts'][trackIndex],
+                alacMetadata,
+                genre,
+                recording['imageData'],
+                encoderProcesses,
+            ]
+        }
+
+    def finishJob(self, job):
+        """
+        Record the result of a converted track.  If it was the last
+        remaining track of its recording, move the recording's files
+        to addToITunesPath and mark it as completed.
+
+        A track whose encode failed is added to parent.failedTracks, the
+        error is written to the error log, and whatever was written of its
+        targetFile is removed.
+
+        @type job: dict
+        @param job: A dict returned by prepareJob(), with its "status" set
+        to "done" or "failed", and its "details" set to the error, if any
+
+        """
+        parent = self.parent()
+        recordingIndex = job['recordingIndex']
+        self.tracksRemaining[recordingIndex] -= 1
+        if job['status'] == 'done' and 'journaled' not in job \
+                and not self.isConverted(job):
+            job['status'] = 'failed'
+            job['details'] = 'The converted file is incomplete'
+        if job['status'] != 'done' or not os.path.exists(job['targetFile']):
+            if job.get('details'):
+                sys.stderr.write(
+                    'Failed to convert %s:\n%s\n' % (
+                        unicode(job['filePath']).encode('utf-8'),
+                        job['details']
                     )
-                alacFile.set_metadata(metadata)
-            except MemoryError:
-                pass
+                )
+            if os.path.exists(job['targetFile']):
+                os.remove(job['targetFile'])
+            with WriteLocker(self.lock):
+                parent.failedTracks.append(job['filePath'])
+        elif 'journaled' not in job and self.tracksRemaining[recordingIndex]:
+            self.addToJournal(job)
+        if 'started' in job:
+            self.timings['encode'] = self.timings.get('encode', 0) \
+                + time.time() - job['started']
+
+        if self.tracksRemaining[recordingIndex] > 0:
+            return
+
+        metadata = parent.validRecordings[recordingIndex]['metadata']
+        journalPath = self.getJournalPath(recordingIndex)
+        if os.path.exists(journalPath):
+            os.remove(journalPath)
+        # Move files to addToITunesPath
+        metadata['tempDir'].setNameFilters(['*.m4a'])
+        QDir(
+            getSettings()['addToITunesPath']) \
+            .mkdir(metadata['hash']
+        )
+        for audioFile in metadata['tempDir'].entryList():
+            metadata['tempDir'].rename(
+                audioFile,
+                getSettings()['addToITunesPath'] + '/' \
+                + metadata['hash'] + '/' + audioFile
+            )
+        if not getSettings().isCompleted(metadata['hash']):
+            getSettings().addCompleted(metadata['hash'])
+
+    def isConverted(self, job):
+        """
+        Check that a track's targetFile is a complete m4a file, holding
+        as many PCM frames as its source, if that is known.
+
+        @type job: dict
+        @param job: A dict returned by prepareJob()
+
+        @rtype: bool
+
+        """
+        try:
+            m4aFile = audiotools.open(job['targetFile'])
+        except (audiotools.UnsupportedFile, audiotools.InvalidFile, IOError):
+            return False
+        if not isinstance(m4aFile, audiotools.M4AAudio):
+            return False
+        return job['pcmFrameCount'] is None \
+            or m4aFile.total_frames() == job['pcmFrameCount']
+
+    def getJournalPath(self, recordingIndex):
+        """
+        @type recordingIndex: int
+
+        @rtype: unicode
+        @return: The path of the recording's conversion journal
+
+        """
+        metadata = self.parent().validRecordings[recordingIndex]['metadata']
+        return unicode(metadata['tempDir'].absolutePath()) + u'/journal'
+
+    def getJournal(self, recordingIndex):
+        """
+        Return the recording's conversion journal, loading it from its
+        tempDir the first time.  The journal is a dict of dicts, keyed
+        by track index, as created by addToJournal().
+
+        @type recordingIndex: int
+
+        @rtype: dict
+
+        """
+        if recordingIndex not in self.journals:
+            journal = {}
+            journalPath = self.getJournalPath(recordingIndex)
+            if os.path.exists(journalPath):
+                fileObj = open(journalPath, 'rb')
+                try:
+                    journal = cPickle.load(fileObj) or {}
+                except (cPickle.UnpicklingError, AttributeError, EOFError,
+                        ImportError, IndexError, ValueError):
+                    pass
+                fileObj.close()
+            self.journals[recordingIndex] = journal
+        return self.journals[recordingIndex]
+
+    def getSourceIdentity(self, filePath):
+        """
+        @type filePath: unicode
+
+        @rtype: tuple
+        @return: The path, size and modification time of the file
+
+        """
+        filePath = unicode(filePath)
+        stat = os.stat(filePath)
+        return (filePath, stat.st_size, stat.st_mtime)
+
+    def addToJournal(self, job):
+        """
+        Record a converted track in its recording's journal and write
+        the journal to disk.
+
+        @type job: dict
+        @param job: A dict returned by prepareJob()
+
+        """
+        journal = self.getJournal(job['recordingIndex'])
+        try:
+            journal[job['trackIndex']] = {
+                'source'    : self.getSourceIdentity(job['filePath']),
+                'targetFile': unicode(job['targetFile']),
+                'tagsHash'  : job['tagsHash'],
+                'md5'       : getFileMd5(job['targetFile'])
+            }
+            fileObj = open(self.getJournalPath(job['recordingIndex']), 'wb')
+            cPickle.dump(journal, fileObj)
+            fileObj.close()
+        except (IOError, OSError):
+            pass
+
+    def isJournaled(self, job):
+        """
+        Check whether the track was converted by an earlier, interrupted
+        conversion, and its converted file is still intact.
+
+        @type job: dict
+        @param job: A dict returned by prepareJob()
+
+        @rtype: bool
+
+        """
+        journal = self.getJournal(job['recordingIndex'])
+        if job['trackIndex'] not in journal:
+            return False
+        entry = journal[job['trackIndex']]
+        try:
+            return (
+                entry['targetFile'] == unicode(job['targetFile'])
+                and entry['tagsHash'] == job['tagsHash']
+                and entry['source'] == self.getSourceIdentity(job['filePath'])
+                and entry['md5'] == getFileMd5(job['targetFile'])
+            )
+        except (IOError, OSError):
+            return False
+
+    def getProgressText(self, runningJobs):
+        """
+        Describe the tracks currently being converted.
+
+        @type runningJobs: list
+        @param runningJobs: A list of dicts returned by prepareJob()
+
+        @rtype: unicode
+
+        """
+        if len(runningJobs) == 1:
+            return 'Converting "' + runningJobs[0]['trackName'] + '"' \
+                + self.getJobProgressText(runningJobs[0])
+        return 'Converting %d tracks\n\n%s' % (
+            len(runningJobs),
+            '\n'.join([
+                '"' + job['trackName'] + '"' + self.getJobProgressText(job)
+                for job in runningJobs
+            ])
+        )
+
+    def getJobProgressText(self, job):
+        """
+        @type job: dict
+        @param job: A dict returned by prepareJob()
+
+        @rtype: unicode
+        @return: How much of the track has been converted, such as " (42%)",
+        if its worker process has reported it
+
+        """
+        if self.pool is None or job.get('taskId') is None:
+            return ''
+        progress = self.pool.getProgress(job['taskId'])
+        if progress is None:
+            return ''
+        return ' (%d%%)' % (progress * 100)
 
     def stop(self):
         with QMutexLocker(self.mutex):
             self.stopped = True
-        if platform.system() == 'Darwin' \
-                and hasattr(self, 'process') \
-                and self.process.is_alive():
-            self.process.terminate()
+            if self.pool is not None:
+                self.pool.terminate()
 
     def isStopped(self):
         with QMutexLocker(self.mutex):
@@ -9,8 +9,13 @@ http://www.gnu.org/licenses/gpl-2.0.html
 from PyQt4.QtCore import *
 from PyQt4.QtGui import *
 from dialogs.exceptions import QueueDialogError
+from dialogs.threads import StageTimer
+from dialogs.threads.workers import WorkerPool
 from settings import getSettings
-from parsetxt import TxtParser
+from shows import readFileOfUnknownEncoding, getFilePaths, getSortedFiles, \
+    getFileMd5, DirSnapshot
+from parsetxt import parse, reparseWithArtist, createParsePool, \
+    getCitiesSignature, PARSED_CACHE_VERSION
 from coverart import CoverArtRetriever
 import re
 import os
@@ -18,12 +23,32 @@ import hashlib
 import platform
 import audiotools
 import tracklint
-from multiprocessing import Process
+import threading
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+def fixFlac(tempFilePath, audioFilePath):
+    """
+    Fix a malformed FLAC, saving the fixed version to tempFilePath.
+
+    @type tempFilePath: unicode
+
+    @type audioFilePath: unicode
+
+    """
+    audiotools.open(audioFilePath).fix_id3_preserve_originals(tempFilePath)
 
 class LoadShowsThread(QThread):
     """
     Load shows.
 
+    When given several directories, up to getJobCount() of them are loaded
+    at once, and each show is sent with a loaded(PyQt_PyObject) signal as
+    soon as it and the ones before it are ready.
+
+    The seconds spent in each stage of loading (scan, parse, md5, fixFlac
+    and cover) are added up in self.timings.
+
     """
 
     def __init__(self, lock, parent, dirOrDirs):
@@ -33,8 +58,52 @@ class LoadShowsThread(QThread):
         self.mutex = QMutex()
         self.completed = False
         self.dirOrDirs = dirOrDirs
+        self.timings = {}
+        self.pools = []
+        self.md5Pool = None
+        self.parsePool = None
+        self.progressValue = 1
+        # Per-thread state of the directory being loaded
+        self.local = threading.local()
+
+    def getBasename(self):
+        """
+        @rtype: unicode
+        @return: The name of the directory being loaded in the current thread
+
+        """
+        return getattr(self.local, 'basename', u'')
 
-    def run(self):        
+    def setBasename(self, basename):
+        """
+        @type basename: unicode
+
+        """
+        self.local.basename = basename
+
+    basename = property(getBasename, setBasename)
+
+    scanSettings = [
+        'verifyMd5Hashes',
+        'decodeFlacFingerprints',
+        'defaultArt',
+        'repairBrokenFlacs'
+    ]
+    """Settings which change what getMetadataFromDir() finds"""
+
+    def run(self):
+        try:
+            self.load()
+        finally:
+            # Once stopped, the threads in the pools give up promptly, so
+            # they are waited for rather than left running
+            self.closePools()
+
+    def load(self):
+        """
+        Load self.dirOrDirs, sending the signals described above.
+
+        """
         dirOrDirs = self.dirOrDirs        
         parent = self.parent()
 
@@ -62,22 +131,46 @@ class LoadShowsThread(QThread):
                     self.fail(str(e))
                     return
 
-        if hasattr(parent, 'progressDialog'):
-            parent.progressDialog.setMaximum(len(dirs))
+        if not dirs:
+            parent.metadata = None
+            self.complete()
+            return
 
-        errorCount   = 0
-        metadataList = []
-        for index, dir in enumerate(dirs):            
-            self.basename = os.path.basename(unicode(dir).rstrip(os.sep))
-            self.updateProgress('Loading %s' % self.basename, index)
-            try:
-                metadataList.append(self.getMetadataFromDir(dir))
-            except QueueDialogError as e:
-                errorCount += 1
-                errorMsg = str(e)
+        self.emit(SIGNAL("maximum(int)"), len(dirs))
+
+        # The threads below parse their txts in other processes
+        with QMutexLocker(self.mutex):
             if self.stopped:
                 return
-            self.updateProgress('Loading %s' % self.basename, index + 1)
+            self.parsePool = createParsePool(self.getJobCount())
+            if self.parsePool is not None:
+                self.pools.append(self.parsePool)
+
+        errorCount   = 0
+        metadataList = []
+        # Results come back in the order of dirs, however long each takes.
+        pool = ThreadPool(min(self.getJobCount(), len(dirs)))
+        try:
+            results = pool.imap(self.loadDir, dirs)
+            for index, (dir, metadata, error) in enumerate(results):
+                if error is None:
+                    metadataList.append(metadata)
+                    if metadata is not None and not self.stopped:
+                        self.emit(SIGNAL("loaded(PyQt_PyObject)"), metadata)
+                else:
+                    errorCount += 1
+                    errorMsg = error
+                if self.stopped:
+                    return
+                self.updateProgress(
+                    'Loading %s' % os.path.basename(
+                        unicode(dir).rstrip(os.sep)
+                    ),
+                    index + 1
+                )
+        finally:
+            pool.close()
+            pool.join()
 
         # If only one error, show that error.
         if len(metadataList) == 0 and errorCount == 1:
@@ -86,13 +179,27 @@ class LoadShowsThread(QThread):
         elif len(metadataList) == 0 and errorCount > 1:
             self.fail("No valid recordings found")
 
-        parent.metadata     = None
-        if self.stopped:
-            parent.metadataList = None
-        else:
-            parent.metadataList = metadataList
+        parent.metadata = None
         self.complete()
 
+    def closePools(self):
+        """
+        Stop the pools shared by the loading threads, waiting for any hashing
+        still going on to notice that the thread is stopped.
+
+        """
+        with QMutexLocker(self.mutex):
+            md5Pool, self.md5Pool = self.md5Pool, None
+            parsePool, self.parsePool = self.parsePool, None
+            if parsePool is not None:
+                self.pools.remove(parsePool)
+        if md5Pool is not None:
+            md5Pool.close()
+            md5Pool.join()
+        if parsePool is not None:
+            parsePool.terminate()
+            parsePool.join()
+
     def complete(self):
         """
         Stop process and sent a success signal.
@@ -102,6 +209,57 @@ class LoadShowsThread(QThread):
         self.emit(SIGNAL("success()"))        
         self.stop()        
 
+    def loadDir(self, dir):
+        """
+        Load one of several directories, on a thread of the pool in run().
+
+        @type dir: QString
+
+        @rtype: tuple
+        @return: The directory, its metadata, and the error message if it
+        could not be loaded
+
+        """
+        self.basename = os.path.basename(unicode(dir).rstrip(os.sep))
+        if self.stopped:
+            return (dir, None, None)
+        self.updateProgress('Loading %s' % self.basename)
+        try:
+            return (dir, self.getMetadataFromDir(dir), None)
+        except QueueDialogError as e:
+            return (dir, None, str(e))
+
+    def getScanSignature(self, snapshot):
+        """
+        @type snapshot: DirSnapshot
+
+        @rtype: list
+        @return: What the scan cache entry of a directory must match to be
+        used.  Besides the directory's files, this includes the settings and
+        the version of the parser and cities list it was loaded with, so
+        that downloading a new cities list reaches shows loaded before.
+
+        """
+        return [
+            [getSettings()[key] for key in self.scanSettings],
+            [PARSED_CACHE_VERSION, getCitiesSignature()],
+            snapshot.getSignature()
+        ]
+
+    def getJobCount(self):
+        """
+        @rtype: int
+        @return: The number of directories to load at once
+
+        """
+        jobCount = getSettings()['loadingJobs']
+        if not jobCount or jobCount < 1:
+            try:
+                jobCount = multiprocessing.cpu_count()
+            except NotImplementedError:
+                jobCount = 1
+        return jobCount
+
     def getMetadataFromDir(self, dirName):
         """
         Search dirName for a txt file and supported audio files.  If found,
@@ -117,33 +275,58 @@ class LoadShowsThread(QThread):
         in first argument.
 
         """        
-        parent = self.parent()
         qDir = QDir(dirName)
+        dirPath = unicode(qDir.absolutePath())
+        # Every file lookup below is answered from this one listing
+        snapshot = DirSnapshot(dirPath)
 
-        if getSettings()['verifyMd5Hashes']:
-            md5s = self.getMd5s(qDir)
-        else:
-            md5s = []
-
-        qDir.setNameFilters(['*.txt'])
-        if not qDir.entryList():
+        txtFiles = snapshot.getFiles(['*.txt'])
+        if not txtFiles:
             raise QueueDialogError(
                 "No txt file found in the specified directory"
             )
 
+        # Reuse what was found last time if nothing has changed
+        useCache = not getSettings()['reverifyMd5Hashes']
+        if useCache:
+            with StageTimer(self.timings, 'scan'):
+                signature = self.getScanSignature(snapshot)
+                cachedMetadata = getSettings().getCachedScan(
+                    dirPath,
+                    signature
+                )
+            if cachedMetadata is not None:
+                return self.restoreCachedMetadata(
+                    cachedMetadata,
+                    dirPath,
+                    snapshot
+                )
+
+        # Only read the checksum files when the result isn't cached
+        if getSettings()['verifyMd5Hashes']:
+            with StageTimer(self.timings, 'md5'):
+                md5s = self.getMd5s(snapshot)
+                ffps = self.getFfps(snapshot)
+        else:
+            md5s = []
+            ffps = {}
+
         # If at least three fields not found (not counting comments, which
         # is set to the full contents of the file), and there are more txt
         # files, keep trying.
-        for index, txtFile in enumerate(qDir.entryList()):
-            isTheFinalTxt = (index == len(qDir.entryList()) - 1)
-            textFilePath = unicode(qDir.filePath(txtFile))
+        for index, txtFile in enumerate(txtFiles):
+            isTheFinalTxt = (index == len(txtFiles) - 1)
+            textFilePath = snapshot.filePath(txtFile)
             try:
-                fileHandle = parent.openFileOfUnknownEncoding(textFilePath)
-
-                txt      = fileHandle.read()
-                metadata = TxtParser(txt).parseTxt()
-
-                fileHandle.close()
+                with StageTimer(self.timings, 'parse'):
+                    txt      = readFileOfUnknownEncoding(textFilePath)
+                    metadata = parse(
+                        txt,
+                        self.parsePool,
+                        lambda: self.stopped
+                    )
+                if metadata is None:
+                    return None
 
                 foundCount = 0
                 for k, v in metadata.iteritems():
@@ -154,13 +337,10 @@ class LoadShowsThread(QThread):
 
                 # Must contain valid audio files
                 validExtensions = ['*.flac', '*.shn', '*.m4a']
-                qDir.setNameFilters(validExtensions)
 
-                filePaths = parent.getFilePaths(qDir)
-                filePaths = parent.getSortedFiles(filePaths)
-                filePaths = [
-                    unicode(filePath) for filePath in filePaths
-                ]                
+                with StageTimer(self.timings, 'scan'):
+                    filePaths = getFilePaths(snapshot, validExtensions)
+                    filePaths = getSortedFiles(filePaths)
 
                 if len(filePaths) == 0:
                     raise QueueDialogError(
@@ -203,10 +383,19 @@ class LoadShowsThread(QThread):
                 nonParsedMetadata['md5_mismatches'] = []
                 tempDir = unicode(nonParsedMetadata['tempDir'].absolutePath())
                 if md5s:
-                    nonParsedMetadata['md5_mismatches'] = self.checkMd5s(
-                        md5s,
-                        filePaths
-                    )
+                    with StageTimer(self.timings, 'md5'):
+                        nonParsedMetadata['md5_mismatches'] = self.checkMd5s(
+                            md5s,
+                            filePaths
+                        )
+                if ffps and not self.stopped:
+                    with StageTimer(self.timings, 'md5'):
+                        ffpMismatches = self.checkFfps(ffps, filePaths)
+                    for filePath in ffpMismatches or []:
+                        if filePath not in nonParsedMetadata['md5_mismatches']:
+                            nonParsedMetadata['md5_mismatches'].append(
+                                filePath
+                            )
 
                 try:
                     audioFile = audiotools.open(filePaths[0])
@@ -215,8 +404,13 @@ class LoadShowsThread(QThread):
                         tracklint.BrokenFlacAudio
                     )
                     if isBroken:
-                        metadata.update(nonParsedMetadata)
-                        self.fixBadFlacFiles(metadata)                        
+                        # FLACs with ID3 tags are decoded in place by
+                        # BrokenFlacAudio.to_pcm(), so repaired copies
+                        # are only written if asked for.
+                        if getSettings()['repairBrokenFlacs']:
+                            metadata.update(nonParsedMetadata)
+                            with StageTimer(self.timings, 'fixFlac'):
+                                self.fixBadFlacFiles(metadata)
                     else:
                         # Assume that an artist name found in the actual file
                         # metadata is more accurate unless that title is
@@ -229,27 +423,36 @@ class LoadShowsThread(QThread):
                             'Unknown Artist'
                         )
                         if artistFoundInFileMetadata:
-                            txtParser = TxtParser(metadata['comments'])
-                            txtParser.artist = audioFileMetadata.artist_name
-                            # Don't lose values added to tracklist
-                            # since last parsing it
-                            tracklist = metadata['tracklist']
-                            metadata = txtParser.parseTxt()
-                            metadata['tracklist'] = tracklist
+                            with StageTimer(self.timings, 'parse'):
+                                # Don't lose values added to tracklist
+                                # since last parsing it
+                                tracklist = metadata['tracklist']
+                                metadata = reparseWithArtist(
+                                    metadata,
+                                    audioFileMetadata.artist_name
+                                )
+                                metadata['tracklist'] = tracklist
                 except audiotools.UnsupportedFile as e:
                     raise QueueDialogError(
                         os.path.basename(filePaths[0]) +
                         " is an unsupported file: "
                     )                
 
-                nonParsedMetadata['cover'] = CoverArtRetriever \
-                    .getCoverImageChoices(nonParsedMetadata, True)[0]
+                with StageTimer(self.timings, 'cover'):
+                    nonParsedMetadata['cover'] = CoverArtRetriever \
+                        .getCoverImageChoices(
+                            nonParsedMetadata,
+                            True,
+                            snapshot
+                        )[0]
 
                 metadata.update(nonParsedMetadata)
 
                 if self.stopped:
                     return None
                 else:
+                    if useCache:
+                        self.cacheMetadata(dirPath, signature, metadata)
                     return metadata
 
             except IOError as e:
@@ -263,6 +466,57 @@ class LoadShowsThread(QThread):
                     (txtFile, e.args[4])
                 )
 
+    def cacheMetadata(self, dirPath, signature, metadata):
+        """
+        Save the metadata found for a directory, so that it can be reused
+        by getMetadataFromDir() as long as the directory is unchanged.
+        Recordings with fixed FLACs aren't saved, because the fixed files
+        are deleted along with the temp directory.
+
+        @type dirPath: unicode
+
+        @type signature: list
+
+        @type metadata: dict
+
+        """
+        tempDirPath = unicode(metadata['tempDir'].absolutePath())
+        for audioFile in metadata['audioFiles']:
+            if unicode(audioFile).startswith(tempDirPath):
+                return
+        cachedMetadata = dict([
+            (key, value) for key, value in metadata.iteritems()
+            if key not in ('dir', 'tempDir')
+        ])
+        getSettings().setCachedScan(dirPath, signature, cachedMetadata)
+
+    def restoreCachedMetadata(self, metadata, dirPath, snapshot):
+        """
+        Recreate the Qt objects and temp files missing from cached metadata.
+
+        @type metadata: dict
+
+        @type dirPath: unicode
+
+        @type snapshot: DirSnapshot
+
+        @rtype: dict
+
+        """
+        metadata['dir'] = QDir(dirPath)
+        metadata['tempDir'] = QDir(
+            getSettings().settingsDir + '/' + metadata['hash']
+        )
+        if not metadata['tempDir'].exists():
+            metadata['tempDir'].mkpath(metadata['tempDir'].absolutePath())
+        # The identicon and visicon live in the temp directory
+        if metadata['cover'] != u'No Cover Art' \
+                and not os.path.exists(metadata['cover']):
+            with StageTimer(self.timings, 'cover'):
+                metadata['cover'] = CoverArtRetriever \
+                    .getCoverImageChoices(metadata, True, snapshot)[0]
+        return metadata
+
     def fixBadFlacFiles(self, metadata):
         """
         Fix FLAC files that are malformed because they contain ID3 tags.
@@ -270,64 +524,78 @@ class LoadShowsThread(QThread):
         temporary fixed versions.
 
         """
-        parent = self.parent()        
-        for index, audioFile in enumerate(metadata['audioFiles']):
-            if self.stopped:
-                return
-            self.updateProgress(
-                'Loading %s\n\nFixing malformed FLACs (%d\%d)'
-                % (self.basename, index+1, len(metadata['audioFiles'])),
-            )
-            audioObj = audiotools.open(audioFile)            
-            if isinstance(audioObj, tracklint.BrokenFlacAudio):
-                tempFilePath = unicode(
-                    metadata['tempDir'].absolutePath()
-                ) + u'/%d.flac' % index
-                if platform.system() == 'Darwin':                    
-                    self.process = Process(
-                        target=self.fixFlacProcess,
-                        args=(tempFilePath, audioObj)
-                    )
-                    self.process.start()
-                    while self.process.is_alive():
-                        pass                    
-                else:
-                    self.fixFlacProcess(tempFilePath, audioObj)
-                metadata['audioFiles'][index] = (tempFilePath)
-
-    def fixFlacProcess(self, tempFilePath, audioObj):
+        try:
+            for index, audioFile in enumerate(metadata['audioFiles']):
+                if self.stopped:
+                    return
+                self.updateProgress(
+                    'Loading %s\n\nFixing malformed FLACs (%d\%d)'
+                    % (self.basename, index+1, len(metadata['audioFiles'])),
+                )
+                audioObj = audiotools.open(audioFile)
+                if isinstance(audioObj, tracklint.BrokenFlacAudio):
+                    tempFilePath = unicode(
+                        metadata['tempDir'].absolutePath()
+                    ) + u'/%d.flac' % index
+                    if platform.system() == 'Darwin':
+                        self.fixFlacInWorker(tempFilePath, audioFile)
+                    else:
+                        fixFlac(tempFilePath, audioFile)
+                    metadata['audioFiles'][index] = (tempFilePath)
+        finally:
+            with QMutexLocker(self.mutex):
+                pool = getattr(self.local, 'pool', None)
+                self.local.pool = None
+                if pool is not None:
+                    self.pools.remove(pool)
+            if pool is not None:
+                pool.close()
+
+    def fixFlacInWorker(self, tempFilePath, audioFilePath):
         """
-        Fix a malformed FLAC.
+        Fix a malformed FLAC in a separate process, reusing the same one
+        for each file of the recording being loaded in the current thread.
+        Returns once the file is fixed or the thread is stopped.
+
+        @type tempFilePath: unicode
+
+        @type audioFilePath: unicode
 
         """
-        audioObj.fix_id3_preserve_originals(tempFilePath)
+        with QMutexLocker(self.mutex):
+            if self.stopped:
+                return
+            if getattr(self.local, 'pool', None) is None:
+                self.local.pool = WorkerPool(1)
+                self.pools.append(self.local.pool)
+            pool = self.local.pool
+        pool.submit(fixFlac, [tempFilePath, audioFilePath])
+        # Wake up now and then to notice being canceled
+        while not pool.wait(0.5):
+            if self.stopped:
+                return
 
-    def getMd5s(self, qDir):
+    def getMd5s(self, snapshot):
         """
-        Look for a .md5 file in qDir and if find return a list of the sums
-        within.  Otherwise, return an empty list.
+        Look for a .md5 file in the snapshot and if find return a list of
+        the sums within.  Otherwise, return an empty list.
 
-        @type qDir: QDir
-        @param qDir: The directory containing the show.
+        @type snapshot: DirSnapshot
+        @param snapshot: The directory containing the show.
 
         @rtype: list
         @returnL A list of MD5 sums.
 
         """
-        parent = self.parent()
-        qDir.setNameFilters(['*.md5'])
-        if qDir.entryList():
-            filePath = qDir.absolutePath() + '/' + qDir.entryList()[0]
+        md5Files = snapshot.getFiles(['*.md5'])
+        if md5Files:
+            filePath = snapshot.filePath(md5Files[0])
             try:
-                fileHandle = parent.openFileOfUnknownEncoding(filePath)
-                txt = fileHandle.read()
+                txt = readFileOfUnknownEncoding(filePath)
                 md5s = self.parseForMd5s(txt)
             except UnicodeDecodeError as e:
                 # Getting hashes isn't essential, so just carry on.
                 md5s = []
-            finally:
-                if 'fileHandle' in locals():
-                    fileHandle.close()
         else:
             md5s = []
         return [md5.lower() for md5 in md5s]
@@ -335,7 +603,8 @@ class LoadShowsThread(QThread):
     def checkMd5s(self, md5s, filePaths):
         """
         Check MD5s and return a list of file paths for the files whose hashes
-        don't match.
+        don't match.  Files which are unchanged since they were last checked
+        are not hashed again, unless the reverifyMd5Hashes setting is on.
 
         @type md5s: list
         @param md5s: A list of unicode objects.
@@ -344,28 +613,198 @@ class LoadShowsThread(QThread):
         @param filePaths: A list of QStrings.
 
         """
+        settings = getSettings()
         mismatches = []
-        for index, expected in enumerate(md5s):            
+        pairs = zip(md5s, filePaths)
+        if settings['reverifyMd5Hashes']:
+            actualMd5s = [None] * len(pairs)
+        else:
+            actualMd5s = [
+                settings.getCachedMd5(unicode(filePath))
+                for expected, filePath in pairs
+            ]
+        uncachedPaths = [
+            filePath for (expected, filePath), actual
+            in zip(pairs, actualMd5s) if actual is None
+        ]
+        if not uncachedPaths:
+            hashedMd5s = iter([])
+        else:
+            pool = self.getMd5Pool()
+            if pool is None:
+                return
+            hashedMd5s = pool.imap(self.getFileMd5, uncachedPaths)
+        for index, (expected, audioFileAtIndex) in enumerate(pairs):
             if self.stopped:
                 return
             self.updateProgress(
                 'Loading %s\n\nChecking MD5 hashes (%d\%d)'
                 % (self.basename, index+1, len(md5s)),
             )
-            if len(filePaths) < (index + 1):
-                break
-            audioFileAtIndex = filePaths[index]
-            handle = open(
-                audioFileAtIndex,
-                'rb'
-            )
-            fileContent = handle.read()
-            handle.close
-            actual = hashlib.md5(fileContent).hexdigest()
+            actual = actualMd5s[index]
+            if actual is None:
+                actual = hashedMd5s.next()
+                if actual is None:
+                    return
+                settings.setCachedMd5(unicode(audioFileAtIndex), actual)
             if expected.lower() != actual.lower():
                 mismatches.append(audioFileAtIndex)
         return mismatches
 
+    def getMd5Pool(self):
+        """
+        Get the pool of threads which hash files for checkMd5s(), starting
+        it the first time.  Several files are hashed at once, and hashlib
+        releases the GIL while hashing, so threads are enough.  The one pool
+        is shared by every directory being loaded, so that there are never
+        more hashing threads than CPUs.
+
+        @rtype: ThreadPool
+        @return: The pool, or None if the thread is stopped
+
+        """
+        with QMutexLocker(self.mutex):
+            if self.stopped:
+                return None
+            if self.md5Pool is None:
+                try:
+                    size = multiprocessing.cpu_count()
+                except NotImplementedError:
+                    size = 1
+                self.md5Pool = ThreadPool(size)
+            return self.md5Pool
+
+    def getFileMd5(self, filePath):
+        """
+        Hash a file, giving up if the thread is stopped.
+
+        @type filePath: QString
+
+        @rtype: str
+        @return: The hex digest of the file's MD5 hash, or None if stopped
+
+        """
+        return getFileMd5(filePath, lambda: self.stopped)
+
+    def getFfps(self, snapshot):
+        """
+        Look for a .ffp file in the snapshot and if found return the FLAC
+        fingerprints within.  Otherwise, return an empty dict.
+
+        @type snapshot: DirSnapshot
+        @param snapshot: The directory containing the show.
+
+        @rtype: dict
+        @return: Lowercase file names mapped to their fingerprints
+
+        """
+        ffpFiles = snapshot.getFiles(['*.ffp'])
+        if not ffpFiles:
+            return {}
+        filePath = snapshot.filePath(ffpFiles[0])
+        try:
+            txt = readFileOfUnknownEncoding(filePath)
+            ffps = self.parseForFfps(txt)
+        except UnicodeDecodeError as e:
+            # Getting fingerprints isn't essential, so just carry on.
+            ffps = {}
+        return ffps
+
+    def parseForFfps(self, txt):
+        """
+        Return the FLAC fingerprints found in the text of a .ffp file, which
+        has a "name.flac:fingerprint" line for each file.
+
+        @type txt: unicode
+        @param txt: The text to parse for fingerprints
+
+        @rtype: dict
+        @return: Lowercase file names mapped to lowercase fingerprints
+
+        """
+        matches = re.findall(
+            '^\s*(.+\.flac)\s*:\s*([0-9a-f]{32})\s*$',
+            txt,
+            re.IGNORECASE | re.MULTILINE
+        )
+        return dict([
+            (os.path.basename(name.replace('\\', '/')).lower(), ffp.lower())
+            for name, ffp in matches
+        ])
+
+    def checkFfps(self, ffps, filePaths):
+        """
+        Check FLAC fingerprints against the MD5 stored in each FLAC's
+        STREAMINFO block, and return a list of file paths for the files
+        whose fingerprints don't match.  Only the header of each file is
+        read, unless the decodeFlacFingerprints setting is on, in which case
+        the audio is also decoded to check that it matches the STREAMINFO.
+
+        @type ffps: dict
+        @param ffps: Fingerprints as returned by parseForFfps()
+
+        @type filePaths: list
+        @param filePaths: A list of unicode objects.
+
+        """
+        mismatches = []
+        for index, filePath in enumerate(filePaths):
+            if self.stopped:
+                return
+            expected = ffps.get(os.path.basename(filePath).lower())
+            if expected is None:
+                continue
+            self.updateProgress(
+                'Loading %s\n\nChecking FLAC fingerprints (%d\%d)'
+                % (self.basename, index+1, len(filePaths)),
+            )
+            try:
+                audioObj = audiotools.open(filePath)
+            except (audiotools.UnsupportedFile, IOError):
+                mismatches.append(filePath)
+                continue
+            if not isinstance(audioObj, audiotools.FlacAudio):
+                continue
+            actual = audioObj.__md5__.encode('hex')
+            if actual != expected:
+                mismatches.append(filePath)
+            elif getSettings()['decodeFlacFingerprints']:
+                decoded = self.getDecodedMd5(audioObj)
+                if decoded is None:
+                    return
+                if decoded != actual:
+                    mismatches.append(filePath)
+        return mismatches
+
+    def getDecodedMd5(self, audioObj):
+        """
+        Decode a FLAC and hash its audio the way the encoder did for the
+        STREAMINFO block, giving up if the thread is stopped.
+
+        @type audioObj: audiotools.FlacAudio
+
+        @rtype: str
+        @return: The hex digest of the decoded audio, or None if stopped
+
+        """
+        md5 = hashlib.md5()
+        pcmReader = audioObj.to_pcm()
+        try:
+            frameList = pcmReader.read(audiotools.BUFFER_SIZE)
+            while len(frameList) > 0:
+                if self.stopped:
+                    return None
+                md5.update(frameList.to_bytes(False, True))
+                frameList = pcmReader.read(audiotools.BUFFER_SIZE)
+        except (audiotools.DecodingError, ValueError):
+            return ''
+        finally:
+            try:
+                pcmReader.close()
+            except audiotools.DecodingError:
+                pass
+        return md5.hexdigest()
+
     def parseForMd5s(self, txt):
         """
         Return a list of all the MD5 hashes found in the specified file.
@@ -383,15 +822,15 @@ class LoadShowsThread(QThread):
 
     def stop(self):
         """
-        Stop the thread from executing, as if it had been canceled.
+        Stop the thread from executing, as if it had been canceled.  The
+        worker processes are terminated, and the loading threads give up at
+        the next chance they get, after which run() returns.
 
         """        
         with QMutexLocker(self.mutex):
             self.stopped = True
-        if platform.system() == 'Darwin' \
-                and hasattr(self, 'process') \
-                and self.process.is_alive():            
-            self.process.terminate()            
+            for pool in self.pools:
+                pool.terminate()
 
     def fail(self, errorMsg):
         """
@@ -415,10 +854,10 @@ class LoadShowsThread(QThread):
         @type value: int
 
         """
-        if not hasattr(self.parent(), 'progressDialog'):
-            return
         if value is None:
-            value = self.parent().progressDialog.value()
+            value = self.progressValue
+        else:
+            self.progressValue = value
         self.emit(
             SIGNAL("progress(int, QString)"),
             value,
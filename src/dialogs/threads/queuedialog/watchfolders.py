@@ -0,0 +1,235 @@
+"""
+Watch folders for new recordings.
+
+Copyright (C) 2010 Zachary Chavez
+BootTunes is licensed under the GPLv2.
+http://www.gnu.org/licenses/gpl-2.0.html
+"""
+from PyQt4.QtCore import *
+from dialogs.exceptions import QueueDialogError
+from dialogs.threads.queuedialog.loadshows import LoadShowsThread
+from settings import getSettings
+from shows import DirSnapshot
+import os
+import time
+
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None
+
+class WatchFoldersThread(QThread):
+    """
+    Watch folders, such as where finished downloads are saved, for new
+    recordings.  Once a folder that has appeared in one of them has gone
+    unchanged for the watchQuietSeconds setting, it is loaded and sent
+    with a loaded(PyQt_PyObject) signal.  Folders which were already there
+    when watching started are left alone.  A folder which can't be loaded,
+    such as a download whose txt hasn't arrived yet, is tried again once it
+    changes.
+
+    Changes are noticed through inotify if pyinotify is installed.
+    Otherwise the watched folders are listed every pollSeconds, and only
+    the files of folders which have not been loaded yet are checked.
+
+    """
+    pollSeconds = 5
+
+    def __init__(self, lock, parent, watchFolders):
+        """
+        @type watchFolders: list
+        @param watchFolders: A list of unicode paths
+
+        """
+        super(WatchFoldersThread, self).__init__(parent)
+        self.lock = lock
+        self.stopped = False
+        self.mutex = QMutex()
+        self.watchFolders = [
+            os.path.abspath(unicode(watchFolder))
+            for watchFolder in watchFolders
+        ]
+        self.knownDirs = set()
+        self.pendingDirs = {}
+        """Paths of folders waiting to be loaded, mapped to dicts with the
+           keys 'changed', the time of the last change seen, and
+           'signature', the last DirSnapshot signature when polling"""
+        self.failedDirs = {}
+        """Paths of folders which couldn't be loaded, mapped to their
+           DirSnapshot signatures at the time"""
+        self.loadedDirs = set()
+        self.loader = LoadShowsThread(lock, parent, [])
+        """Only used for its getMetadataFromDir() method"""
+
+    def run(self):
+        for watchFolder in self.watchFolders:
+            self.knownDirs.update(self.getDirs(watchFolder))
+        if pyinotify is not None:
+            self.watchWithInotify()
+        else:
+            self.watchByPolling()
+
+    def getDirs(self, watchFolder):
+        """
+        @type watchFolder: unicode
+
+        @rtype: list
+        @return: The paths of the folders directly within watchFolder
+
+        """
+        try:
+            names = os.listdir(watchFolder)
+        except OSError:
+            return []
+        return [
+            os.path.join(watchFolder, name) for name in names
+            if not name.startswith('.')
+            and os.path.isdir(os.path.join(watchFolder, name))
+        ]
+
+    def watchByPolling(self):
+        """
+        Look for new folders and changes to the files in them every
+        pollSeconds, until stopped.
+
+        """
+        while not self.isStopped():
+            now = time.time()
+            for watchFolder in self.watchFolders:
+                for dir in self.getDirs(watchFolder):
+                    if dir not in self.knownDirs:
+                        self.knownDirs.add(dir)
+                        self.pendingDirs[dir] = {
+                            'changed'  : now,
+                            'signature': None
+                        }
+            for dir, pending in self.pendingDirs.iteritems():
+                signature = DirSnapshot(dir).getSignature()
+                if signature != pending['signature']:
+                    pending['signature'] = signature
+                    pending['changed'] = now
+            for dir, signature in self.failedDirs.items():
+                if DirSnapshot(dir).getSignature() != signature:
+                    self.retryDir(dir, now)
+            self.loadQuietDirs()
+            # Wake up now and then to notice being stopped
+            for i in range(self.pollSeconds * 5):
+                if self.isStopped():
+                    return
+                self.msleep(200)
+
+    def watchWithInotify(self):
+        """
+        Wait for the kernel to report changes in the watched folders,
+        until stopped.
+
+        """
+        watchManager = pyinotify.WatchManager()
+        mask = pyinotify.IN_CREATE | pyinotify.IN_DELETE \
+            | pyinotify.IN_MODIFY | pyinotify.IN_CLOSE_WRITE \
+            | pyinotify.IN_MOVED_TO | pyinotify.IN_MOVED_FROM
+        for watchFolder in self.watchFolders:
+            watchManager.add_watch(watchFolder, mask, rec=True, auto_add=True)
+        notifier = pyinotify.Notifier(
+            watchManager,
+            self.processEvent,
+            timeout=1000
+        )
+        try:
+            while not self.isStopped():
+                if notifier.check_events():
+                    notifier.read_events()
+                    notifier.process_events()
+                self.loadQuietDirs()
+        finally:
+            notifier.stop()
+
+    def processEvent(self, event):
+        """
+        Note the time of a change to a folder within a watched folder.
+
+        @type event: pyinotify.Event
+
+        """
+        for watchFolder in self.watchFolders:
+            if not event.pathname.startswith(watchFolder + os.sep):
+                continue
+            relativePath = event.pathname[len(watchFolder + os.sep):]
+            dir = os.path.join(watchFolder, relativePath.split(os.sep)[0])
+            if dir not in self.knownDirs:
+                if not os.path.isdir(dir) or os.path.basename(dir) \
+                        .startswith('.'):
+                    return
+                self.knownDirs.add(dir)
+                self.pendingDirs[dir] = {'signature': None}
+            if dir in self.failedDirs:
+                self.retryDir(dir, time.time())
+            if dir in self.pendingDirs:
+                self.pendingDirs[dir]['changed'] = time.time()
+            return
+
+    def loadQuietDirs(self):
+        """
+        Load each new folder which has gone unchanged for long enough.
+        Folders which aren't a recording, but contain other folders, are
+        treated as if those folders were new.  Folders which can't be loaded
+        are kept in failedDirs until they change.
+
+        """
+        now = time.time()
+        quietSeconds = getSettings()['watchQuietSeconds']
+        for dir, pending in sorted(self.pendingDirs.items()):
+            if self.isStopped():
+                return
+            if now - pending['changed'] < quietSeconds:
+                continue
+            del self.pendingDirs[dir]
+            if not os.path.isdir(dir):
+                continue
+            signature = DirSnapshot(dir).getSignature()
+            try:
+                metadata = self.loader.getMetadataFromDir(dir)
+            except QueueDialogError:
+                self.failedDirs[dir] = signature
+                for subDir in self.getDirs(dir):
+                    if subDir in self.loadedDirs \
+                            or subDir in self.failedDirs:
+                        continue
+                    self.pendingDirs[subDir] = {
+                        'changed'  : pending['changed'],
+                        'signature': None
+                    }
+                continue
+            self.loadedDirs.add(dir)
+            if metadata is not None and not self.isStopped():
+                self.emit(SIGNAL("loaded(PyQt_PyObject)"), metadata)
+
+    def retryDir(self, dir, changed):
+        """
+        Move a folder which couldn't be loaded back to pendingDirs, so that
+        it is tried again once it has gone unchanged for long enough.
+
+        @type dir: unicode
+
+        @type changed: float
+        @param changed: The time of the change
+
+        """
+        del self.failedDirs[dir]
+        self.pendingDirs[dir] = {
+            'changed'  : changed,
+            'signature': None
+        }
+
+    def stop(self):
+        """
+        Stop watching.
+
+        """
+        with QMutexLocker(self.mutex):
+            self.stopped = True
+        self.loader.stop()
+
+    def isStopped(self):
+        with QMutexLocker(self.mutex):
+            return self.stopped
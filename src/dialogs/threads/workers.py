@@ -0,0 +1,233 @@
+"""
+A pool of long-lived worker processes for threads which run work outside
+of the main process.
+
+Copyright (C) 2010 Zachary Chavez
+BootTunes is licensed under the GPLv2.
+http://www.gnu.org/licenses/gpl-2.0.html
+"""
+import traceback
+import Queue
+from multiprocessing import Process, Pipe
+from multiprocessing import Queue as ProcessQueue
+
+currentTask = None
+"""The id of the task running in this worker process, if any, and the
+   messages queue to report its progress on"""
+
+def reportProgress(fraction):
+    """
+    Report how much of the task running in this worker process is done,
+    as returned by WorkerPool.getProgress().  Does nothing outside of a
+    worker process, so that tasks can also be run directly.
+
+    @type fraction: float
+    @param fraction: From 0 to 1
+
+    """
+    if currentTask is not None:
+        taskId, messages = currentTask
+        messages.put((taskId, 'progress', fraction))
+
+def workerLoop(connection, messages):
+    """
+    The main loop of a worker process.  Receive (taskId, function, args)
+    tuples on connection and run them until None is received, reporting
+    each task's outcome on the messages queue.
+
+    @type connection: multiprocessing.Connection
+
+    @type messages: multiprocessing.Queue
+
+    """
+    global currentTask
+    while True:
+        try:
+            task = connection.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        taskId, function, args = task
+        currentTask = (taskId, messages)
+        try:
+            function(*args)
+        except Exception:
+            messages.put((taskId, 'failed', traceback.format_exc()))
+        else:
+            messages.put((taskId, 'done', None))
+        finally:
+            currentTask = None
+
+class WorkerPool:
+    """
+    Run tasks in up to a fixed number of worker processes, which are
+    started as they are first needed and then kept for later tasks.
+
+    A task is a module-level function and a list of arguments, both of
+    which must be picklable.  Results are not returned, only whether the
+    task finished or failed.  Waiting for tasks blocks rather than polls,
+    and a worker which dies in the middle of a task is replaced and its
+    task reported as failed.  Tasks may report how far along they are with
+    reportProgress().
+
+    """
+    def __init__(self, size):
+        """
+        @type size: int
+        @param size: The maximum number of worker processes
+
+        """
+        self.size = size
+        self.messages = ProcessQueue()
+        self.workers = []
+        """A list of dicts holding each worker's process, connection, and
+           the id of the task it is running, if any"""
+        self.nextTaskId = 0
+        self.progress = {}
+        """Task ids mapped to the progress they last reported"""
+
+    def getIdleCount(self):
+        """
+        @rtype: int
+        @return: The number of tasks which can be submitted without waiting
+
+        """
+        busyCount = len([
+            worker for worker in self.workers if worker['taskId'] is not None
+        ])
+        return self.size - busyCount
+
+    def submit(self, function, args):
+        """
+        Run function(*args) on an idle worker, starting one if needed.
+
+        @type function: function
+
+        @type args: list
+
+        @rtype: int
+        @return: The id of the task, as reported by wait()
+
+        """
+        idleWorkers = [
+            worker for worker in self.workers if worker['taskId'] is None
+        ]
+        if idleWorkers:
+            worker = idleWorkers[0]
+        elif len(self.workers) < self.size:
+            worker = self.startWorker()
+        else:
+            raise RuntimeError('No idle workers')
+        taskId = self.nextTaskId
+        self.nextTaskId += 1
+        worker['connection'].send((taskId, function, args))
+        worker['taskId'] = taskId
+        return taskId
+
+    def startWorker(self):
+        """
+        @rtype: dict
+        @return: The new worker
+
+        """
+        connection, workerConnection = Pipe()
+        process = Process(
+            target=workerLoop,
+            args=(workerConnection, self.messages)
+        )
+        process.start()
+        worker = {
+            'process'   : process,
+            'connection': connection,
+            'taskId'    : None
+        }
+        self.workers.append(worker)
+        return worker
+
+    def getProgress(self, taskId):
+        """
+        @type taskId: int
+
+        @rtype: float
+        @return: The progress the running task last reported, as of the last
+        wait(), or None if it hasn't reported any
+
+        """
+        return self.progress.get(taskId)
+
+    def wait(self, timeout=None):
+        """
+        Block until at least one task has finished or reported progress, or
+        until timeout seconds have passed.
+
+        @type timeout: float
+        @param timeout: Seconds to wait, or None to wait indefinitely
+
+        @rtype: list
+        @return: A (taskId, status, details) tuple for each finished task,
+        where status is "done" or "failed"
+
+        """
+        messages = []
+        try:
+            messages.append(self.messages.get(True, timeout))
+            while True:
+                messages.append(self.messages.get_nowait())
+        except Queue.Empty:
+            pass
+
+        finished = []
+        for taskId, status, details in messages:
+            if status == 'progress':
+                self.progress[taskId] = details
+                continue
+            finished.append((taskId, status, details))
+            self.progress.pop(taskId, None)
+            for worker in self.workers:
+                if worker['taskId'] == taskId:
+                    worker['taskId'] = None
+
+        # A worker which was killed or crashed never reports back
+        if not finished:
+            for worker in list(self.workers):
+                if worker['process'].is_alive():
+                    continue
+                if worker['taskId'] is not None:
+                    finished.append((
+                        worker['taskId'],
+                        'failed',
+                        'Worker exited with code %s' % \
+                            worker['process'].exitcode
+                    ))
+                    self.progress.pop(worker['taskId'], None)
+                worker['connection'].close()
+                self.workers.remove(worker)
+        return finished
+
+    def terminate(self):
+        """
+        Stop all workers immediately, abandoning any running tasks.
+
+        """
+        for worker in self.workers:
+            if worker['process'].is_alive():
+                worker['process'].terminate()
+
+    def close(self):
+        """
+        Stop all workers once their current tasks are done, and wait for
+        them to exit.
+
+        """
+        for worker in self.workers:
+            if worker['process'].is_alive():
+                try:
+                    worker['connection'].send(None)
+                except IOError:
+                    pass
+        for worker in self.workers:
+            worker['process'].join()
+            worker['connection'].close()
+        self.workers = []
+        self.progress = {}
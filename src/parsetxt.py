@@ -6,24 +6,25 @@ Copyright (C) 2010 Zachary Chavez
 BootTunes is licensed under the GPLv2.
 http://www.gnu.org/licenses/gpl-2.0.html
 """
+import os
 import re
+import copy
+import string
+import hashlib
 import datetime
 import json
 import urllib2
+import cPickle
+import threading
+import multiprocessing
 import data
 
-# Load JSON files with city, state, and country names into global variables.
-# Try to get cities list from the web first, falling back to the local json file.
+# Load JSON files with state, province, and country names into global variables.
+# The much longer cities list is only loaded when first needed, by
+# getCityIndex().
 jsonPath = data.path + '/' + 'json' + '/'
-try:
-    jsonString = urllib2.urlopen(
-        'http://boottunes.googlecode.com/svn/trunk/src/data/json/common-cities.json',
-        timeout=3
-    ).read()
-    cities = json.loads(jsonString)    
-except:
-    fileCities = open(jsonPath + 'common-cities.json')
-    cities = json.loads(fileCities.read())    
+citiesUrl = \
+    'http://boottunes.googlecode.com/svn/trunk/src/data/json/common-cities.json'
 
 fileStates = open(jsonPath + 'states.json')
 fileProvinces = open(jsonPath + 'provinces.json')
@@ -35,13 +36,331 @@ fileStates.close()
 fileProvinces.close()
 fileCountries.close()
 
+class CityIndex(object):
+    """
+    Find which of the common cities are mentioned in a text with a single
+    scan, rather than a search per city.  The cities are held in a trie of
+    their characters, which is walked from the start of each word.  The
+    patterns used to find the state, province, or country after a city
+    name are compiled once, the first time the city is found.
+    """
+    wordChars = frozenset(string.ascii_letters + string.digits + '_')
+    """The characters matched by \\w"""
+
+    def __init__(self, cities):
+        """
+        @type cities: dict
+        @param cities: The contents of common-cities.json
+        """
+        self.cities = []
+        """(city, cityDetails) tuples in the order of cities.iteritems()"""
+        self.trie = {}
+        """Nested dicts keyed by character.  The key None holds the
+           position in self.cities of the city ending at that node"""
+        self.qualifierPatterns = {}
+        for position, (city, cityDetails) in enumerate(cities.iteritems()):
+            self.cities.append((city, cityDetails))
+            node = self.trie
+            for char in city:
+                node = node.setdefault(char, {})
+            node[None] = position
+
+    def findCities(self, text):
+        """
+        Find the cities which appear in text as whole words, not at the very
+        start of the text, as the pattern '\W(city)(\W|\Z)' would.
+
+        @type text: unicode
+
+        @rtype: list
+        @return: (city, cityDetails) tuples in the order of cities.iteritems()
+        """
+        wordChars = self.wordChars
+        found = set()
+        textLength = len(text)
+        for start in xrange(1, textLength):
+            if text[start - 1] in wordChars:
+                continue
+            node = self.trie
+            end = start
+            while end < textLength and text[end] in node:
+                node = node[text[end]]
+                end += 1
+                if None in node and (
+                    end == textLength or text[end] not in wordChars
+                ):
+                    found.add(node[None])
+        return [self.cities[position] for position in sorted(found)]
+
+    def getQualifierPattern(self, city, key, code):
+        """
+        Get the compiled pattern matching city followed by the name or code
+        of one of its states, provinces, or countries.
+
+        @type city: unicode
+
+        @type key: string
+        @param key: "state", "province", or "country"
+
+        @type code: unicode
+        @param code: The state, province, or country code
+
+        @rtype: re.RegexObject
+        """
+        if (city, key, code) in self.qualifierPatterns:
+            return self.qualifierPatterns[(city, key, code)]
+        if key == 'province':
+            pattern = city + "[,\s]*" + provinces[code] + "|" \
+                    + city + "[,\s]*" + code + "|" + city + "[,\s]*Canada"
+        elif key == 'state':
+            pattern = city + "[,\s]*" + states[code] + "|" \
+                    + city + "[,\s]*" + code
+        else:
+            pattern = city + "[,\s]*" + countries[code] + "|" \
+                    + city + "[,\s]*" + code
+        compiled = re.compile(pattern, re.IGNORECASE)
+        self.qualifierPatterns[(city, key, code)] = compiled
+        return compiled
+
+CITY_INDEX_VERSION = 1
+"""Increment when CityIndex changes, so that pickled indexes are rebuilt"""
+
+cacheDir = None
+"""The folder holding the downloaded cities list and the pickled index of
+   whichever list is in use.  Set with setCacheDir()"""
+
+cityIndex = None
+cityIndexLock = threading.Lock()
+
+def setCacheDir(path):
+    """
+    Set the folder where the cities list is cached.  Until this is called,
+    only the cities list bundled with BootTunes is used, and nothing is
+    written to disk.
+
+    @type path: unicode
+    """
+    global cacheDir, cityIndex
+    with cityIndexLock:
+        cacheDir = path
+        cityIndex = None
+
+def getCitiesSignature():
+    """
+    @rtype: tuple
+    @return: The CityIndex version and the path, size, and modification time
+             of the cities list in use, which change if either does.
+    """
+    citiesPath = getCitiesPath()
+    stat = os.stat(citiesPath)
+    return (CITY_INDEX_VERSION, citiesPath, stat.st_size, stat.st_mtime)
+
+def getCitiesPath():
+    """
+    @rtype: unicode
+    @return: The path of the downloaded cities list if there is one,
+             otherwise the path of the bundled one.
+    """
+    if cacheDir is not None:
+        downloadedPath = os.path.join(cacheDir, 'common-cities.json')
+        if os.path.exists(downloadedPath):
+            return downloadedPath
+    return jsonPath + 'common-cities.json'
+
+def getCityIndex():
+    """
+    Get the CityIndex, loading it on the first call.  The index is read from
+    its pickle in cacheDir if that was made from the current cities list,
+    and is otherwise built from the list and pickled for next time.
+
+    @rtype: CityIndex
+    """
+    global cityIndex
+    with cityIndexLock:
+        if cityIndex is not None:
+            return cityIndex
+        signature = getCitiesSignature()
+        citiesPath = signature[1]
+        indexPath = os.path.join(cacheDir, 'common-cities.index') \
+            if cacheDir is not None else None
+        if indexPath and os.path.exists(indexPath):
+            try:
+                fileIndex = open(indexPath, 'rb')
+                try:
+                    cachedSignature, index = cPickle.load(fileIndex)
+                finally:
+                    fileIndex.close()
+                if cachedSignature == signature:
+                    cityIndex = index
+                    return cityIndex
+            except Exception:
+                pass
+        fileCities = open(citiesPath)
+        index = CityIndex(json.loads(fileCities.read()))
+        fileCities.close()
+        if indexPath:
+            try:
+                fileIndex = open(indexPath, 'wb')
+                cPickle.dump(
+                    (signature, index), fileIndex, cPickle.HIGHEST_PROTOCOL
+                )
+                fileIndex.close()
+            except IOError:
+                pass
+        cityIndex = index
+        return cityIndex
+
+def refreshCities(timeout=10):
+    """
+    Download the latest cities list into cacheDir.  The new list is used
+    from the next call to getCityIndex() on.  Does nothing if setCacheDir()
+    hasn't been called.
+
+    @type timeout: int
+    @param timeout: Seconds to wait for the download
+
+    @rtype: bool
+    @return: Whether a new list was downloaded
+    """
+    global cityIndex
+    if cacheDir is None:
+        return False
+    try:
+        jsonString = urllib2.urlopen(citiesUrl, timeout=timeout).read()
+        if not isinstance(json.loads(jsonString), dict):
+            return False
+    except Exception:
+        return False
+    downloadedPath = os.path.join(cacheDir, 'common-cities.json')
+    with cityIndexLock:
+        try:
+            fileCities = open(downloadedPath, 'rb')
+            unchanged = fileCities.read() == jsonString
+            fileCities.close()
+        except IOError:
+            unchanged = False
+        if unchanged:
+            return False
+        try:
+            fileCities = open(downloadedPath, 'wb')
+            fileCities.write(jsonString)
+            fileCities.close()
+        except IOError:
+            return False
+        cityIndex = None
+    return True
+
+def refreshCitiesInBackground():
+    """
+    Call refreshCities() in a daemon thread, so that a slow or missing
+    network connection never holds anything up.
+
+    @rtype: threading.Thread
+    """
+    thread = threading.Thread(target=refreshCities)
+    thread.daemon = True
+    thread.start()
+    return thread
+
+# Patterns used to find the tracklist, compiled once rather than per file
+tracklistSegmentPattern = re.compile(r"""
+    (
+        ^[\t\s]*           # May start with whitespace
+        (?:                # Begin of optional prefix
+            (?:\d{3}-)?      # Prefix may start 101, 201, etc.
+            d\dt           # May contain prefix d1t, d2t, etc.
+        )?                 # End of optional prefix
+        [0-9]{1,3}         # One or two numbers
+        [\W]               # Some sort of separator
+        (.*)               # The actual track name
+        $                  # The end of the line
+        \n?                # Doesn't work right without this.  Not sure why.
+    ){1,}                  # 1 or more track lines
+""", re.MULTILINE | re.VERBOSE)
+md5Pattern = re.compile('[0-9a-f]{32}', re.IGNORECASE)
+trackNumberPattern = re.compile('(?:(?:\d{3}-)?d\dt)?\d?(\d{1,2}).*')
+trackTimePattern = r"""
+    (
+        [([]?          # Possible opening enclosures
+        \d{1,2}        # Minutes, with optional opening 0
+        [:\']          # Colon separator or ' minutes symbol
+        [0-6][0-9]     # Minutes
+        (?:\.\d{2})?   # Possible hundredths of seconds
+        (?:"|'')?      # Possible " seconds symbol (may be made up of 2 apostrophes)
+        [)\]]?         # Possible closing enclosure
+    )
+    """
+# Filter out the track numbers and, if present, track times, to get just the titles
+trackTitlePattern = re.compile(r"""^(?:(?:\d{3}-)?d\dt)?              # Possible prefix like d1t01 or 101-d1t01
+              [\t\s]*[0-9]{1,3}[ .\-:)]*         # Track number, separator, and whitespace
+              """ + trackTimePattern + """?      # Track time if present before the title
+              (.*?)                              # The actual title
+              (?:[ -]*?)                         # White space or dash separator
+              """ + trackTimePattern + """?\s*$  # Track time if present after the title""",
+    re.MULTILINE | re.VERBOSE
+)
+
 class TxtParser(object):
     "Parse text from a text file for metadata"
 
+    dependents = {
+        'txt'         : ['date', 'artist', 'searchedText', 'tracklistStr',
+                         'venue'],
+        'date'        : ['artist', 'searchedText', 'tracklist'],
+        'artist'      : ['searchedText'],
+        'searchedText': ['location', 'locationAsIs', 'venue'],
+        'location'    : ['venue'],
+        'locationAsIs': ['venue'],
+        'tracklistStr': ['tracklist']
+    }
+    """The txt and each result kept by the _find methods, mapped to the
+       results found using them"""
+
     def __init__(self, txt):        
         # For reasons unknown, some text files may use just \r for newlines.
         # Normlize all newlines to \n for simplicity.
-        self.txt = txt.replace('\r\n', '\n').replace('\r', '\n')        
+        self.txt = normalizeNewlines(txt)
+
+    def setField(self, field, value):
+        """
+        Replace the txt, or set a result which would otherwise be found in it,
+        such as the artist.  Results found using the old value are discarded
+        and found again when next needed.  The rest are kept.
+
+        @type  field: string
+        @param field: "txt" or another key of self.dependents
+        @type  value: unicode
+        """
+        if field == 'txt':
+            value = normalizeNewlines(value)
+        if hasattr(self, field) and getattr(self, field) == value:
+            return
+        self._discardDependents(field)
+        setattr(self, field, value)
+
+    def _discardDependents(self, field):
+        """
+        Discard the results found using field, and those found using them.
+
+        @type field: string
+        """
+        for dependent in self.dependents.get(field, []):
+            if hasattr(self, dependent):
+                delattr(self, dependent)
+            self._discardDependents(dependent)
+
+    def _getSearchedText(self):
+        """
+        Get the text searched for the location and venue, which is self.txt
+        without the artist and date.
+
+        @rtype: unicode
+        """
+        if hasattr(self, 'searchedText'): return self.searchedText
+
+        self.searchedText = self.txt.replace(self._findArtist(), '') \
+                                    .replace(self._findDate(), '')
+        return self.searchedText
 
     def _findArtist(self):
         """
@@ -209,35 +528,33 @@ class TxtParser(object):
         """
         if hasattr(self, 'tracklistStr'): return self.tracklistStr
 
-        pattern = r"""
-            (
-                ^[\t\s]*           # May start with whitespace
-                (?:                # Begin of optional prefix
-                    (?:\d{3}-)?      # Prefix may start 101, 201, etc.
-                    d\dt           # May contain prefix d1t, d2t, etc.
-                )?                 # End of optional prefix                                
-                [0-9]{1,3}         # One or two numbers
-                [\W]               # Some sort of separator
-                (.*)               # The actual track name
-                $                  # The end of the line
-                \n?                # Doesn't work right without this.  Not sure why.                
-            ){1,}                  # 1 or more track lines
-        """
- 
         # There may be line breaks with text in between signifying an encore, so
         # look through and get all the pieces that look like a tracklist segments,
-        # then concatenate them together.
+        # then concatenate them together.  Each piece is taken out of the text
+        # before looking for the next, but rather than copying the text to do so,
+        # the search just continues from the end of the piece.  The text between
+        # the pieces is kept in case it is needed after all.
         txt = self.txt
-        previousTxt = None
+        pos = 0
+        between = []
         tracklistStr = ''
-        while txt != previousTxt:
-            match = re.search(pattern, txt, re.MULTILINE | re.VERBOSE)
+        while True:
+            match = tracklistSegmentPattern.search(txt, pos)
             if match == None:
-                break;
-            tracklistStr += match.group(0)
-            previousTxt = txt                        
-            txt = txt.replace(match.group(0), '')
-        
+                break
+            segment = match.group(0)
+            tracklistStr += segment
+            if txt.find(segment) == match.start() \
+                    and txt.find(segment, match.end()) == -1:
+                between.append(txt[pos:match.start()])
+                pos = match.end()
+            else:
+                # A piece which appears more than once is taken out everywhere,
+                # which can change what is found next, so search from the start.
+                txt = (''.join(between) + txt[pos:]).replace(segment, '')
+                between = []
+                pos = 0
+
         self.tracklistStr = unicode(tracklistStr)                
         return self.tracklistStr
 
@@ -258,14 +575,15 @@ class TxtParser(object):
         trackLines = tracklistStr.splitlines(True);
         tracklistStr = '' # use the same name for the filtered tracklist string
         expectedTrackNum = 1
+        date = self._findDate()
         for trackLine in trackLines:
             # Don't count if the line contains an md5 hash            
-            if re.search('[0-9a-f]{32}', trackLine, re.IGNORECASE):
+            if md5Pattern.search(trackLine):
                 continue
             # or if the line contains the date
-            if self._findDate() and trackLine.count(self._findDate()):
+            if date and trackLine.count(date):
                 continue            
-            match = re.search('(?:(?:\d{3}-)?d\dt)?\d?(\d{1,2}).*', trackLine)
+            match = trackNumberPattern.search(trackLine)
             actualTrackNum = int(match.group(1)) if match else None                        
             # Allow for common mistakes of repeating track numbers and skipping track numbers
             expectedTrackNums = [expectedTrackNum, expectedTrackNum - 1, expectedTrackNum + 1]
@@ -279,25 +597,7 @@ class TxtParser(object):
                 # If tracklist seperated into multiple discs, the counting may start over
                 tracklistStr += trackLine
                 expectedTrackNum = int(match.group(1)) + 1                
-        trackTimePattern = r"""
-            (
-                [([]?          # Possible opening enclosures
-                \d{1,2}        # Minutes, with optional opening 0
-                [:\']          # Colon separator or ' minutes symbol
-                [0-6][0-9]     # Minutes
-                (?:\.\d{2})?   # Possible hundredths of seconds
-                (?:"|'')?      # Possible " seconds symbol (may be made up of 2 apostrophes)
-                [)\]]?         # Possible closing enclosure                
-            )
-            """
-        # Filter out the track numbers and, if present, track times, to get just the titles
-        pattern = r"""^(?:(?:\d{3}-)?d\dt)?              # Possible prefix like d1t01 or 101-d1t01
-                      [\t\s]*[0-9]{1,3}[ .\-:)]*         # Track number, separator, and whitespace
-                      """ + trackTimePattern + """?      # Track time if present before the title
-                      (.*?)                              # The actual title
-                      (?:[ -]*?)                         # White space or dash separator
-                      """ + trackTimePattern + """?\s*$  # Track time if present after the title"""
-        matches = re.findall(pattern, tracklistStr, re.MULTILINE | re.VERBOSE)
+        matches = trackTitlePattern.findall(tracklistStr)
     
         # If the second group is empty, assume that what looked like the track time was actually the track title
         self.tracklist = [match[1].strip() if match[1] else match[0] for match in matches]
@@ -317,121 +617,136 @@ class TxtParser(object):
             return self.locationAsIs
         elif not asIs and hasattr(self, 'location'):
             return self.location
-        
-        searchedText = self.txt.replace(self._findArtist(), '') \
-                               .replace(self._findDate(), '')
+
+        location = self._searchLocation(asIs)
+        # The location as it appears is kept apart from the shortened one
+        if asIs:
+            self.locationAsIs = location
+        else:
+            self.location = location
+        return location
+
+    def _searchLocation(self, asIs):
+        """
+        Search for the location, for _findLocation().
+
+        @type  asIs: Boolean
+        @rtype: string
+        """
+        searchedText = self._getSearchedText()
         
         match = re.search('^\s*Location:\s*(.*)$', searchedText, re.MULTILINE)
         if match:            
-            self.location = match.group(1)
-            return self.location
+            location = match.group(1)
+            return location
 
         # Use the city with the lowest index
         candidate = {'city': None, 'index': len(searchedText)}
 
         # Check for a city from the common-cities list
-        for city, cityDetails in cities.iteritems():                    
-            match = re.search('\W(' + re.escape(city) + r')(\W|\Z)', searchedText)
-            if match:                
-                if 'province' in cityDetails:
-                    for provinceAbbr in cityDetails['province']:
-                        provinceFull = provinces[provinceAbbr]
-                        pattern = city + "[,\s]*" + provinceFull + "|" + city + "[,\s]*" + provinceAbbr + "|" \
-                                + city + "[,\s]*Canada"
-                        match = re.search(pattern, searchedText, re.IGNORECASE)
-                        if match:
-                            index = searchedText.find(match.group(0))
-                            if index < candidate['index']:
-                                candidate['index'] = index
-                                if asIs:
-                                    candidate['city'] = match.group(0)                                
-                                else:                                
-                                    candidate['city'] = city + ', ' + provinceFull + ', Canada'
-                        # If the city isn't qualified, but the city only has one state or country associated
-                        # with it, assume that city
-                        elif len(cityDetails) == 1 and len(cityDetails['province']) == 1:
-                            index = searchedText.find(city)
-                            if asIs:                                
-                                if index < candidate['index']:
-                                    candidate['city'] = city
-                            else:
-                                if index < candidate['index']:
-                                    candidate['city'] = city + ', ' + provinceFull + ', Canada'
-                            candidate['index'] = index                                
-                if 'state' in cityDetails:                    
-                    for stateAbbr in cityDetails['state']:
-                        stateFull = states[stateAbbr]
-                        pattern = city + "[,\s]*" + stateFull + "|" + city + "[,\s]*" + stateAbbr
-                        match = re.search(pattern, searchedText, re.IGNORECASE)
-                        if match:
-                            index = searchedText.find(match.group(0))
-                            if index < candidate['index']:
-                                candidate['index'] = index                            
-                                if asIs:
-                                    candidate['city'] = match.group(0)
-                                else:
-                                    candidate['city'] = city + ', ' + stateAbbr                            
-                        # If the city isn't qualified, but the city only has one state or country associated
-                        # with it, assume that city
-                        elif len(cityDetails) == 1 and len(cityDetails['state']) == 1:
-                            index = searchedText.find(city)                            
-                            if index < candidate['index']:
-                                candidate['index'] = index
-                                if asIs:
-                                    candidate['city'] = city
-                                else:
-                                    candidate['city'] = city + ', ' + stateAbbr
-                if 'country' in cityDetails:
-                    for countryCode in cityDetails['country']:                                                
-                        countryFull = countries[countryCode]
-                        pattern = city + "[,\s]*" + countryFull + "|" + city + "[,\s]*" + countryCode
-                        match = re.search(pattern, searchedText, re.IGNORECASE)
-                        if match:
-                            index = searchedText.find(match.group(0))
+        cityIndex = getCityIndex()
+        for city, cityDetails in cityIndex.findCities(searchedText):
+            if 'province' in cityDetails:
+                for provinceAbbr in cityDetails['province']:
+                    provinceFull = provinces[provinceAbbr]
+                    match = cityIndex.getQualifierPattern(
+                        city, 'province', provinceAbbr
+                    ).search(searchedText)
+                    if match:
+                        index = searchedText.find(match.group(0))
+                        if index < candidate['index']:
+                            candidate['index'] = index
+                            if asIs:
+                                candidate['city'] = match.group(0)                                
+                            else:                                
+                                candidate['city'] = city + ', ' + provinceFull + ', Canada'
+                    # If the city isn't qualified, but the city only has one state or country associated
+                    # with it, assume that city
+                    elif len(cityDetails) == 1 and len(cityDetails['province']) == 1:
+                        index = searchedText.find(city)
+                        if asIs:                                
                             if index < candidate['index']:
-                                candidate['index'] = index
-                                if asIs:
-                                    candidate['city'] = match.group(0)
-                                else:
-                                    candidate['city'] = city + ', ' + countryFull                            
-                        elif len(cityDetails) == 1 and len(cityDetails['country']) == 1:
-                            index = searchedText.find(city)
+                                candidate['city'] = city
+                        else:
                             if index < candidate['index']:
-                                candidate['index'] = index
-                                if asIs:
-                                    candidate['city'] = city
-                                else:
-                                    candidate['city'] = city + ', ' + countryFull                            
+                                candidate['city'] = city + ', ' + provinceFull + ', Canada'
+                        candidate['index'] = index                                
+            if 'state' in cityDetails:                    
+                for stateAbbr in cityDetails['state']:
+                    stateFull = states[stateAbbr]
+                    match = cityIndex.getQualifierPattern(
+                        city, 'state', stateAbbr
+                    ).search(searchedText)
+                    if match:
+                        index = searchedText.find(match.group(0))
+                        if index < candidate['index']:
+                            candidate['index'] = index                            
+                            if asIs:
+                                candidate['city'] = match.group(0)
+                            else:
+                                candidate['city'] = city + ', ' + stateAbbr                            
+                    # If the city isn't qualified, but the city only has one state or country associated
+                    # with it, assume that city
+                    elif len(cityDetails) == 1 and len(cityDetails['state']) == 1:
+                        index = searchedText.find(city)                            
+                        if index < candidate['index']:
+                            candidate['index'] = index
+                            if asIs:
+                                candidate['city'] = city
+                            else:
+                                candidate['city'] = city + ', ' + stateAbbr
+            if 'country' in cityDetails:
+                for countryCode in cityDetails['country']:                                                
+                    countryFull = countries[countryCode]
+                    match = cityIndex.getQualifierPattern(
+                        city, 'country', countryCode
+                    ).search(searchedText)
+                    if match:
+                        index = searchedText.find(match.group(0))
+                        if index < candidate['index']:
+                            candidate['index'] = index
+                            if asIs:
+                                candidate['city'] = match.group(0)
+                            else:
+                                candidate['city'] = city + ', ' + countryFull                            
+                    elif len(cityDetails) == 1 and len(cityDetails['country']) == 1:
+                        index = searchedText.find(city)
+                        if index < candidate['index']:
+                            candidate['index'] = index
+                            if asIs:
+                                candidate['city'] = city
+                            else:
+                                candidate['city'] = city + ', ' + countryFull                            
 
         if candidate['city']:
-            self.location = candidate['city']
-            return self.location
+            location = candidate['city']
+            return location
 
-        self.location = ''
+        location = ''
                           
         # If no match found from cities in the common city list, just search for a line that looks
         # like a location line, i.e. contains a comma
         match = re.search('^.+,.+$', searchedText, re.MULTILINE)
         if not match:            
-            return self.location
+            return location
 
-        self.location = match.group(0).strip()
+        location = match.group(0).strip()
         
-        cityStateMatch = re.search('([a-z ]+, [a-z]{2})(\s|,|$)', self.location, re.IGNORECASE)
+        cityStateMatch = re.search('([a-z ]+, [a-z]{2})(\s|,|$)', location, re.IGNORECASE)
         if cityStateMatch:
-            self.location = cityStateMatch.group(1).strip()            
+            location = cityStateMatch.group(1).strip()            
 
         # If a venue is included on the same line after a dash, isolate the location
-        locationMatch = re.search('(.*)( - .*)', self.location)
+        locationMatch = re.search('(.*)( - .*)', location)
         if locationMatch:
-            self.location = locationMatch.group(1).strip()            
+            location = locationMatch.group(1).strip()            
 
-        if len(self.location) > 30:
-            self.location = ''
+        if len(location) > 30:
+            location = ''
         else:
-            self.location = self.location.strip()
+            location = location.strip()
             
-        return self.location
+        return location
 
     def _findVenue(self):
         """
@@ -452,8 +767,7 @@ class TxtParser(object):
         if not locationTxt:
             return ''
 
-        searchedText = self.txt.replace(self._findArtist(), '') \
-                               .replace(self._findDate(), '')
+        searchedText = self._getSearchedText()
 
         pattern = r"""
             (?:                
@@ -563,4 +877,307 @@ class TxtParser(object):
                 'tracklist' : tracklist,
                 'comments'  : unicode(self.txt)}
     
-class ParseTxtError(Exception): pass
\ No newline at end of file
+class ParseTxtError(Exception): pass
+
+PARSED_CACHE_VERSION = 1
+"""Increment when TxtParser finds different things, so that cached results
+   are discarded"""
+
+PARSED_CACHE_LIMIT = 5000
+"""The most results kept in parseCacheDir.  The least recently used are
+   removed first"""
+
+parseCacheDir = None
+"""The folder holding the results cached by parseMany(), one file per txt.
+   Set with setParseCacheDir()"""
+
+parsedTxts = {}
+"""Results cached by parseMany() in this process, by the hash of the txt"""
+
+def setParseCacheDir(path):
+    """
+    Set the folder where parse results are cached.  Until this is called,
+    results are only cached in memory.
+
+    @type path: unicode
+    """
+    global parseCacheDir
+    parseCacheDir = path
+
+def normalizeNewlines(txt):
+    """
+    @type txt: unicode
+
+    @rtype: unicode
+    @return: txt with every newline as \n
+    """
+    return txt.replace('\r\n', '\n').replace('\r', '\n')
+
+def getCachedParse(hash, citiesSignature):
+    """
+    Get the cached result of parsing a txt, from memory or from
+    parseCacheDir.
+
+    @type hash: string
+    @param hash: The hash of the txt, as returned by getTxtHash()
+
+    @type citiesSignature: tuple
+    @param citiesSignature: The return value of getCitiesSignature()
+
+    @rtype: dict
+    @return: The result without the comments, or None if not cached
+    """
+    if hash in parsedTxts:
+        return parsedTxts[hash]
+    if parseCacheDir is None:
+        return None
+    cachePath = os.path.join(parseCacheDir, hash)
+    if not os.path.exists(cachePath):
+        return None
+    try:
+        fileCache = open(cachePath, 'rb')
+        try:
+            version, cachedSignature, metadata = cPickle.load(fileCache)
+        finally:
+            fileCache.close()
+        # Marks it as recently used, for pruneParseCache()
+        os.utime(cachePath, None)
+    except Exception:
+        return None
+    if version != PARSED_CACHE_VERSION or cachedSignature != citiesSignature:
+        return None
+    parsedTxts[hash] = metadata
+    return metadata
+
+def setCachedParse(hash, citiesSignature, metadata):
+    """
+    Cache the result of parsing a txt in memory and, if setParseCacheDir()
+    has been called, on disk.
+
+    @type hash: string
+
+    @type citiesSignature: tuple
+
+    @type metadata: dict
+    @param metadata: The result without the comments
+    """
+    parsedTxts[hash] = metadata
+    if parseCacheDir is None:
+        return
+    try:
+        if not os.path.isdir(parseCacheDir):
+            os.makedirs(parseCacheDir)
+        fileCache = open(os.path.join(parseCacheDir, hash), 'wb')
+        cPickle.dump(
+            (PARSED_CACHE_VERSION, citiesSignature, metadata),
+            fileCache,
+            cPickle.HIGHEST_PROTOCOL
+        )
+        fileCache.close()
+    except (IOError, OSError):
+        pass
+
+def pruneParseCache(limit=PARSED_CACHE_LIMIT):
+    """
+    Remove the least recently used results from parseCacheDir until no more
+    than limit are left.  Since this lists and may stat the whole cache, it
+    is called once a session rather than after each parse.
+
+    @type limit: int
+    """
+    if parseCacheDir is None:
+        return
+    try:
+        names = os.listdir(parseCacheDir)
+    except OSError:
+        return
+    if len(names) <= limit:
+        return
+    entries = []
+    for name in names:
+        path = os.path.join(parseCacheDir, name)
+        try:
+            entries.append((os.path.getmtime(path), path))
+        except OSError:
+            pass
+    entries.sort()
+    for mtime, path in entries[:len(entries) - limit]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def initParseWorker(index):
+    """
+    Run in each worker process of parseMany() as it starts.  The processes
+    are forked, so they are given the CityIndex rather than loading it, and
+    a new cityIndexLock, since another thread may have been holding it at
+    the time of the fork.
+
+    @type index: CityIndex
+    """
+    global cityIndex, cityIndexLock
+    cityIndexLock = threading.Lock()
+    cityIndex = index
+
+def getTxtHash(txt):
+    """
+    @type txt: unicode
+    @param txt: A txt with normalized newlines
+
+    @rtype: string
+    @return: The hex digest of the MD5 hash of txt, which is also used as the
+             "hash" of a recording
+    """
+    return hashlib.md5(txt.encode('utf-8')).hexdigest()
+
+def parseWithoutComments(txt):
+    """
+    Parse txt, leaving out the comments since the caller already has them.
+    Run by the worker processes of parseMany().
+
+    @type txt: unicode
+
+    @rtype: dict
+    """
+    metadata = TxtParser(txt).parseTxt()
+    del metadata['comments']
+    return metadata
+
+def createParsePool(jobs=0):
+    """
+    Start processes to parse txts in, which can be passed to parse() and
+    parseMany() by any number of threads.  Processes are only used where
+    they can be forked, since otherwise each would have to import
+    everything again.
+
+    @type jobs: int
+    @param jobs: The number of processes, or 0 for one per CPU
+
+    @rtype: multiprocessing.Pool
+    @return: The pool, or None if txts are better parsed in this process
+    """
+    if not jobs or jobs < 1:
+        try:
+            jobs = multiprocessing.cpu_count()
+        except NotImplementedError:
+            jobs = 1
+    if jobs < 2 or not hasattr(os, 'fork'):
+        return None
+    return multiprocessing.Pool(jobs, initParseWorker, (getCityIndex(),))
+
+def parse(txt, pool=None, isStopped=None):
+    """
+    Parse a txt, or get the result of parsing it before.
+
+    @type txt: unicode
+
+    @type pool: multiprocessing.Pool
+    @param pool: See parseMany()
+
+    @type isStopped: callable
+    @param isStopped: See parseMany()
+
+    @rtype: dict
+    @return: The same as TxtParser.parseTxt(), or None if stopped
+    """
+    parsedList = parseMany([txt], 1, pool, isStopped)
+    if parsedList is None:
+        return None
+    return parsedList[0]
+
+def parseMany(texts, jobs=0, pool=None, isStopped=None):
+    """
+    Parse several txts.  Results are cached by the hash of each txt, in
+    memory and, if setParseCacheDir() has been called, on disk.  Txts which
+    haven't been parsed before are parsed in pool, or if none is given, in
+    up to jobs processes, where processes can be forked.
+
+    @type texts: list
+    @param texts: unicode txts
+
+    @type jobs: int
+    @param jobs: The number of processes, or 0 for one per CPU
+
+    @type pool: multiprocessing.Pool
+    @param pool: Processes started by createParsePool()
+
+    @type isStopped: callable
+    @param isStopped: Called now and then while waiting for pool, which is
+    given up on if it returns True
+
+    @rtype: list
+    @return: The same as TxtParser.parseTxt() for each txt, in order, or None
+    if stopped
+    """
+    texts = [normalizeNewlines(unicode(txt)) for txt in texts]
+    hashes = [getTxtHash(txt) for txt in texts]
+    citiesSignature = getCitiesSignature()
+
+    results = {}
+    unparsed = {}
+    for hash, txt in zip(hashes, texts):
+        if hash in results or hash in unparsed:
+            continue
+        metadata = getCachedParse(hash, citiesSignature)
+        if metadata is None:
+            unparsed[hash] = txt
+        else:
+            results[hash] = metadata
+
+    if unparsed:
+        unparsedHashes = unparsed.keys()
+        unparsedTexts = [unparsed[hash] for hash in unparsedHashes]
+        if pool is not None:
+            result = pool.map_async(parseWithoutComments, unparsedTexts)
+            # A pool which is terminated never finishes the map
+            while not result.ready():
+                if isStopped is not None and isStopped():
+                    return None
+                result.wait(0.5)
+            parsed = result.get()
+        else:
+            if not jobs or jobs < 1:
+                try:
+                    jobs = multiprocessing.cpu_count()
+                except NotImplementedError:
+                    jobs = 1
+            pool = createParsePool(min(jobs, len(unparsedTexts)))
+            if pool is not None:
+                try:
+                    parsed = pool.map(parseWithoutComments, unparsedTexts)
+                    pool.close()
+                finally:
+                    pool.terminate()
+            else:
+                parsed = map(parseWithoutComments, unparsedTexts)
+        for hash, metadata in zip(unparsedHashes, parsed):
+            setCachedParse(hash, citiesSignature, metadata)
+            results[hash] = metadata
+
+    parsedList = []
+    for hash, txt in zip(hashes, texts):
+        # Copied since the caller may change it
+        metadata = copy.deepcopy(results[hash])
+        metadata['comments'] = txt
+        parsedList.append(metadata)
+    return parsedList
+
+def reparseWithArtist(metadata, artist):
+    """
+    Parse a txt again, using the artist given rather than the one found in
+    it.  Only the location and venue are found using the artist, so the
+    tracklist is carried over rather than found again.
+
+    @type metadata: dict
+    @param metadata: The result of parsing the txt
+
+    @type artist: unicode
+
+    @rtype: dict
+    @return: The same as TxtParser.parseTxt()
+    """
+    txtParser = TxtParser(metadata['comments'])
+    txtParser.setField('artist', artist)
+    txtParser.setField('tracklist', metadata['tracklist'])
+    return txtParser.parseTxt()
\ No newline at end of file
@@ -4,12 +4,24 @@ BootTunes is licensed under the GPLv2.
 http://www.gnu.org/licenses/gpl-2.0.html
 """
 import os
+import time
+import copy
 import cPickle
 import codecs
+import threading
+from collections import OrderedDict
 from PyQt4.QtCore import QDir
 
 class SettingsError(Exception): pass
 
+MD5_CACHE_LIMIT = 100000
+"""The most files whose MD5 hashes are remembered.  The least recently used
+   are forgotten first"""
+
+SCAN_CACHE_LIMIT = 5000
+"""The most recording directories whose metadata is remembered.  The least
+   recently used are forgotten first"""
+
 class Settings:
     """
     Set and retrieve settings as if the instance were a dict.
@@ -22,6 +34,16 @@ class Settings:
                 'checkForUpdates'  : True,
                 'sendErrorReports' : True,
                 'verifyMd5Hashes'  : True,
+                'reverifyMd5Hashes': False,
+                'decodeFlacFingerprints': False,
+                'repairBrokenFlacs': False,
+                'watchFolders'     : [],
+                'watchQuietSeconds': 60,
+                'watchAutoConvert' : False,
+                'updateCities'     : True,
+                'conversionJobs'   : 0,
+                'loadingJobs'      : 0,
+                'journalExpiryDays': 14,
                 'skipVersion'      : ''}
 
     def __getitem__(self, key):
@@ -59,6 +81,9 @@ class Settings:
         self.defaultsPath  = defaultsPath  = basePath + '/' + file + '-defaults'
         self.namesPath     = namesPath     = basePath + '/' + file + '-names'
         self.completedPath = completedPath = basePath + '/' + file + '-completed'
+        self.md5CachePath  = md5CachePath  = basePath + '/' + file + '-md5cache'
+        self.scanCachePath = scanCachePath = basePath + '/' + file + '-scancache'
+        self.parseCacheDir = basePath + '/' + file + '-parsecache'
 
         pathsAndProperties = [
             (settingsPath,  'settings'),
@@ -79,6 +104,31 @@ class Settings:
                     pass
                 fileObj.close()
 
+        # The caches hold unicode paths, which can't be pickled to a
+        # text file, so they're pickled in binary instead.
+        self.cachePathsAndProperties = [
+            (md5CachePath,  'md5Cache'),
+            (scanCachePath, 'scanCache')
+        ]
+
+        # The caches are used by several loading threads at once, and are
+        # kept in the order they were last used so that the least recently
+        # used entries can be forgotten first.
+        self.cacheLock = threading.Lock()
+        for filePath, property in self.cachePathsAndProperties:
+            setattr(self, property, OrderedDict())
+            if os.path.exists(filePath):
+                fileObj = open(filePath, 'rb')
+                try:
+                    setattr(
+                        self,
+                        property,
+                        OrderedDict(cPickle.load(fileObj) or {})
+                    )
+                except (cPickle.UnpicklingError, AttributeError, EOFError, ImportError, IndexError, ValueError):
+                    pass
+                fileObj.close()
+
     def initAddToITunesPath(self):
         """
         Check that the "Automatically Add to iTunes" path is set and that the directory
@@ -218,6 +268,141 @@ class Settings:
         if hash in self.completed[0]:
             self.completed[0].remove(hash)
 
+    def getFileIdentity(self, filePath):
+        """
+        @type filePath: unicode
+
+        @rtype: tuple
+        @return: The size, modification time and inode of the file, or None
+                 if it could not be read
+        """
+        try:
+            stat = os.stat(filePath)
+        except OSError:
+            return None
+        return (stat.st_size, stat.st_mtime, stat.st_ino)
+
+    def getCacheEntry(self, cache, key):
+        """
+        Get an entry from one of the caches, marking it as the most recently
+        used.
+
+        @type cache: OrderedDict
+
+        @rtype: object
+        @return: The entry, or None if there isn't one
+        """
+        with self.cacheLock:
+            if key not in cache:
+                return None
+            entry = cache.pop(key)
+            cache[key] = entry
+            return entry
+
+    def setCacheEntry(self, cache, key, entry, limit):
+        """
+        Add an entry to one of the caches as the most recently used,
+        forgetting the least recently used entries beyond limit.
+
+        @type cache: OrderedDict
+
+        @type limit: int
+        """
+        with self.cacheLock:
+            cache.pop(key, None)
+            cache[key] = entry
+            while len(cache) > limit:
+                cache.popitem(False)
+
+    def removeCacheEntry(self, cache, key):
+        """
+        @type cache: OrderedDict
+        """
+        with self.cacheLock:
+            cache.pop(key, None)
+
+    def getCachedMd5(self, filePath):
+        """
+        Get the MD5 hash computed the last time a file was verified, if the
+        file has not changed since.
+
+        @type filePath: unicode
+
+        @rtype: string
+        @return: The hex digest, or None if not cached or the file has changed
+        """
+        entry = self.getCacheEntry(self.md5Cache, filePath)
+        if entry is None:
+            return None
+        identity, md5 = entry
+        currentIdentity = self.getFileIdentity(filePath)
+        if currentIdentity is None:
+            # The file is gone, so its entry will never be used again
+            self.removeCacheEntry(self.md5Cache, filePath)
+        if identity != currentIdentity:
+            return None
+        return md5
+
+    def setCachedMd5(self, filePath, md5):
+        """
+        Remember the MD5 hash of a file, along with its size, modification
+        time and inode so that a changed file is hashed again.
+
+        @type filePath: unicode
+
+        @type md5: string
+        """
+        identity = self.getFileIdentity(filePath)
+        if identity is not None:
+            self.setCacheEntry(
+                self.md5Cache,
+                filePath,
+                (identity, md5),
+                MD5_CACHE_LIMIT
+            )
+
+    def getCachedScan(self, dirPath, signature):
+        """
+        Get the metadata found the last time a recording's directory was
+        loaded, if none of its files have changed since.
+
+        @type dirPath: unicode
+
+        @type signature: list
+        @param signature: Identifies the state of the directory, see
+                          shows.DirSnapshot.getSignature()
+
+        @rtype: dict
+        @return: A copy of the metadata, or None if not cached or changed
+        """
+        entry = self.getCacheEntry(self.scanCache, dirPath)
+        if entry is None:
+            return None
+        cachedSignature, metadata = entry
+        if cachedSignature != signature:
+            return None
+        # Entries are replaced rather than changed, so it's safe to copy
+        # this one without the lock
+        return copy.deepcopy(metadata)
+
+    def setCachedScan(self, dirPath, signature, metadata):
+        """
+        Remember the metadata found when loading a recording's directory.
+
+        @type dirPath: unicode
+
+        @type signature: list
+
+        @type metadata: dict
+        @param metadata: Metadata without any Qt objects
+        """
+        self.setCacheEntry(
+            self.scanCache,
+            dirPath,
+            (signature, copy.deepcopy(metadata)),
+            SCAN_CACHE_LIMIT
+        )
+
     def pickleAndStore(self):
         """
         Pickle and save the settings
@@ -237,15 +422,39 @@ class Settings:
         fileNames.close()
         fileCompleted.close()
 
-    def clearTempFiles(self):
+        for filePath, property in self.cachePathsAndProperties:
+            fileObj = open(filePath, 'wb')
+            with self.cacheLock:
+                cPickle.dump(getattr(self, property), fileObj, cPickle.HIGHEST_PROTOCOL)
+            fileObj.close()
+
+    def clearTempFiles(self, dirNames=None):
         """
         Clear the directories created for each recording added to the queue
-        and the files they contain.
+        and the files they contain.  Directories of recordings whose
+        conversion was interrupted, and so still have a conversion journal,
+        are kept so that the conversion can be resumed, unless the journal
+        hasn't been touched for journalExpiryDays days.  The parse cache
+        is kept as well.
+
+        @type dirNames: list
+        @param dirNames: The names of the directories to clear, or None to
+        clear all of them
         """
+        expiryTime = time.time() - self['journalExpiryDays'] * 86400
         settingsQDir = QDir(self.settingsDir)
         settingsQDir.setFilter(QDir.Dirs | QDir.NoDotAndDotDot)
         for dir in settingsQDir.entryList():
+            if dirNames is not None and unicode(dir) not in dirNames:
+                continue
             tempQDir = QDir(self.settingsDir + '/' + dir)
+            if unicode(tempQDir.absolutePath()) == \
+                    unicode(QDir(self.parseCacheDir).absolutePath()):
+                continue
+            journalPath = unicode(tempQDir.absoluteFilePath('journal'))
+            if os.path.exists(journalPath) \
+                    and os.path.getmtime(journalPath) > expiryTime:
+                continue
             tempQDir.setFilter(QDir.Files)
             for tempFile in tempQDir.entryList():
                 tempQDir.remove(tempFile)
@@ -0,0 +1,348 @@
+"""
+Functions for finding the files of a recording and describing it, shared
+by the queue dialog, the threads it runs and the batch importer.
+
+Copyright (C) 2010 Zachary Chavez
+BootTunes is licensed under the GPLv2.
+http://www.gnu.org/licenses/gpl-2.0.html
+"""
+import re
+import os
+import stat
+import codecs
+import hashlib
+import fnmatch
+import chardet
+from settings import getSettings
+
+try:
+    from scandir import scandir
+except ImportError:
+    scandir = None
+
+def readFileOfUnknownEncoding(filePath):
+    """
+    Read a text file whose encoding is unknown.  The file is read once,
+    and decoded as UTF-8 unless it has a byte order mark saying otherwise.
+    Only if that fails is the encoding detected, from the first part of
+    the file, and if the detected encoding can't decode the whole file
+    it is read as Latin-1.  The encoding found is remembered for as long
+    as the file is unchanged.
+
+    @type filePath: unicode
+    @param filePath: The path to the text file.
+
+    @rtype: unicode
+    @return: The contents of the file.
+
+    """
+    fileHandle = open(filePath, 'rb')
+    try:
+        data = fileHandle.read()
+    finally:
+        fileHandle.close()
+    try:
+        cacheKey = (filePath, os.path.getmtime(filePath))
+    except OSError:
+        cacheKey = None
+
+    if cacheKey in encodingCache:
+        try:
+            return data.decode(encodingCache[cacheKey])
+        except UnicodeDecodeError:
+            pass
+    encoding = detectEncoding(data)
+    try:
+        text = data.decode(encoding)
+    except (UnicodeDecodeError, LookupError):
+        # chardet only looked at the start of the file
+        encoding = 'latin-1'
+        text = data.decode(encoding)
+    if cacheKey is not None:
+        encodingCache[cacheKey] = encoding
+    return text
+
+encodingCache = {}
+"""(path, mtime) tuples mapped to the encodings found by
+   readFileOfUnknownEncoding()"""
+
+DETECTION_SAMPLE_SIZE = 0x10000
+"""The number of bytes chardet looks at"""
+
+def detectEncoding(data):
+    """
+    Guess the encoding of text.  Try UTF-8 first, since it seems to give
+    the best results, then chardet.  A byte order mark is kept in the
+    decoded text, as it always has been, since the text goes into each
+    recording's hash.
+
+    @type data: str
+
+    @rtype: str
+    @return: The name of the encoding
+
+    """
+    boms = [
+        (codecs.BOM_UTF32_LE, 'utf-32-le'),
+        (codecs.BOM_UTF32_BE, 'utf-32-be'),
+        (codecs.BOM_UTF8,     'utf-8'),
+        (codecs.BOM_UTF16_LE, 'utf-16-le'),
+        (codecs.BOM_UTF16_BE, 'utf-16-be')
+    ]
+    for bom, encoding in boms:
+        if data.startswith(bom):
+            return encoding
+    try:
+        data.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    encoding = chardet.detect(data[:DETECTION_SAMPLE_SIZE])['encoding']
+    # Latin-1 can decode anything
+    return encoding or 'latin-1'
+
+def getFileMd5(filePath, isStopped=None):
+    """
+    Hash a file a block at a time.
+
+    @type filePath: unicode
+
+    @type isStopped: function
+    @param isStopped: Called before each block, to give up if it returns True
+
+    @rtype: str
+    @return: The hex digest of the file's MD5 hash, or None if given up
+
+    """
+    md5 = hashlib.md5()
+    fileObj = open(unicode(filePath), 'rb')
+    try:
+        for block in iter(lambda: fileObj.read(0x100000), ''):
+            if isStopped is not None and isStopped():
+                return None
+            md5.update(block)
+    finally:
+        fileObj.close()
+    return md5.hexdigest()
+
+class DirSnapshot:
+    """
+    The files in a recording's directory and in the folders directly
+    within it, with their sizes and modification times.  Each folder is
+    listed only once, the first time it is needed, and every later lookup
+    is answered from memory.  Hidden files are left out and names are
+    sorted ignoring case, as with QDir.entryList().
+
+    """
+    def __init__(self, dirPath):
+        """
+        @type dirPath: unicode
+
+        """
+        self.dirPath = unicode(dirPath)
+        self.listings = {}
+        """Folder (u'' for dirPath itself) mapped to a dict of its files'
+           names and (size, mtime) tuples, and the list of its folders"""
+
+    def listDir(self, subDir=u''):
+        """
+        @type subDir: unicode
+        @param subDir: The name of a folder within dirPath, or u'' for
+        dirPath itself
+
+        @rtype: tuple
+        @return: A dict of file names mapped to (size, mtime) tuples, and a
+        sorted list of folder names
+
+        """
+        if subDir in self.listings:
+            return self.listings[subDir]
+        path = self.dirPath if not subDir else self.dirPath + u'/' + subDir
+        files = {}
+        dirs = []
+        try:
+            if scandir is not None:
+                entries = list(scandir(path))
+            else:
+                entries = os.listdir(path)
+        except OSError:
+            entries = []
+        for entry in entries:
+            name = entry.name if scandir is not None else entry
+            if name.startswith('.'):
+                continue
+            try:
+                if scandir is not None:
+                    # On Windows, scandir gets the stats along with the names
+                    entryStat = entry.stat()
+                else:
+                    entryStat = os.stat(os.path.join(path, name))
+            except OSError:
+                continue
+            if stat.S_ISDIR(entryStat.st_mode):
+                dirs.append(name)
+            else:
+                files[name] = (entryStat.st_size, entryStat.st_mtime)
+        dirs.sort(key=lambda name: name.lower())
+        self.listings[subDir] = (files, dirs)
+        return self.listings[subDir]
+
+    def getFiles(self, nameFilters, subDir=u''):
+        """
+        @type nameFilters: list
+        @param nameFilters: Wildcard patterns, e.g. ['*.txt'], matched
+        ignoring case
+
+        @type subDir: unicode
+
+        @rtype: list
+        @return: The sorted names of the matching files
+
+        """
+        nameFilters = [nameFilter.lower() for nameFilter in nameFilters]
+        files, dirs = self.listDir(subDir)
+        return sorted(
+            [
+                name for name in files
+                if [nameFilter for nameFilter in nameFilters
+                    if fnmatch.fnmatchcase(name.lower(), nameFilter)]
+            ],
+            key=lambda name: name.lower()
+        )
+
+    def getSubDirs(self):
+        """
+        @rtype: list
+        @return: The sorted names of the folders within dirPath
+
+        """
+        return self.listDir()[1]
+
+    def filePath(self, name, subDir=u''):
+        """
+        @type name: unicode
+
+        @type subDir: unicode
+
+        @rtype: unicode
+
+        """
+        if subDir:
+            return self.dirPath + u'/' + subDir + u'/' + name
+        return self.dirPath + u'/' + name
+
+    def getSignature(self):
+        """
+        Describe every file by name, size and modification time, so that
+        any change to them can be noticed.
+
+        @rtype: list
+        @return: A sorted list of (relative path, size, mtime) tuples
+
+        """
+        signature = []
+        for subDir in [u''] + self.getSubDirs():
+            files, dirs = self.listDir(subDir)
+            for name, (size, mtime) in files.iteritems():
+                relativePath = subDir + u'/' + name if subDir else name
+                signature.append((relativePath, size, mtime))
+        signature.sort()
+        return signature
+
+def getFilePaths(snapshot, nameFilters):
+    """
+    Get a list of paths for every audio file in the specified folder.
+    If the audio files are split up between folders, e.g. CD1 and CD2,
+    get files from the subdirectories as well.
+
+    @type snapshot: DirSnapshot
+
+    @type nameFilters: list
+    @param nameFilters: Wildcard patterns for the audio files
+
+    @rtype: list
+    @return: A list of unicode paths
+
+    """
+    filePaths = [
+        snapshot.filePath(file) for file in snapshot.getFiles(nameFilters)
+    ]
+
+    if len(filePaths) == 0:
+        for subDir in snapshot.getSubDirs():
+            for file in snapshot.getFiles(nameFilters, subDir):
+                filePaths.append(snapshot.filePath(file, subDir))
+    return filePaths
+
+def getSortedFiles(filePaths):
+    """
+    Sort files in the correct order.
+
+    If the single digits tracks are numbered like 1, 2, 3
+    instead of 01, 02, 03, make sure they are sorted correctly,
+    so that track 10 does not follow track 1, etc.
+
+    @type filesPaths: list
+    @param filesPaths: A list of QStrings
+
+    @rtype:  list
+    @return: the sorted list
+
+    """
+    sortedFilePaths = []
+    sortDict = {} # Will be sorted by the keys
+    for index, file in enumerate(filePaths):
+        base = os.path.basename(unicode(file))
+        path = os.path.dirname(unicode(file))
+        if re.match('\d{1}\D', base):
+            sortDict[unicode(path + '/0' + base)] = file
+        else:
+            sortDict[unicode(file)] = file
+    for key in sorted(sortDict.iterkeys()):
+        sortedFilePaths.append(sortDict[key])
+    return sortedFilePaths
+
+def getAlbumTitle(metadata):
+    """
+    Get the album title of a recording.  If a title is set, use that,
+    otherwise follow the albumTitleFormat in settings.  Any parts of the
+    format which are blank are replaced with a "[missing ...]" note.
+
+    @type  metadata: dict
+    @param metadata: The metadata for the recording
+
+    @rtype:  tuple
+    @return: The album title, and False if any parts of it were missing
+
+    """
+    isComplete = True
+    if 'title' in metadata and metadata['title'] != '':
+        albumTitle = metadata['title']
+    else:
+        albumTitle = getSettings()['albumTitleFormat']
+        for placeHolder in ['artist', 'venue', 'location', 'date']:
+            match = re.search('\[' + placeHolder + '\]', albumTitle)
+            if not match:
+                continue
+            if placeHolder == 'date' and metadata['date'] != None:
+                replacement = metadata[placeHolder].strftime(
+                    getSettings()['dateFormat']
+                )
+            else:
+                placeHolder = "preferredArtist" \
+                    if placeHolder == 'artist' \
+                    else placeHolder
+                replacement = metadata[placeHolder]
+
+            if replacement == '' or replacement == None:
+                isComplete = False
+                albumTitle = albumTitle.replace(
+                    '[' + placeHolder + ']',
+                    '[missing ' + placeHolder + ']'
+                )
+            else:
+                albumTitle = albumTitle.replace(
+                    '[' + placeHolder + ']',
+                    replacement
+                )
+    return albumTitle, isComplete
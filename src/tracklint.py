@@ -18,6 +18,8 @@
 #Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
 
 # BootTunes additions: The BrokenFlacAudio.fix_id3_preserve_originals method.
+#                      BrokenFlacAudio.to_pcm decodes in place, through
+#                      FlacOffsetView.
 #                      Removed anydbm import.
 #                      Removed command line code.
 
@@ -30,6 +32,7 @@ import tempfile
 import subprocess
 import cStringIO
 import gettext
+import threading
 
 import settings # Added for BootTunes
 
@@ -304,11 +307,228 @@ def undo_from_backup(track, undo_db, messenger):
             messenger.info(_(u"Restored: %s") % \
                                (messenger.filename(track.filename)))
 
+#a read-only file object covering only the bytes of filename
+#from "start" up to "end", such as the FLAC stream of a
+#BrokenFlacAudio between its ID3v2 header and ID3v1 trailer
+class FlacOffsetView:
+    def __init__(self, filename, start, end):
+        self.file = file(filename,'rb')
+        self.start = start
+        self.end = end
+        self.file.seek(start,0)
+
+    def read(self, bytes=-1):
+        remaining = self.end - self.file.tell()
+        if ((bytes < 0) or (bytes > remaining)):
+            bytes = remaining
+        return self.file.read(max(bytes,0))
+
+    def seek(self, offset, whence=0):
+        if (whence == 0):
+            position = self.start + offset
+        elif (whence == 1):
+            position = self.file.tell() + offset
+        else:
+            position = self.end + offset
+        self.file.seek(min(max(position,self.start),self.end),0)
+
+    def tell(self):
+        return self.file.tell() - self.start
+
+    def close(self):
+        self.file.close()
+
+#a PCMReader which calls "cleanup" once "pcmreader" is closed
+#if "reopen" is given, it is called should "pcmreader" fail to read
+#all "total_frames" PCM frames, and must return a new
+#(pcmreader,cleanup) tuple of the same stream,
+#which picks up from the same PCM frame
+class __fallback_pcmreader__:
+    def __init__(self, pcmreader, cleanup, total_frames=0, reopen=None):
+        self.pcmreader = pcmreader
+        self.sample_rate = pcmreader.sample_rate
+        self.channels = pcmreader.channels
+        self.channel_mask = pcmreader.channel_mask
+        self.bits_per_sample = pcmreader.bits_per_sample
+        self.cleanup = cleanup
+        self.total_frames = total_frames
+        self.reopen = reopen
+        self.frames_read = 0
+
+    def read(self, bytes):
+        try:
+            framelist = self.pcmreader.read(bytes)
+        except (IOError,ValueError):
+            if (self.reopen is None):
+                raise
+            self.__reopen__()
+            return self.read(bytes)
+
+        if ((len(framelist) == 0) and
+            (self.frames_read < self.total_frames) and
+            (self.reopen is not None)):
+            #the stream ended early
+            self.__reopen__()
+            return self.read(bytes)
+
+        self.frames_read += framelist.frames
+        return framelist
+
+    def __reopen__(self):
+        reopen = self.reopen
+        self.reopen = None
+        try:
+            self.close()
+        except (IOError,ValueError):
+            pass
+
+        (pcmreader,self.cleanup) = reopen()
+        self.pcmreader = audiotools.BufferedPCMReader(pcmreader)
+
+        #skip whatever the failed reader already returned
+        frame_size = self.channels * self.bits_per_sample / 8
+        remaining = self.frames_read
+        while (remaining > 0):
+            framelist = self.pcmreader.read(
+                min(remaining * frame_size,audiotools.BUFFER_SIZE))
+            if (len(framelist) == 0):
+                raise IOError("FLAC stream ended early")
+            remaining -= framelist.frames
+
+    def close(self):
+        try:
+            self.pcmreader.close()
+        finally:
+            cleanup = self.cleanup
+            self.cleanup = lambda: None
+            cleanup()
+
 #a FlacAudio Track prepended with ID3v2 tags
 #or appended with ID3v1 tags
 class BrokenFlacAudio(audiotools.FlacAudio):
     NAME = "brokenflac"
 
+    #returns the (start,end) offsets of the FLAC stream in the file,
+    #between any ID3v2 header and any ID3v1 trailer
+    def flac_range(self):
+        f = file(self.filename,'rb')
+        try:
+            audiotools.ID3v2Comment.skip(f)
+            flac_start = f.tell()
+            f.seek(-128,2)
+            if (f.read(3) == 'TAG'):
+                f.seek(-3,1)
+                flac_end = f.tell()
+            else:
+                f.seek(0,2)
+                flac_end = f.tell()
+            return (flac_start,flac_end)
+        finally:
+            f.close()
+
+    #returns a FlacOffsetView of the FLAC stream without its ID3 tags
+    def flac_view(self):
+        (flac_start,flac_end) = self.flac_range()
+        return FlacOffsetView(self.filename,flac_start,flac_end)
+
+    #decodes the FLAC stream where the file lies
+    #rather than from a repaired copy, where possible
+    def to_pcm(self):
+        from audiotools import decoders
+
+        (flac_start,flac_end) = self.flac_range()
+        if (flac_start == 0):
+            #the decoder stops after STREAMINFO's total samples,
+            #so it never reaches an ID3v1 trailer
+            return decoders.FlacDecoder(self.filename,
+                                        self.channel_mask())
+
+        #the decoder only reads files, so where named pipes exist,
+        #feed it the FLAC stream through one
+        #and should that fail at any point,
+        #carry on from a temporary copy of the FLAC stream
+        if (hasattr(os,'mkfifo')):
+            try:
+                (pcmreader,cleanup) = self.__fifo_pcm__(flac_start,flac_end)
+            except (IOError,OSError,ValueError):
+                pass
+            else:
+                return __fallback_pcmreader__(pcmreader,
+                                              cleanup,
+                                              self.total_frames(),
+                                              self.__copy_pcm__)
+
+        #otherwise there's no way around decoding a temporary copy
+        (pcmreader,cleanup) = self.__copy_pcm__()
+        return __fallback_pcmreader__(pcmreader,cleanup)
+
+    #returns a (pcmreader,cleanup) tuple
+    #of a decoder reading the FLAC stream through a named pipe
+    #fed by a thread, which "cleanup" releases once the decoder is closed
+    def __fifo_pcm__(self, flac_start, flac_end):
+        from audiotools import decoders
+
+        temp_dir = tempfile.mkdtemp()
+        fifo_path = os.path.join(temp_dir,"flac")
+        os.mkfifo(fifo_path)
+        view = FlacOffsetView(self.filename,flac_start,flac_end)
+
+        def feed():
+            try:
+                #blocks until the decoder opens the other end
+                fifo = file(fifo_path,'wb')
+                try:
+                    audiotools.transfer_data(view.read,fifo.write)
+                finally:
+                    fifo.close()
+            except IOError:
+                #the decoder closed early
+                pass
+            view.close()
+
+        feeder = threading.Thread(target=feed)
+        feeder.daemon = True
+        feeder.start()
+
+        def cleanup():
+            #release the feeder if the decoder never opened the pipe
+            try:
+                fd = os.open(fifo_path,os.O_RDONLY | os.O_NONBLOCK)
+                os.close(fd)
+            except OSError:
+                pass
+            feeder.join()
+            os.unlink(fifo_path)
+            os.rmdir(temp_dir)
+
+        try:
+            return (decoders.FlacDecoder(fifo_path,self.channel_mask()),
+                    cleanup)
+        except:
+            cleanup()
+            raise
+
+    #returns a (pcmreader,cleanup) tuple
+    #of a decoder reading a temporary copy of the FLAC stream
+    #which "cleanup" removes once the decoder is closed
+    def __copy_pcm__(self):
+        from audiotools import decoders
+
+        (fd,temp_path) = tempfile.mkstemp(suffix=".flac")
+        f = os.fdopen(fd,'wb')
+        view = self.flac_view()
+        try:
+            try:
+                audiotools.transfer_data(view.read,f.write)
+            finally:
+                view.close()
+                f.close()
+            return (decoders.FlacDecoder(temp_path,self.channel_mask()),
+                    lambda: os.unlink(temp_path))
+        except:
+            os.unlink(temp_path)
+            raise
+
     def __read_streaminfo__(self):
         f = file(self.filename,"rb")
         audiotools.ID3v2Comment.skip(f)
@@ -405,32 +625,14 @@ class BrokenFlacAudio(audiotools.FlacAudio):
 
     # Same as fix_id3 except that it saves new files to tempFilePath, rather than rewriting the original.
     def fix_id3_preserve_originals(self, tempFilePath):
-        f = file(self.filename,'rb')
-
-        #figure out where the start and end points of the FLAC file are
-        audiotools.ID3v2Comment.skip(f)
-        flac_start = f.tell()
-        f.seek(-128,2)
-        if (f.read(3) == 'TAG'):
-            f.seek(-3,1)
-            flac_end = f.tell()
-        else:
-            f.seek(0,2)
-            flac_end = f.tell()
-
-        #copy the FLAC data to a temporary location
-        temp = tempfile.TemporaryFile()
-        f.seek(flac_start,0)
-        reader = audiotools.__capped_stream_reader__(f,flac_end - flac_start)
-        audiotools.transfer_data(reader.read,temp.write)
-
-        #rewrite the original FLAC with our temporary data        
-        temp.seek(0,0)
-        f.close()        
+        #copy only the FLAC data, straight to tempFilePath
+        view = self.flac_view()
         f = file(tempFilePath,'wb')
-        audiotools.transfer_data(temp.read,f.write)
-        temp.close()
-        f.close()        
+        try:
+            audiotools.transfer_data(view.read,f.write)
+        finally:
+            view.close()
+            f.close()
         returnValue = audiotools.open(tempFilePath)
         return returnValue
 
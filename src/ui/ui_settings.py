@@ -18,7 +18,7 @@ class Ui_SettingsDialog(object):
     def setupUi(self, SettingsDialog):
         SettingsDialog.setObjectName(_fromUtf8("SettingsDialog"))
         SettingsDialog.setWindowModality(QtCore.Qt.WindowModal)
-        SettingsDialog.resize(425, 414)
+        SettingsDialog.resize(425, 560)
         sizePolicy = QtGui.QSizePolicy(QtGui.QSizePolicy.Preferred, QtGui.QSizePolicy.Preferred)
         sizePolicy.setHorizontalStretch(0)
         sizePolicy.setVerticalStretch(0)
@@ -95,33 +95,60 @@ class Ui_SettingsDialog(object):
         self.defaultArtRadioButtonImageFileNoCoverArt.setObjectName(_fromUtf8("defaultArtRadioButtonImageFileNoCoverArt"))
         self.verticalLayout.addWidget(self.defaultArtRadioButtonImageFileNoCoverArt)
         self.gridLayout_2.addLayout(self.verticalLayout, 4, 1, 1, 3)
+        self.label_5 = QtGui.QLabel(SettingsDialog)
+        self.label_5.setObjectName(_fromUtf8("label_5"))
+        self.gridLayout_2.addWidget(self.label_5, 5, 0, 1, 1)
+        self.watchFoldersListWidget = QtGui.QListWidget(SettingsDialog)
+        self.watchFoldersListWidget.setMaximumSize(QtCore.QSize(16777215, 80))
+        self.watchFoldersListWidget.setObjectName(_fromUtf8("watchFoldersListWidget"))
+        self.gridLayout_2.addWidget(self.watchFoldersListWidget, 5, 1, 3, 3)
+        self.addWatchFolderButton = QtGui.QPushButton(SettingsDialog)
+        self.addWatchFolderButton.setObjectName(_fromUtf8("addWatchFolderButton"))
+        self.gridLayout_2.addWidget(self.addWatchFolderButton, 6, 0, 1, 1)
+        self.removeWatchFolderButton = QtGui.QPushButton(SettingsDialog)
+        self.removeWatchFolderButton.setObjectName(_fromUtf8("removeWatchFolderButton"))
+        self.gridLayout_2.addWidget(self.removeWatchFolderButton, 7, 0, 1, 1)
+        self.label_6 = QtGui.QLabel(SettingsDialog)
+        self.label_6.setObjectName(_fromUtf8("label_6"))
+        self.gridLayout_2.addWidget(self.label_6, 8, 0, 1, 1)
+        self.watchQuietSecondsSpinBox = QtGui.QSpinBox(SettingsDialog)
+        self.watchQuietSecondsSpinBox.setMaximum(3600)
+        self.watchQuietSecondsSpinBox.setObjectName(_fromUtf8("watchQuietSecondsSpinBox"))
+        self.gridLayout_2.addWidget(self.watchQuietSecondsSpinBox, 8, 1, 1, 1)
+        spacerItem1 = QtGui.QSpacerItem(138, 20, QtGui.QSizePolicy.Expanding, QtGui.QSizePolicy.Minimum)
+        self.gridLayout_2.addItem(spacerItem1, 8, 2, 1, 2)
         self.gridLayout = QtGui.QGridLayout()
         self.gridLayout.setObjectName(_fromUtf8("gridLayout"))
-        spacerItem1 = QtGui.QSpacerItem(40, 20, QtGui.QSizePolicy.Expanding, QtGui.QSizePolicy.Minimum)
-        self.gridLayout.addItem(spacerItem1, 0, 0, 1, 1)
+        spacerItem2 = QtGui.QSpacerItem(40, 20, QtGui.QSizePolicy.Expanding, QtGui.QSizePolicy.Minimum)
+        self.gridLayout.addItem(spacerItem2, 0, 0, 1, 1)
         self.checkForUpdatesCheckBox = QtGui.QCheckBox(SettingsDialog)
         self.checkForUpdatesCheckBox.setObjectName(_fromUtf8("checkForUpdatesCheckBox"))
         self.gridLayout.addWidget(self.checkForUpdatesCheckBox, 0, 1, 1, 2)
-        spacerItem2 = QtGui.QSpacerItem(40, 20, QtGui.QSizePolicy.Expanding, QtGui.QSizePolicy.Minimum)
-        self.gridLayout.addItem(spacerItem2, 0, 3, 1, 1)
         spacerItem3 = QtGui.QSpacerItem(40, 20, QtGui.QSizePolicy.Expanding, QtGui.QSizePolicy.Minimum)
-        self.gridLayout.addItem(spacerItem3, 1, 0, 1, 1)
+        self.gridLayout.addItem(spacerItem3, 0, 3, 1, 1)
+        spacerItem4 = QtGui.QSpacerItem(40, 20, QtGui.QSizePolicy.Expanding, QtGui.QSizePolicy.Minimum)
+        self.gridLayout.addItem(spacerItem4, 1, 0, 1, 1)
         self.sendErrorReportsCheckBox = QtGui.QCheckBox(SettingsDialog)
         self.sendErrorReportsCheckBox.setToolTip(_fromUtf8(""))
         self.sendErrorReportsCheckBox.setObjectName(_fromUtf8("sendErrorReportsCheckBox"))
         self.gridLayout.addWidget(self.sendErrorReportsCheckBox, 1, 1, 1, 3)
-        spacerItem4 = QtGui.QSpacerItem(40, 20, QtGui.QSizePolicy.Expanding, QtGui.QSizePolicy.Minimum)
-        self.gridLayout.addItem(spacerItem4, 2, 0, 1, 1)
+        spacerItem5 = QtGui.QSpacerItem(40, 20, QtGui.QSizePolicy.Expanding, QtGui.QSizePolicy.Minimum)
+        self.gridLayout.addItem(spacerItem5, 2, 0, 1, 1)
         self.verifyMd5HashesCheckBox = QtGui.QCheckBox(SettingsDialog)
         self.verifyMd5HashesCheckBox.setObjectName(_fromUtf8("verifyMd5HashesCheckBox"))
         self.gridLayout.addWidget(self.verifyMd5HashesCheckBox, 2, 1, 1, 1)
-        spacerItem5 = QtGui.QSpacerItem(38, 20, QtGui.QSizePolicy.Expanding, QtGui.QSizePolicy.Minimum)
-        self.gridLayout.addItem(spacerItem5, 2, 2, 1, 1)
-        self.gridLayout_2.addLayout(self.gridLayout, 5, 0, 2, 4)
+        spacerItem6 = QtGui.QSpacerItem(38, 20, QtGui.QSizePolicy.Expanding, QtGui.QSizePolicy.Minimum)
+        self.gridLayout.addItem(spacerItem6, 2, 2, 1, 1)
+        spacerItem7 = QtGui.QSpacerItem(40, 20, QtGui.QSizePolicy.Expanding, QtGui.QSizePolicy.Minimum)
+        self.gridLayout.addItem(spacerItem7, 3, 0, 1, 1)
+        self.watchAutoConvertCheckBox = QtGui.QCheckBox(SettingsDialog)
+        self.watchAutoConvertCheckBox.setObjectName(_fromUtf8("watchAutoConvertCheckBox"))
+        self.gridLayout.addWidget(self.watchAutoConvertCheckBox, 3, 1, 1, 3)
+        self.gridLayout_2.addLayout(self.gridLayout, 9, 0, 2, 4)
         self.horizontalLayout_2 = QtGui.QHBoxLayout()
         self.horizontalLayout_2.setObjectName(_fromUtf8("horizontalLayout_2"))
-        spacerItem6 = QtGui.QSpacerItem(88, 20, QtGui.QSizePolicy.Expanding, QtGui.QSizePolicy.Minimum)
-        self.horizontalLayout_2.addItem(spacerItem6)
+        spacerItem8 = QtGui.QSpacerItem(88, 20, QtGui.QSizePolicy.Expanding, QtGui.QSizePolicy.Minimum)
+        self.horizontalLayout_2.addItem(spacerItem8)
         self.pushButton = QtGui.QPushButton(SettingsDialog)
         self.pushButton.setObjectName(_fromUtf8("pushButton"))
         self.horizontalLayout_2.addWidget(self.pushButton)
@@ -129,14 +156,16 @@ class Ui_SettingsDialog(object):
         self.buttonBox.setStandardButtons(QtGui.QDialogButtonBox.Cancel|QtGui.QDialogButtonBox.Ok)
         self.buttonBox.setObjectName(_fromUtf8("buttonBox"))
         self.horizontalLayout_2.addWidget(self.buttonBox)
-        spacerItem7 = QtGui.QSpacerItem(98, 20, QtGui.QSizePolicy.Expanding, QtGui.QSizePolicy.Minimum)
-        self.horizontalLayout_2.addItem(spacerItem7)
-        self.gridLayout_2.addLayout(self.horizontalLayout_2, 7, 0, 1, 4)
+        spacerItem9 = QtGui.QSpacerItem(98, 20, QtGui.QSizePolicy.Expanding, QtGui.QSizePolicy.Minimum)
+        self.horizontalLayout_2.addItem(spacerItem9)
+        self.gridLayout_2.addLayout(self.horizontalLayout_2, 11, 0, 1, 4)
 
         self.retranslateUi(SettingsDialog)
         QtCore.QObject.connect(self.buttonBox, QtCore.SIGNAL(_fromUtf8("accepted()")), SettingsDialog.accept)
         QtCore.QObject.connect(self.buttonBox, QtCore.SIGNAL(_fromUtf8("rejected()")), SettingsDialog.reject)
         QtCore.QObject.connect(self.changeAddToITunesPathButton, QtCore.SIGNAL(_fromUtf8("clicked()")), SettingsDialog.changeAddToITunesPath)
+        QtCore.QObject.connect(self.addWatchFolderButton, QtCore.SIGNAL(_fromUtf8("clicked()")), SettingsDialog.addWatchFolder)
+        QtCore.QObject.connect(self.removeWatchFolderButton, QtCore.SIGNAL(_fromUtf8("clicked()")), SettingsDialog.removeWatchFolder)
         QtCore.QObject.connect(self.pushButton, QtCore.SIGNAL(_fromUtf8("clicked()")), SettingsDialog.restoreDefaults)
         QtCore.QMetaObject.connectSlotsByName(SettingsDialog)
 
@@ -155,8 +184,17 @@ class Ui_SettingsDialog(object):
         self.defaultArtRadioButtonImageFileIdenticon.setText(QtGui.QApplication.translate("SettingsDialog", "Image File (fallback to Identicon)", None, QtGui.QApplication.UnicodeUTF8))
         self.defaultArtRadioButtonImageFileVisicon.setText(QtGui.QApplication.translate("SettingsDialog", "Image File (fallback to Visicon)", None, QtGui.QApplication.UnicodeUTF8))
         self.defaultArtRadioButtonImageFileNoCoverArt.setText(QtGui.QApplication.translate("SettingsDialog", "Image File (fallback to No Cover Art)", None, QtGui.QApplication.UnicodeUTF8))
+        self.label_5.setText(QtGui.QApplication.translate("SettingsDialog", "Watch Folders", None, QtGui.QApplication.UnicodeUTF8))
+        self.watchFoldersListWidget.setToolTip(QtGui.QApplication.translate("SettingsDialog", "New recordings which appear in these folders, such as where finished downloads are saved, are added to the queue.", None, QtGui.QApplication.UnicodeUTF8))
+        self.addWatchFolderButton.setText(QtGui.QApplication.translate("SettingsDialog", "Add Folder", None, QtGui.QApplication.UnicodeUTF8))
+        self.removeWatchFolderButton.setText(QtGui.QApplication.translate("SettingsDialog", "Remove Folder", None, QtGui.QApplication.UnicodeUTF8))
+        self.label_6.setText(QtGui.QApplication.translate("SettingsDialog", "Wait Before Loading", None, QtGui.QApplication.UnicodeUTF8))
+        self.watchQuietSecondsSpinBox.setToolTip(QtGui.QApplication.translate("SettingsDialog", "How long a new recording\'s folder must go unchanged before it is loaded, so that downloads are finished first.", None, QtGui.QApplication.UnicodeUTF8))
+        self.watchQuietSecondsSpinBox.setSuffix(QtGui.QApplication.translate("SettingsDialog", " seconds", None, QtGui.QApplication.UnicodeUTF8))
         self.checkForUpdatesCheckBox.setText(QtGui.QApplication.translate("SettingsDialog", "Check For Updates On Startup", None, QtGui.QApplication.UnicodeUTF8))
         self.sendErrorReportsCheckBox.setText(QtGui.QApplication.translate("SettingsDialog", "Send Error Reports To Developer", None, QtGui.QApplication.UnicodeUTF8))
         self.verifyMd5HashesCheckBox.setText(QtGui.QApplication.translate("SettingsDialog", "Verify MD5 Hashes", None, QtGui.QApplication.UnicodeUTF8))
+        self.watchAutoConvertCheckBox.setToolTip(QtGui.QApplication.translate("SettingsDialog", "Convert recordings found in the watch folders as soon as they are loaded.", None, QtGui.QApplication.UnicodeUTF8))
+        self.watchAutoConvertCheckBox.setText(QtGui.QApplication.translate("SettingsDialog", "Convert New Recordings Automatically", None, QtGui.QApplication.UnicodeUTF8))
         self.pushButton.setText(QtGui.QApplication.translate("SettingsDialog", "Restore Defaults", None, QtGui.QApplication.UnicodeUTF8))
 
@@ -3,6 +3,12 @@ Some tests for the audiotools functions that BootTunes uses.
 """
 import unittest
 import os
+import math
+import array
+import shutil
+import tempfile
+import cStringIO
+import threading
 import audiotools
 from  PyQt4.QtCore import QDir
 
@@ -36,5 +42,352 @@ class AudiotoolsTestCase(unittest.TestCase):
         self.assertTrue(os.path.exists(self.testPath + '/output/2.m4a'))
         pass
     
+class ALACEncodingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempPath = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempPath)
+
+    def getPcmData(self, frames):
+        """
+        @rtype: str
+        @return: frames of 16-bit stereo PCM which doesn't compress too well
+
+        """
+        samples = array.array('h', [
+            int(8000 * math.sin(i / 20.0)) + (i * 7919) % 301
+            for i in xrange(frames * 2)
+        ])
+        return samples.tostring()
+
+    def getPcmReader(self, pcmData):
+        """
+        @type pcmData: str
+
+        @rtype: audiotools.PCMReader
+
+        """
+        return audiotools.PCMReader(
+            cStringIO.StringIO(pcmData),
+            sample_rate=44100,
+            channels=2,
+            channel_mask=0x3,
+            bits_per_sample=16
+        )
+
+    def readPcmData(self, audioFile):
+        """
+        @type audioFile: audiotools.AudioFile
+
+        @rtype: str
+        @return: All of audioFile's decoded PCM
+
+        """
+        pcmReader = audioFile.to_pcm()
+        data = []
+        frameList = pcmReader.read(audiotools.BUFFER_SIZE)
+        while len(frameList) > 0:
+            data.append(frameList.to_bytes(False, True))
+            frameList = pcmReader.read(audiotools.BUFFER_SIZE)
+        pcmReader.close()
+        return ''.join(data)
+
+    def getStblAtom(self, alacFile, atomType):
+        """
+        @type alacFile: audiotools.ALACAudio
+
+        @type atomType: str
+
+        @rtype: str
+        @return: The data of one of the tables in alacFile's stbl atom
+
+        """
+        stbl = alacFile.qt_stream['moov']['trak']['mdia']['minf']['stbl']
+        return stbl[atomType].data
+
+    def testEncodingOnSeveralProcessesGivesTheSameFile(self):
+        chunkBlocks = audiotools.ALACAudio.CHUNK_BLOCKS
+        # Smaller chunks, so that a short stream is split several times
+        audiotools.ALACAudio.CHUNK_BLOCKS = 2
+        try:
+            # The final chunk is neither whole nor block-aligned
+            pcmData = self.getPcmData(4096 * 2 * 4 + 1000)
+            singleFile = audiotools.ALACAudio.from_pcm(
+                os.path.join(self.tempPath, 'single.m4a'),
+                self.getPcmReader(pcmData),
+                processes=1
+            )
+            multipleFile = audiotools.ALACAudio.from_pcm(
+                os.path.join(self.tempPath, 'multiple.m4a'),
+                self.getPcmReader(pcmData),
+                processes=3
+            )
+        finally:
+            audiotools.ALACAudio.CHUNK_BLOCKS = chunkBlocks
+
+        for atomType in ['stts', 'stsz', 'stco']:
+            self.assertEquals(
+                self.getStblAtom(singleFile, atomType),
+                self.getStblAtom(multipleFile, atomType)
+            )
+        self.assertEquals(
+            singleFile.qt_stream['mdat'].data,
+            multipleFile.qt_stream['mdat'].data
+        )
+        self.assertEquals(pcmData, self.readPcmData(multipleFile))
+
+    def getMetadata(self):
+        """
+        @rtype: audiotools.M4AMetaData
+        @return: Tags and cover art like those ConvertFilesThread writes
+
+        """
+        metadata = audiotools.M4AMetaData.converted(audiotools.MetaData(
+            track_name=u'First Song',
+            track_number=1,
+            track_total=3,
+            album_name=u'1980-12-01 - Topeka, KS - The Venue',
+            artist_name=u'The Foo Bars'
+        ))
+        metadata['cpil'] = metadata.binary_atom(
+            'cpil',
+            '\x00\x00\x00\x15\x00\x00\x00\x00\x00'
+        )
+        metadata['\xa9gen'] = metadata.text_atom('\xa9gen', u'Rock')
+        imageFile = open(
+            os.path.join(os.path.dirname(__file__), 'test-shows/show2/art.jpg'),
+            'rb'
+        )
+        metadata.add_image(audiotools.Image.new(imageFile.read(), 'cover', 0))
+        imageFile.close()
+        return metadata
+
+    def assertMetadataReadBack(self, metadata, alacFile):
+        """
+        Assert that the tags and cover art in metadata were written to
+        alacFile.
+
+        @type metadata: audiotools.M4AMetaData
+
+        @type alacFile: audiotools.ALACAudio
+
+        """
+        readMetadata = audiotools.open(alacFile.filename).get_metadata()
+        self.assertEquals(metadata.track_name, readMetadata.track_name)
+        self.assertEquals(metadata.track_number, readMetadata.track_number)
+        self.assertEquals(metadata.track_total, readMetadata.track_total)
+        self.assertEquals(metadata.album_name, readMetadata.album_name)
+        self.assertEquals(metadata.artist_name, readMetadata.artist_name)
+        self.assertEquals(metadata['cpil'], readMetadata['cpil'])
+        self.assertEquals(metadata['\xa9gen'], readMetadata['\xa9gen'])
+        self.assertEquals(
+            [image.data for image in metadata.images()],
+            [image.data for image in readMetadata.images()]
+        )
+
+    def testMetadataWrittenWhileEncodingIsReadBack(self):
+        pcmData = self.getPcmData(4096 * 3 + 500)
+        metadata = self.getMetadata()
+        alacFile = audiotools.ALACAudio.from_pcm(
+            os.path.join(self.tempPath, 'tagged.m4a'),
+            self.getPcmReader(pcmData),
+            total_pcm_frames=len(pcmData) / 4,
+            metadata=metadata
+        )
+
+        self.assertMetadataReadBack(metadata, alacFile)
+        self.assertEquals(pcmData, self.readPcmData(alacFile))
+
+    def testFileIsRebuiltWhenTheSizeEstimateIsTooSmall(self):
+        pcmData = self.getPcmData(4096 * 3 + 500)
+        metadata = self.getMetadata()
+        estimate = audiotools.ALACAudio.__dict__['__estimate_pre_mdat_size__']
+        # Far too little room for ftyp and moov in front of mdat
+        audiotools.ALACAudio.__estimate_pre_mdat_size__ = classmethod(
+            lambda cls, *args, **kwargs: 64
+        )
+        try:
+            alacFile = audiotools.ALACAudio.from_pcm(
+                os.path.join(self.tempPath, 'rebuilt.m4a'),
+                self.getPcmReader(pcmData),
+                total_pcm_frames=len(pcmData) / 4,
+                metadata=metadata
+            )
+        finally:
+            audiotools.ALACAudio.__estimate_pre_mdat_size__ = estimate
+
+        self.assertEquals(
+            ['ftyp', 'moov', 'free', 'mdat'],
+            alacFile.qt_stream.keys()
+        )
+        self.assertMetadataReadBack(metadata, alacFile)
+        self.assertEquals(pcmData, self.readPcmData(alacFile))
+        self.assertEquals(['rebuilt.m4a'], os.listdir(self.tempPath))
+
+class ListPCMReader(object):
+    """
+    A PCMReader which returns the strings in a list, one per read, and
+    can be told to fail or to wait along the way.
+
+    """
+    sample_rate = 44100
+    channels = 2
+    channel_mask = 0x3
+    bits_per_sample = 16
+
+    def __init__(self, data, failAt=None, readEvents=None):
+        """
+        @type data: list
+        @param data: The strings to return from each read
+
+        @type failAt: int
+        @param failAt: Index of the read which raises IOError
+
+        @type readEvents: dict
+        @param readEvents: Maps read indexes to a threading.Event to set
+                           once that read has returned
+
+        """
+        self.data = data
+        self.failAt = failAt
+        self.readEvents = readEvents or {}
+        self.reads = 0
+
+    def read(self, bytes):
+        index = self.reads
+        self.reads += 1
+        if index == self.failAt:
+            raise IOError('invalid checksum in frame')
+        if index in self.readEvents:
+            self.readEvents[index].set()
+        if index < len(self.data):
+            return self.data[index]
+        return ''
+
+class EndlessPCMReader(ListPCMReader):
+    """
+    A ListPCMReader which never runs out of data.
+
+    """
+    def __init__(self):
+        super(EndlessPCMReader, self).__init__([])
+
+    def read(self, bytes):
+        self.reads += 1
+        return 'frames %d' % self.reads
+
+class PipelineTestCase(unittest.TestCase):
+
+    def readAll(self, pcmReader):
+        """
+        @type pcmReader: audiotools.PCMReader
+
+        @rtype: list
+        @return: Everything pcmReader returns, a read at a time
+
+        """
+        data = []
+        frameList = pcmReader.read(audiotools.BUFFER_SIZE)
+        while len(frameList) > 0:
+            data.append(frameList)
+            frameList = pcmReader.read(audiotools.BUFFER_SIZE)
+        return data
+
+    def testStagesRunInOrderOnEveryFrameList(self):
+        data = ['frames %d' % i for i in xrange(50)]
+        result = audiotools.pipeline(
+            ListPCMReader(data),
+            [lambda s: s + ' a', lambda s: s + ' b', lambda s: s.upper()],
+            self.readAll,
+            queue_depth=1
+        )
+        self.assertEquals([s.upper() + ' A B' for s in data], result)
+
+    def testWithoutStagesTheSinkReadsWhatThePCMReaderReturns(self):
+        data = ['frames %d' % i for i in xrange(50)]
+        self.assertEquals(
+            data,
+            audiotools.pipeline(ListPCMReader(data), [], self.readAll)
+        )
+
+    def testPCMReaderReadsAheadOfTheSink(self):
+        thirdRead = threading.Event()
+        def sink(pcmReader):
+            # Only possible if reading doesn't wait on the sink
+            thirdRead.wait(5)
+            return thirdRead.is_set(), self.readAll(pcmReader)
+        data = ['frames %d' % i for i in xrange(5)]
+        self.assertEquals(
+            (True, data),
+            audiotools.pipeline(
+                ListPCMReader(data, readEvents={2: thirdRead}), [], sink
+            )
+        )
+
+    def testPCMReaderErrorsAreRaisedBySinkReads(self):
+        data = ['frames %d' % i for i in xrange(50)]
+        reads = []
+        def sink(pcmReader):
+            frameList = pcmReader.read(audiotools.BUFFER_SIZE)
+            while len(frameList) > 0:
+                reads.append(frameList)
+                frameList = pcmReader.read(audiotools.BUFFER_SIZE)
+        threads = threading.activeCount()
+        self.assertRaises(
+            IOError,
+            audiotools.pipeline,
+            ListPCMReader(data, failAt=20),
+            [lambda s: s],
+            sink
+        )
+        self.assertEquals(data[:20], reads)
+        self.assertEquals(threads, threading.activeCount())
+
+    def testStageErrorsAreRaisedBySinkReads(self):
+        def stage(s):
+            if s == 'frames 10':
+                raise ValueError(s)
+            return s
+        threads = threading.activeCount()
+        self.assertRaises(
+            ValueError,
+            audiotools.pipeline,
+            ListPCMReader(['frames %d' % i for i in xrange(50)]),
+            [stage, lambda s: s],
+            self.readAll
+        )
+        self.assertEquals(threads, threading.activeCount())
+
+    def testEveryThreadFinishesWhenTheSinkStopsEarly(self):
+        def sink(pcmReader):
+            pcmReader.read(audiotools.BUFFER_SIZE)
+            raise audiotools.EncodingError('disk full')
+        threads = threading.activeCount()
+        # The PCMReader and each stage are left blocked on full queues
+        self.assertRaises(
+            audiotools.EncodingError,
+            audiotools.pipeline,
+            EndlessPCMReader(),
+            [lambda s: s, lambda s: s],
+            sink,
+            queue_depth=1
+        )
+        self.assertEquals(threads, threading.activeCount())
+
+    def testSinkResultIsReturnedWithEveryThreadFinished(self):
+        threads = threading.activeCount()
+        self.assertEquals(
+            'first',
+            audiotools.pipeline(
+                EndlessPCMReader(),
+                [lambda s: s],
+                lambda pcmReader: 'first',
+                queue_depth=1
+            )
+        )
+        self.assertEquals(threads, threading.activeCount())
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
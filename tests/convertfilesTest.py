@@ -0,0 +1,164 @@
+import os
+import shutil
+import tempfile
+import unittest
+from PyQt4.QtCore import *
+from dialogs.threads import workers
+from dialogs.threads.queuedialog.convertfiles import ConvertFilesThread, \
+    getProgressStage
+
+class FakeQueueDialog(QObject):
+    """
+    Stands in for QueueDialog as the parent of ConvertFilesThread.
+
+    """
+    def __init__(self, validRecordings):
+        super(FakeQueueDialog, self).__init__()
+        self.validRecordings = validRecordings
+        self.failedTracks = []
+
+class FakeFrameList(object):
+    """
+    Stands in for a FrameList of a number of PCM frames.
+
+    """
+    def __init__(self, frames):
+        self.frames = frames
+
+class FakeMessages(list):
+    """
+    Stands in for the messages queue of a WorkerPool.
+
+    """
+    def put(self, message):
+        self.append(message)
+
+class FakeWorkerPool(object):
+    """
+    Stands in for a WorkerPool whose tasks have reported progress.
+
+    """
+    def __init__(self, progress):
+        self.progress = progress
+
+    def getProgress(self, taskId):
+        return self.progress.get(taskId)
+
+class ConvertFilesThreadTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempPath = unicode(tempfile.mkdtemp())
+        self.sourcePath = os.path.join(self.tempPath, u'01.flac')
+        self.writeFile(self.sourcePath, 'source audio')
+        self.parent = FakeQueueDialog([
+            {'metadata': {'tempDir': QDir(self.tempPath)}}
+        ])
+        self.thread = ConvertFilesThread(QReadWriteLock(), self.parent)
+        self.thread.tracksRemaining = [2]
+
+    def tearDown(self):
+        shutil.rmtree(self.tempPath)
+
+    def writeFile(self, filePath, data):
+        fileObj = open(filePath, 'wb')
+        fileObj.write(data)
+        fileObj.close()
+
+    def getJob(self, trackIndex=0, status='done'):
+        """
+        @rtype: dict
+        @return: A job like those returned by ConvertFilesThread.prepareJob()
+
+        """
+        return {
+            'recordingIndex': 0,
+            'trackIndex'    : trackIndex,
+            'trackName'     : u'Track %d' % trackIndex,
+            'filePath'      : self.sourcePath,
+            'targetFile'    : os.path.join(
+                self.tempPath, u'%d.m4a' % trackIndex
+            ),
+            'pcmFrameCount' : None,
+            'tagsHash'      : 'tags',
+            'status'        : status
+        }
+
+    def testJournaledTrackIsSkippedOnlyWhileNothingHasChanged(self):
+        job = self.getJob()
+        self.writeFile(job['targetFile'], 'converted audio')
+        self.assertFalse(self.thread.isJournaled(job))
+
+        self.thread.addToJournal(job)
+        self.assertTrue(os.path.exists(self.thread.getJournalPath(0)))
+        self.assertTrue(self.thread.isJournaled(job))
+
+        # The journal is read back from the tempDir when resuming
+        resumed = ConvertFilesThread(QReadWriteLock(), self.parent)
+        self.assertTrue(resumed.isJournaled(job))
+
+        # The tags changed
+        job['tagsHash'] = 'other tags'
+        self.assertFalse(resumed.isJournaled(job))
+        job['tagsHash'] = 'tags'
+
+        # The converted file changed
+        self.writeFile(job['targetFile'], 'converted audio, but cut short')
+        self.assertFalse(resumed.isJournaled(job))
+
+        # The converted file is gone
+        os.remove(job['targetFile'])
+        self.assertFalse(resumed.isJournaled(job))
+
+    def testFailedTrackIsRemovedAndNotJournaled(self):
+        job = self.getJob(status='failed')
+        self.writeFile(job['targetFile'], 'partly converted audio')
+        self.thread.finishJob(job)
+
+        self.assertFalse(os.path.exists(job['targetFile']))
+        self.assertEquals([self.sourcePath], self.parent.failedTracks)
+        self.assertFalse(os.path.exists(self.thread.getJournalPath(0)))
+
+    def testTrackWhichIsNotACompleteM4aIsTreatedAsFailed(self):
+        # Reported as done, but the file isn't an m4a
+        job = self.getJob()
+        self.writeFile(job['targetFile'], 'not an m4a')
+        self.thread.finishJob(job)
+
+        self.assertEquals('failed', job['status'])
+        self.assertFalse(os.path.exists(job['targetFile']))
+        self.assertEquals([self.sourcePath], self.parent.failedTracks)
+        self.assertFalse(self.thread.isJournaled(self.getJob()))
+
+    def testProgressStageReportsEachPercentOfTheTrackOnce(self):
+        messages = FakeMessages()
+        workers.currentTask = (7, messages)
+        try:
+            stage = getProgressStage(1000)
+            for frames in [4, 4, 4, 300, 688, 0]:
+                frameList = FakeFrameList(frames)
+                self.assertTrue(frameList is stage(frameList))
+        finally:
+            workers.currentTask = None
+        self.assertEquals(
+            [(7, 'progress', 0.01), (7, 'progress', 0.31),
+             (7, 'progress', 1.0)],
+            messages
+        )
+
+    def testProgressTextIncludesWhatWorkersReported(self):
+        self.thread.pool = FakeWorkerPool({1: 0.42})
+        jobs = [self.getJob(0), self.getJob(1)]
+        jobs[0]['taskId'] = 0
+        jobs[1]['taskId'] = 1
+        self.assertEquals(
+            'Converting 2 tracks\n\n"Track 0"\n"Track 1" (42%)',
+            self.thread.getProgressText(jobs)
+        )
+        self.assertEquals(
+            'Converting "Track 1" (42%)',
+            self.thread.getProgressText(jobs[1:])
+        )
+        self.thread.pool = None
+
+if __name__ == '__main__':
+    unittest.main()
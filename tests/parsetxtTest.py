@@ -1,5 +1,11 @@
+import os
+import shutil
+import tempfile
 import unittest
-from parsetxt import TxtParser, ParseTxtError
+import parsetxt
+from multiprocessing.pool import ThreadPool
+from parsetxt import TxtParser, ParseTxtError, CityIndex, parse, parseMany, \
+    reparseWithArtist
 
 # Typical text arrangement
 sampleTxt = \
@@ -322,6 +328,24 @@ class ParsetxtTestCase(unittest.TestCase):
             ._findTracklist()
         self.assertEquals(['One', 'Two', 'Three'], tracklist)
 
+    def testFindTracklistTakesOutPiecesWhichAppearMoreThanOnce(self):
+        # A piece repeated within a longer one is taken out everywhere
+        tracklist = TxtParser(
+            '01. One\n02. Two\n\nNotes\n\n01. One\n02. Two\n03. Three\n'
+        )._findTracklist()
+        self.assertEquals(['One', 'Two', 'Three'], tracklist)
+
+        tracklist = TxtParser(
+            '1. Intro\n2. Jam\n\nSet 2\n\n1. Intro\n2. Jam\n3. Outro\n'
+        )._findTracklist()
+        self.assertEquals(['Intro', 'Jam', 'Outro'], tracklist)
+
+        tracklist = TxtParser(
+            'The Foo Bars\n1980-12-01\nTopeka, KS\n\n01. One\n02. Two\n' +
+            'Encore\n03. Three\n\n01. One\n'
+        )._findTracklist()
+        self.assertEquals(['One', 'Two', 'Three', 'One'], tracklist)
+
     def testFindLocationTriesToGetGeographicalLocationButNotVenue(self):
         """
         Getting the first line of the metadata block with a comma
@@ -604,5 +628,111 @@ class ParsetxtTestCase(unittest.TestCase):
         )
         self.assertEquals(sampleTxt, metadata['comments'])
 
+    def testCityIndexFindsCitiesAsWholeWordsAfterTheStart(self):
+        index = CityIndex({u'Paris': {}, u'York': {}, u'New York': {}})
+
+        cities = index.findCities(u'Live in Paris, France')
+        self.assertEquals([(u'Paris', {})], cities)
+
+        # Cities may be found within other cities
+        cities = index.findCities(u'Live in New York, NY')
+        self.assertEquals(
+            [u'New York', u'York'],
+            sorted([city for city, cityDetails in cities])
+        )
+
+        # Not part of a longer word
+        self.assertEquals([], index.findCities(u'The New Parish'))
+        self.assertEquals([], index.findCities(u'Live in Yorkshire'))
+
+        # Not at the very start of the text
+        self.assertEquals([], index.findCities(u'Paris, France'))
+
+        # But may be at the very end
+        cities = index.findCities(u'Live in Paris')
+        self.assertEquals([(u'Paris', {})], cities)
+
+    def testParseManyFindsTheSameAsParseTxt(self):
+        texts = [sampleTxt, motbText, sampleTxt.replace('\n', '\r\n')]
+        expected = [TxtParser(txt).parseTxt() for txt in texts]
+        parsetxt.parsedTxts.clear()
+        self.assertEquals(expected, parseMany(texts, 2))
+        # Again from the cache
+        self.assertEquals(expected, parseMany(texts, 2))
+        self.assertEquals(expected[1], parse(motbText))
+
+        # Changing a result doesn't change what is cached
+        parse(sampleTxt)['tracklist'].append(u'Fourth Song')
+        self.assertEquals(expected[0], parse(sampleTxt))
+
+    def testParseFindsTheSameInAPoolSharedByThreads(self):
+        texts = [sampleTxt, motbText]
+        expected = [TxtParser(txt).parseTxt() for txt in texts]
+        pool = parsetxt.createParsePool(2)
+        try:
+            parsetxt.parsedTxts.clear()
+            threadPool = ThreadPool(2)
+            self.assertEquals(
+                expected,
+                threadPool.map(lambda txt: parse(txt, pool), texts)
+            )
+            threadPool.close()
+        finally:
+            if pool is not None:
+                pool.terminate()
+            parsetxt.parsedTxts.clear()
+
+    def testParseManyCachesResultsInParseCacheDir(self):
+        cacheDir = tempfile.mkdtemp()
+        parsetxt.setParseCacheDir(cacheDir)
+        try:
+            parsetxt.parsedTxts.clear()
+            expected = parseMany([sampleTxt, motbText], 1)
+            self.assertEquals(2, len(os.listdir(cacheDir)))
+
+            parsetxt.parsedTxts.clear()
+            self.assertEquals(expected, parseMany([sampleTxt, motbText], 1))
+
+            parsetxt.pruneParseCache(1)
+            self.assertEquals(1, len(os.listdir(cacheDir)))
+        finally:
+            parsetxt.setParseCacheDir(None)
+            parsetxt.parsedTxts.clear()
+            shutil.rmtree(cacheDir)
+
+    def testSetFieldDiscardsOnlyTheResultsFoundUsingIt(self):
+        txtParser = TxtParser(sampleTxt)
+        txtParser.parseTxt()
+
+        txtParser.setField('artist', u'Topeka')
+        self.assertTrue(hasattr(txtParser, 'date'))
+        self.assertTrue(hasattr(txtParser, 'tracklist'))
+        self.assertFalse(hasattr(txtParser, 'searchedText'))
+        self.assertFalse(hasattr(txtParser, 'location'))
+        self.assertFalse(hasattr(txtParser, 'venue'))
+        # The artist given is left out of the text searched for the location
+        self.assertEquals(u'Topeka', txtParser.parseTxt()['artist'])
+        self.assertEquals('', txtParser._findLocation())
+
+        # A new txt is parsed from scratch
+        txtParser.setField('txt', motbText)
+        self.assertEquals(TxtParser(motbText).parseTxt(), txtParser.parseTxt())
+
+    def testReparseWithArtistFindsTheSameAsSettingTheArtist(self):
+        metadata = parse(sampleTxt)
+        txtParser = TxtParser(sampleTxt)
+        txtParser.setField('artist', u'Foo Bars')
+        self.assertEquals(
+            txtParser.parseTxt(),
+            reparseWithArtist(metadata, u'Foo Bars')
+        )
+
+        # The tracklist found before is carried over
+        metadata['tracklist'] = [u'One', u'Two']
+        self.assertEquals(
+            [u'One', u'Two'],
+            reparseWithArtist(metadata, u'Foo Bars')['tracklist']
+        )
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -5,6 +5,8 @@ import os
 import sys
 import datetime
 import shutil
+import tempfile
+import audiotools
 from PyQt4.QtGui import *
 from PyQt4.QtCore import *
 from dialogs.queuedialog import *
@@ -244,5 +246,71 @@ class QueueDialogTestCase(unittest.TestCase):
         self.assertNotEquals(text1.find('MD5 mismatch'), -1)
         self.assertEquals(text2.find('MD5 mismatch'), -1)        
 
+    def testParseForFfpsFindsTheFingerprintOfEachFlac(self):
+        thread = LoadShowsThread(QReadWriteLock(), self.queuedialog, [])
+        ffps = thread.parseForFfps(
+            u'; Generated by a fingerprinting tool\r\n'
+            + u'1.flac:0123456789abcdef0123456789ABCDEF\r\n'
+            + u'CD2\\02 Track.FLAC : fedcba9876543210fedcba9876543210\r\n'
+            + u'3.shn:0123456789abcdef0123456789abcdef\r\n'
+            + u'4.flac:not a fingerprint\r\n'
+        )
+        self.assertEquals(
+            {
+                u'1.flac': u'0123456789abcdef0123456789abcdef',
+                u'02 track.flac': u'fedcba9876543210fedcba9876543210'
+            },
+            ffps
+        )
+
+    def testFfpMismatchesWithStreaminfoAreNoted(self):
+        """
+        Fingerprints in a .ffp file are checked against the MD5 in each
+        FLAC's STREAMINFO block, and files which don't match are noted
+        along with the MD5 mismatches.
+
+        """
+        tempPath = unicode(tempfile.mkdtemp())
+        try:
+            showPath = tempPath + u'/show1'
+            shutil.copytree(self.showPath + u'/show1', showPath)
+            ffpFile = open(showPath + u'/show1.ffp', 'w')
+            for fileName in ['1.flac', '2.flac']:
+                audioFile = audiotools.open(showPath + '/' + fileName)
+                ffpFile.write(
+                    '%s:%s\r\n' % (fileName, audioFile.__md5__.encode('hex'))
+                )
+            ffpFile.write('3.flac:%s\r\n' % ('0' * 32))
+            ffpFile.close()
+
+            thread = LoadShowsThread(
+                QReadWriteLock(),
+                self.queuedialog,
+                showPath
+            )
+            thread.run()
+            self.assertEquals(
+                [showPath + u'/3.flac'],
+                self.queuedialog.metadata['md5_mismatches']
+            )
+        finally:
+            shutil.rmtree(tempPath)
+
+    def testChecksumFilesAreNotReadWhenTheScanIsCached(self):
+        showPath = self.showPath + '/' + 'show7'
+        thread = LoadShowsThread(QReadWriteLock(), self.queuedialog, showPath)
+        thread.run()
+
+        reads = []
+        thread = LoadShowsThread(QReadWriteLock(), self.queuedialog, showPath)
+        thread.getMd5s = lambda snapshot: reads.append('md5') or []
+        thread.getFfps = lambda snapshot: reads.append('ffp') or {}
+        thread.run()
+        self.assertEquals([], reads)
+        self.assertEquals(
+            [showPath + '/3.flac'],
+            self.queuedialog.metadata['md5_mismatches']
+        )
+
 if __name__ == '__main__':    
     unittest.main()
\ No newline at end of file
@@ -1,4 +1,9 @@
+import os
+import time
+import shutil
+import tempfile
 import unittest
+import settings
 from settings import Settings
 
 class SettingsTestCase(unittest.TestCase):
@@ -88,5 +93,97 @@ class SettingsTestCase(unittest.TestCase):
 
         self.assertEquals(None, self.settings.getArtistDefaults('The Foo Bars'))
 
+    def testClearTempFilesKeepsDirsWithRecentJournalsAndTheParseCache(self):
+        settingsDir = tempfile.mkdtemp()
+        self.settings.settingsDir = settingsDir
+        self.settings.parseCacheDir = settingsDir + '/test-parsecache'
+        try:
+            for dir in ['finished', 'interrupted', 'abandoned',
+                        'test-parsecache']:
+                os.mkdir(settingsDir + '/' + dir)
+                open(settingsDir + '/' + dir + '/0.m4a', 'wb').close()
+            for dir in ['interrupted', 'abandoned']:
+                open(settingsDir + '/' + dir + '/journal', 'wb').close()
+            expired = time.time() - \
+                (self.settings['journalExpiryDays'] + 1) * 86400
+            os.utime(settingsDir + '/abandoned/journal', (expired, expired))
+
+            self.settings.clearTempFiles()
+
+            self.assertEquals(
+                ['interrupted', 'test-parsecache'],
+                sorted(os.listdir(settingsDir))
+            )
+        finally:
+            shutil.rmtree(settingsDir)
+
+    def testClearTempFilesOnlyClearsTheDirsItIsGiven(self):
+        settingsDir = tempfile.mkdtemp()
+        self.settings.settingsDir = settingsDir
+        self.settings.parseCacheDir = settingsDir + '/test-parsecache'
+        try:
+            for dir in ['mine', 'theirs']:
+                os.mkdir(settingsDir + '/' + dir)
+                open(settingsDir + '/' + dir + '/0.m4a', 'wb').close()
+
+            self.settings.clearTempFiles(['mine'])
+
+            self.assertEquals(['theirs'], os.listdir(settingsDir))
+        finally:
+            shutil.rmtree(settingsDir)
+
+    def testMd5CacheForgetsTheLeastRecentlyUsedFiles(self):
+        tempPath = tempfile.mkdtemp()
+        limit = settings.MD5_CACHE_LIMIT
+        settings.MD5_CACHE_LIMIT = 2
+        self.settings.md5Cache.clear()
+        try:
+            filePaths = [os.path.join(tempPath, name) for name in 'abc']
+            for filePath in filePaths:
+                open(filePath, 'wb').close()
+            self.settings.setCachedMd5(filePaths[0], 'md5 a')
+            self.settings.setCachedMd5(filePaths[1], 'md5 b')
+            # Using a makes b the least recently used
+            self.assertEquals('md5 a', self.settings.getCachedMd5(filePaths[0]))
+            self.settings.setCachedMd5(filePaths[2], 'md5 c')
+
+            self.assertEquals('md5 a', self.settings.getCachedMd5(filePaths[0]))
+            self.assertEquals(None, self.settings.getCachedMd5(filePaths[1]))
+            self.assertEquals('md5 c', self.settings.getCachedMd5(filePaths[2]))
+        finally:
+            settings.MD5_CACHE_LIMIT = limit
+            shutil.rmtree(tempPath)
+
+    def testGetCachedMd5ForgetsFilesWhichAreGone(self):
+        tempPath = tempfile.mkdtemp()
+        self.settings.md5Cache.clear()
+        try:
+            filePath = os.path.join(tempPath, 'a')
+            open(filePath, 'wb').close()
+            self.settings.setCachedMd5(filePath, 'md5 a')
+            os.remove(filePath)
+
+            self.assertEquals(None, self.settings.getCachedMd5(filePath))
+            self.assertEquals(0, len(self.settings.md5Cache))
+        finally:
+            shutil.rmtree(tempPath)
+
+    def testScanCacheForgetsTheLeastRecentlyUsedDirs(self):
+        limit = settings.SCAN_CACHE_LIMIT
+        settings.SCAN_CACHE_LIMIT = 2
+        self.settings.scanCache.clear()
+        try:
+            for dirPath in ['/a', '/b', '/c']:
+                self.settings.setCachedScan(dirPath, [1], {'dir': dirPath})
+
+            self.assertEquals(None, self.settings.getCachedScan('/a', [1]))
+            self.assertEquals(None, self.settings.getCachedScan('/b', [2]))
+            self.assertEquals(
+                {'dir': '/c'},
+                self.settings.getCachedScan('/c', [1])
+            )
+        finally:
+            settings.SCAN_CACHE_LIMIT = limit
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
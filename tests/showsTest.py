@@ -0,0 +1,95 @@
+# coding=utf-8
+import os
+import codecs
+import shutil
+import tempfile
+import unittest
+import shows
+from shows import detectEncoding, readFileOfUnknownEncoding, DirSnapshot
+
+class ShowsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempPath = unicode(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.tempPath)
+
+    def writeFile(self, name, data):
+        filePath = os.path.join(self.tempPath, name)
+        if not os.path.isdir(os.path.dirname(filePath)):
+            os.makedirs(os.path.dirname(filePath))
+        fileObj = open(filePath, 'wb')
+        fileObj.write(data)
+        fileObj.close()
+        return filePath
+
+    def testDetectEncodingPrefersUtf8(self):
+        self.assertEquals('utf-8', detectEncoding('The Foo Bars'))
+        text = u'Bj\xf6rk\n2001-05-05\nReykjav\xedk'
+        self.assertEquals('utf-8', detectEncoding(text.encode('utf-8')))
+
+    def testDetectEncodingKeepsByteOrderMarks(self):
+        text = u'The Foo Bars\n1980-12-01'
+        data = codecs.BOM_UTF8 + text.encode('utf-8')
+        self.assertEquals(u'\ufeff' + text, data.decode(detectEncoding(data)))
+
+        data = codecs.BOM_UTF16_LE + text.encode('utf-16-le')
+        self.assertEquals(u'\ufeff' + text, data.decode(detectEncoding(data)))
+
+        data = codecs.BOM_UTF16_BE + text.encode('utf-16-be')
+        self.assertEquals(u'\ufeff' + text, data.decode(detectEncoding(data)))
+
+    def testReadFileOfUnknownEncodingFallsBackToLatin1(self):
+        # Only the start of the file is looked at to detect the encoding,
+        # so it looks like ASCII
+        text = u'a' * (shows.DETECTION_SAMPLE_SIZE + 10) + u'Caf\xe9 \xff'
+        filePath = self.writeFile(u'info.txt', text.encode('latin-1'))
+        self.assertEquals(text, readFileOfUnknownEncoding(filePath))
+
+    def testReadFileOfUnknownEncodingReadsUtf8(self):
+        text = u'Bj\xf6rk\n2001-05-05\nReykjav\xedk'
+        filePath = self.writeFile(u'info.txt', text.encode('utf-8'))
+        self.assertEquals(text, readFileOfUnknownEncoding(filePath))
+
+    def testGetSignatureChangesWithTheFilesOfTheDirAndItsFolders(self):
+        self.writeFile(u'info.txt', 'The Foo Bars')
+        self.writeFile(u'CD1/01.flac', 'x' * 10)
+        signature = DirSnapshot(self.tempPath).getSignature()
+        self.assertEquals(
+            [u'CD1/01.flac', u'info.txt'],
+            [relativePath for relativePath, size, mtime in signature]
+        )
+        self.assertEquals(
+            [10, 12],
+            [size for relativePath, size, mtime in signature]
+        )
+
+        # Unchanged
+        self.assertEquals(
+            signature,
+            DirSnapshot(self.tempPath).getSignature()
+        )
+
+        # A file grows in a folder
+        self.writeFile(u'CD1/01.flac', 'x' * 20)
+        self.assertNotEquals(
+            signature,
+            DirSnapshot(self.tempPath).getSignature()
+        )
+
+        # A file is added, but hidden files are left out
+        signature = DirSnapshot(self.tempPath).getSignature()
+        self.writeFile(u'.hidden', 'x')
+        self.assertEquals(
+            signature,
+            DirSnapshot(self.tempPath).getSignature()
+        )
+        self.writeFile(u'info.md5', 'x')
+        self.assertNotEquals(
+            signature,
+            DirSnapshot(self.tempPath).getSignature()
+        )
+
+if __name__ == '__main__':
+    unittest.main()
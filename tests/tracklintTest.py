@@ -0,0 +1,179 @@
+"""
+Tests for decoding FLACs which have ID3 tags stuck to them.
+"""
+import unittest
+import os
+import shutil
+import struct
+import tempfile
+import audiotools
+import tracklint
+
+class FailingPCMReader(object):
+    """
+    Passes reads through to a PCMReader until it has made a number of them,
+    then fails the way a decoder does when its stream goes wrong.
+
+    """
+    def __init__(self, pcmReader, reads):
+        """
+        @type pcmReader: audiotools.PCMReader
+
+        @type reads: int
+        @param reads: How many reads succeed before one fails
+
+        """
+        self.pcmReader = pcmReader
+        self.reads = reads
+        self.sample_rate = pcmReader.sample_rate
+        self.channels = pcmReader.channels
+        self.channel_mask = pcmReader.channel_mask
+        self.bits_per_sample = pcmReader.bits_per_sample
+
+    def read(self, bytes):
+        if self.reads == 0:
+            raise IOError('invalid checksum in frame')
+        self.reads -= 1
+        return self.pcmReader.read(bytes)
+
+    def close(self):
+        self.pcmReader.close()
+
+class BrokenFlacAudioTestCase(unittest.TestCase):
+
+    cleanPath = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'test-shows/show1/1.flac'
+    )
+
+    def setUp(self):
+        self.tempPath = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempPath)
+
+    def getId3v2Header(self):
+        """
+        @rtype: str
+        @return: An ID3v2.3 tag holding only padding
+
+        """
+        padding = 1000
+        size = ''.join([
+            chr((padding >> shift) & 0x7F) for shift in (21, 14, 7, 0)
+        ])
+        return 'ID3' + struct.pack('>BBB', 3, 0, 0) + size + '\x00' * padding
+
+    def getId3v1Trailer(self):
+        """
+        @rtype: str
+        @return: An ID3v1 tag
+
+        """
+        return ('TAG' + 'Title'.ljust(30, '\x00') + 'Artist'.ljust(30, '\x00')
+                + 'Album'.ljust(30, '\x00') + '1980' + '\x00' * 30 + '\xff')
+
+    def writeBrokenFlac(self, header, trailer):
+        """
+        @type header: str
+        @param header: What to put in front of the clean FLAC
+
+        @type trailer: str
+        @param trailer: What to put behind the clean FLAC
+
+        @rtype: str
+        @return: Path of the broken FLAC
+
+        """
+        cleanFile = open(self.cleanPath, 'rb')
+        brokenPath = os.path.join(self.tempPath, 'broken.flac')
+        brokenFile = open(brokenPath, 'wb')
+        brokenFile.write(header)
+        brokenFile.write(cleanFile.read())
+        brokenFile.write(trailer)
+        brokenFile.close()
+        cleanFile.close()
+        return brokenPath
+
+    def readPcmData(self, pcmReader):
+        """
+        @type pcmReader: audiotools.PCMReader
+
+        @rtype: str
+        @return: All of pcmReader's PCM, after which it's closed
+
+        """
+        data = []
+        frameList = pcmReader.read(audiotools.BUFFER_SIZE)
+        while len(frameList) > 0:
+            data.append(frameList.to_bytes(False, True))
+            frameList = pcmReader.read(audiotools.BUFFER_SIZE)
+        pcmReader.close()
+        return ''.join(data)
+
+    def assertDecodesLikeTheCleanFlac(self, brokenPath):
+        """
+        Assert that brokenPath opens as a BrokenFlacAudio which decodes
+        to the same PCM as the clean FLAC, leaving no temporary files behind.
+
+        @type brokenPath: str
+
+        """
+        tempFiles = set(os.listdir(tempfile.gettempdir()))
+        brokenFile = audiotools.open(brokenPath)
+        self.assertTrue(isinstance(brokenFile, tracklint.BrokenFlacAudio))
+        self.assertEquals(
+            self.readPcmData(audiotools.open(self.cleanPath).to_pcm()),
+            self.readPcmData(brokenFile.to_pcm())
+        )
+        self.assertEquals(tempFiles, set(os.listdir(tempfile.gettempdir())))
+
+    def testFlacWithId3v2HeaderDecodesInPlace(self):
+        self.assertDecodesLikeTheCleanFlac(
+            self.writeBrokenFlac(self.getId3v2Header(), '')
+        )
+
+    def testFlacWithId3v1TrailerDecodesInPlace(self):
+        self.assertDecodesLikeTheCleanFlac(
+            self.writeBrokenFlac('', self.getId3v1Trailer())
+        )
+
+    def testFlacWithBothId3TagsDecodesInPlace(self):
+        self.assertDecodesLikeTheCleanFlac(
+            self.writeBrokenFlac(self.getId3v2Header(), self.getId3v1Trailer())
+        )
+
+    def testDecodingCarriesOnFromACopyWhenTheDecoderFails(self):
+        if not hasattr(os, 'mkfifo'):
+            return
+        fifoPcm = tracklint.BrokenFlacAudio.__dict__['__fifo_pcm__']
+        def failingFifoPcm(track, flacStart, flacEnd):
+            (pcmReader, cleanup) = fifoPcm(track, flacStart, flacEnd)
+            return (FailingPCMReader(pcmReader, 2), cleanup)
+        tracklint.BrokenFlacAudio.__fifo_pcm__ = failingFifoPcm
+        try:
+            self.assertDecodesLikeTheCleanFlac(
+                self.writeBrokenFlac(self.getId3v2Header(), self.getId3v1Trailer())
+            )
+        finally:
+            tracklint.BrokenFlacAudio.__fifo_pcm__ = fifoPcm
+
+    def testCopyIsOnlyDecodedWhenThereAreNoNamedPipes(self):
+        copyPcm = tracklint.BrokenFlacAudio.__dict__['__copy_pcm__']
+        copies = []
+        def countingCopyPcm(track):
+            copies.append(track.filename)
+            return copyPcm(track)
+        tracklint.BrokenFlacAudio.__copy_pcm__ = countingCopyPcm
+        try:
+            self.assertDecodesLikeTheCleanFlac(
+                self.writeBrokenFlac(self.getId3v2Header(), self.getId3v1Trailer())
+            )
+        finally:
+            tracklint.BrokenFlacAudio.__copy_pcm__ = copyPcm
+        if hasattr(os, 'mkfifo'):
+            self.assertEquals([], copies)
+        else:
+            self.assertEquals(1, len(copies))
+
+if __name__ == '__main__':
+    unittest.main()
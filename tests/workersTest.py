@@ -0,0 +1,98 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from dialogs.threads.workers import WorkerPool, reportProgress
+
+def succeed():
+    pass
+
+def fail():
+    raise ValueError('Bad input')
+
+def die():
+    os._exit(3)
+
+def reportHalfwayUntilExists(path):
+    reportProgress(0.5)
+    while not os.path.exists(path):
+        time.sleep(0.05)
+
+class WorkerPoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = WorkerPool(2)
+
+    def tearDown(self):
+        self.pool.terminate()
+        self.pool.close()
+
+    def waitForAll(self, taskIds):
+        """
+        Wait until every one of taskIds has been reported by wait().
+
+        @rtype: dict
+        @return: Task ids mapped to (status, details) tuples
+
+        """
+        results = {}
+        deadline = time.time() + 30
+        while len(results) < len(taskIds) and time.time() < deadline:
+            for taskId, status, details in self.pool.wait(0.5):
+                results[taskId] = (status, details)
+        return results
+
+    def testWaitReportsFinishedTasksAsDone(self):
+        taskIds = [self.pool.submit(succeed, []) for i in range(2)]
+        results = self.waitForAll(taskIds)
+        for taskId in taskIds:
+            self.assertEquals(('done', None), results[taskId])
+        self.assertEquals(2, self.pool.getIdleCount())
+
+    def testWaitReportsTasksWhichRaiseAsFailedWithTheTraceback(self):
+        taskId = self.pool.submit(fail, [])
+        status, details = self.waitForAll([taskId])[taskId]
+        self.assertEquals('failed', status)
+        self.assertTrue('ValueError: Bad input' in details)
+
+        # The worker is kept for the next task
+        taskId = self.pool.submit(succeed, [])
+        self.assertEquals(('done', None), self.waitForAll([taskId])[taskId])
+        self.assertEquals(1, len(self.pool.workers))
+
+    def testWaitReportsTasksWhoseWorkerDiesAsFailed(self):
+        taskId = self.pool.submit(die, [])
+        status, details = self.waitForAll([taskId])[taskId]
+        self.assertEquals('failed', status)
+        self.assertEquals('Worker exited with code 3', details)
+
+        # The worker is replaced
+        self.assertEquals(0, len(self.pool.workers))
+        taskId = self.pool.submit(succeed, [])
+        self.assertEquals(('done', None), self.waitForAll([taskId])[taskId])
+
+    def testProgressReportedByARunningTaskIsKeptUntilItFinishes(self):
+        tempPath = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tempPath, 'finish')
+            taskId = self.pool.submit(reportHalfwayUntilExists, [path])
+            deadline = time.time() + 30
+            while self.pool.getProgress(taskId) is None \
+                    and time.time() < deadline:
+                self.assertEquals([], self.pool.wait(0.5))
+            self.assertEquals(0.5, self.pool.getProgress(taskId))
+            self.assertEquals(1, self.pool.getIdleCount())
+
+            open(path, 'w').close()
+            self.assertEquals(('done', None), self.waitForAll([taskId])[taskId])
+            self.assertEquals(None, self.pool.getProgress(taskId))
+        finally:
+            shutil.rmtree(tempPath)
+
+    def testReportProgressOutsideOfAWorkerDoesNothing(self):
+        reportProgress(0.5)
+        self.assertEquals({}, self.pool.progress)
+
+if __name__ == '__main__':
+    unittest.main()